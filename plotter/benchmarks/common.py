@@ -0,0 +1,118 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+from pkgs.common.constants import BenchmarkSettings
+
+
+def best_of(func, repeat=BenchmarkSettings.REPEAT):
+    """funcを繰り返し呼び、最短の実行時間 (s) を返す"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """サンプルの百分位点を {'p50': ...} の形で返す"""
+    if len(samples) == 0:
+        return {f"p{point}": None for point in points}
+    values = np.percentile(np.asarray(samples), points)
+    return {f"p{point}": float(value) for point, value in zip(points, values)}
+
+
+def synthetic_lines(n, seed=0):
+    """ESP32とRP2040の行をn組作る
+
+    Returns: (ESP32の行のリスト, RP2040の行のリスト)
+    """
+    rng = np.random.default_rng(seed)
+    disp = np.round(np.cumsum(rng.normal(0, 0.01, (n, 2)), axis=0), 2)
+    micros = 1_000_000 + np.arange(n, dtype=np.int64) * 10_000
+    counts = rng.integers(0, 4096, (n, 3))
+    esp = [f"{d1:.2f},{d2:.2f},{m}"
+           for (d1, d2), m in zip(disp.tolist(), micros.tolist())]
+    rp = [f"{d},{f1},{f2}" for d, f1, f2 in counts.tolist()]
+    return esp, rp
+
+
+def environment():
+    """結果に添える実行環境"""
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def save_results(name, results, path=None):
+    """結果をJSONに保存してパスを返す
+
+    Arguments:
+        name -- ベンチマークの名前
+        results -- {計測名: 秒} の辞書
+
+    Keyword Arguments:
+        path -- 保存先 (Noneなら RESULT_DIR/名前-日時.json) (default: {None})
+    """
+    if path is None:
+        os.makedirs(BenchmarkSettings.RESULT_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = f"{BenchmarkSettings.RESULT_DIR}/{name}-{stamp}.json"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'benchmark': name, 'environment': environment(),
+                   'results': results}, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def compare(results, baseline_path,
+            ratio=BenchmarkSettings.REGRESSION_RATIO):
+    """基準の結果と比べて、ratio倍を超えて遅くなった計測を返す
+
+    Arguments:
+        results -- {計測名: 秒} の辞書
+        baseline_path -- 基準の結果のJSONのパス
+
+    Keyword Arguments:
+        ratio -- 退行とみなす倍率
+                 (default: {BenchmarkSettings.REGRESSION_RATIO})
+
+    Returns: (計測名, 基準の秒, 今回の秒) のリスト
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for key, value in results.items():
+        before = baseline.get(key)
+        if not before or value is None:
+            continue
+        if value > before * ratio:
+            regressions.append((key, before, value))
+    return regressions
+
+
+def report(results, regressions):
+    """結果と退行を表示する"""
+    width = max((len(key) for key in results), default=0)
+    for key, value in results.items():
+        shown = '-' if value is None else f"{value * 1e3:12.3f} ms"
+        print(f"{key:<{width}}  {shown}")
+    for key, before, value in regressions:
+        print(f"退行: {key} {before * 1e3:.3f} ms -> {value * 1e3:.3f} ms "
+              f"({value / before:.2f}倍)")
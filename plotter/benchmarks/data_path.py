@@ -0,0 +1,249 @@
+"""データ経路のベンチマーク
+
+plotter/で python -m benchmarks.data_path として実行する。
+PlotArrayHandlerの各段とExecutor.updateの時間を行数ごとに計り、
+tester/t_original.pyのnp.appendによる追加を基準として並べる。
+結果はJSONに保存し、--baselineで前の結果と比べる。
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np  # noqa: E402
+
+from benchmarks.common import (best_of, compare, percentiles,  # noqa: E402
+                               report, save_results, synthetic_lines)
+from pkgs.common.constants import (ArithmeticConstants,  # noqa: E402
+                                   BenchmarkSettings, SaveSettings)
+from pkgs.util.plot_array_handler import PlotArrayHandler  # noqa: E402
+
+
+@contextlib.contextmanager
+def temporary_out_dir():
+    """保存先を一時ディレクトリに切り替える"""
+    original = SaveSettings.OUT_DIR
+    directory = tempfile.mkdtemp(prefix='kes-bench-')
+    SaveSettings.OUT_DIR = directory
+    try:
+        yield directory
+    finally:
+        SaveSettings.OUT_DIR = original
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def repeat_for(n):
+    """大きいサイズは1回だけ計る"""
+    return BenchmarkSettings.REPEAT if n <= 10**5 else 1
+
+
+def blocks_of(data, size=BenchmarkSettings.BLOCK_ROWS):
+    """行ブロックに分ける"""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class LegacyArrays:
+    """tester/t_original.pyのupdateと同じ、列ごとのnp.appendによる追加"""
+    def __init__(self, n=0):
+        """コンストラクタ (長さnまで埋めておく)"""
+        self.columns = [np.zeros(n) for _ in range(6)]
+        self.plot_columns = [np.zeros(n // 5) for _ in range(6)]
+        self.num = n
+
+    def append(self, row):
+        """1行追加する (5行ごとに表示用配列にも追加する)"""
+        self.columns = [np.append(column, value)
+                        for column, value in zip(self.columns, row)]
+        if self.num % 5 == 0:
+            self.plot_columns = [np.append(column, value) for column, value
+                                 in zip(self.plot_columns, row)]
+        self.num += 1
+
+
+def bench_handler(n, esp, rp, data):
+    """PlotArrayHandlerの各段を計る"""
+    results = {}
+    repeat = repeat_for(n)
+    handler = PlotArrayHandler()
+
+    def process_rows():
+        for line1, line2 in zip(esp, rp):
+            handler.process_data(line1, line2)
+
+    def process_blocks():
+        for i in range(0, n, BenchmarkSettings.BLOCK_ROWS):
+            stop = i + BenchmarkSettings.BLOCK_ROWS
+            handler.process_batch(esp[i:stop], rp[i:stop])
+
+    results[f'process_data/{n}'] = best_of(process_rows, repeat)
+    results[f'process_batch/{n}'] = best_of(process_blocks, repeat)
+
+    blocks = blocks_of(data)
+
+    def update_arrays():
+        handler.reset_data()
+        for block in blocks:
+            handler.update_arrays(block)
+
+    results[f'update_arrays/{n}'] = best_of(update_arrays, repeat)
+
+    def update_plts(scroll):
+        def run():
+            handler.reset_data()
+            handler.set_scroll_mode(scroll)
+            for block in blocks:
+                handler.update_arrays(block)
+                handler.update_plts(block)
+        return run
+
+    results[f'update_plts/{n}'] = best_of(update_plts(False), repeat)
+    results[f'update_plts_scroll/{n}'] = best_of(update_plts(True), repeat)
+    handler.set_scroll_mode(False)
+
+    with temporary_out_dir():
+        handler.reset_data()
+        handler.update_arrays(data)
+        results[f'save_to_csv/{n}'] = best_of(
+            lambda: handler.save_to_csv('bench'), repeat)
+
+        def autosave():
+            handler.reset_data()
+            handler.start_autosave('autosave')
+            for block in blocks:
+                handler.update_arrays(block)
+            handler.autosave.flush()  # 計測中に書き込みが追いついた状態
+            start = time.perf_counter()
+            handler.save_to_csv('autosave')
+            handler.stop_autosave()
+            return time.perf_counter() - start
+
+        results[f'save_to_csv_autosave/{n}'] = min(
+            autosave() for _ in range(repeat))
+    return results
+
+
+def bench_row_cost(n, data):
+    """長さnの配列に1行追加する時間を、新旧の方法で計る"""
+    probe = data[:BenchmarkSettings.PROBE_ROWS]
+    results = {}
+
+    legacy = LegacyArrays(n)
+    start = time.perf_counter()
+    for row in probe.tolist():
+        legacy.append(row)
+    per_row = (time.perf_counter() - start) / len(probe)
+    results[f'legacy_append_row/{n}'] = per_row
+    # 1行の時間は長さに比例するので、n行の合計はその半分のn倍
+    results[f'legacy_append_total_estimate/{n}'] = per_row * n / 2
+
+    handler = PlotArrayHandler()
+    handler.update_arrays(np.zeros((n, 6)))
+    start = time.perf_counter()
+    for row in probe:
+        handler.update_arrays(row)
+    results[f'update_arrays_row/{n}'] = \
+        (time.perf_counter() - start) / len(probe)
+    return results
+
+
+def bench_legacy_total(n, data):
+    """np.appendでn行を追加する合計時間を実際に計る (小さいサイズのみ)"""
+    def run():
+        legacy = LegacyArrays()
+        for row in data.tolist():
+            legacy.append(row)
+    return {f'legacy_append_total/{n}': best_of(run, repeat_for(n))}
+
+
+def bench_executor(n, esp, rp):
+    """再生源を読む取得スレッドからExecutor.updateで取り込む時間を計る"""
+    from PyQt6.QtWidgets import QApplication
+    from pkgs.common.executor import Executor
+    from pkgs.common.constants import ReplaySettings
+    from pkgs.util.replay import ReplaySource
+
+    app = QApplication.instance() or QApplication([])  # noqa: F841
+    period = ArithmeticConstants.MICRO * 10_000
+    events = [[(0.0, ReplaySettings.FIRST_LINE)]
+              + [(i * period, line) for i, line in enumerate(lines)]
+              for lines in (esp, rp)]
+    source = ReplaySource(events, speed=None, name='bench')
+    target = min(n, ArithmeticConstants.DATA_LENGTH - 1)
+
+    with temporary_out_dir():
+        executor = Executor(sm1=source.managers()[0],
+                            sm2=source.managers()[1])
+        durations = []
+        executor.plot_start()
+        started = time.perf_counter()
+        try:
+            while len(executor.handler.data_buffer) < target:
+                worker = executor.session.worker
+                if worker is None or (
+                        source.finished and worker.rows.empty()
+                        and time.perf_counter() - started > 60):
+                    break
+                start = time.perf_counter()
+                executor.update()
+                durations.append(time.perf_counter() - start)
+                time.sleep(0.001)  # 取得スレッドに譲る
+            elapsed = time.perf_counter() - started
+        finally:
+            # 書き込みスレッドとポートの監視も止め、サイズごとに残さない
+            executor.exit()
+
+    results = {
+        f'executor_update_total/{n}': float(np.sum(durations)),
+        f'executor_wall/{n}': elapsed,
+    }
+    for key, value in percentiles(durations).items():
+        results[f'executor_update_{key}/{n}'] = value
+    return results
+
+
+def main():
+    """ベンチマークを実行して結果を保存する"""
+    parser = argparse.ArgumentParser(description='データ経路のベンチマーク')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help=f'計る行数 (default: {BenchmarkSettings.SIZES})')
+    parser.add_argument('--quick', action='store_true',
+                        help=f'{BenchmarkSettings.QUICK_SIZES}行だけ計る')
+    parser.add_argument('--skip-executor', action='store_true',
+                        help='Executor.updateを計らない')
+    parser.add_argument('--baseline', help='比べる前回の結果のJSON')
+    parser.add_argument('--ratio', type=float,
+                        default=BenchmarkSettings.REGRESSION_RATIO,
+                        help='退行とみなす倍率')
+    parser.add_argument('--output', help='結果のJSONの保存先')
+    args = parser.parse_args()
+
+    sizes = args.sizes or (BenchmarkSettings.QUICK_SIZES if args.quick
+                           else BenchmarkSettings.SIZES)
+    results = {}
+    for n in sizes:
+        print(f"{n}行を計っています...", file=sys.stderr)
+        esp, rp = synthetic_lines(n)
+        data, _ = PlotArrayHandler.process_batch(esp, rp)
+        data[:, 0] -= data[0, 0]
+        results.update(bench_handler(n, esp, rp, data))
+        results.update(bench_row_cost(n, data))
+        if n <= 10**4:
+            results.update(bench_legacy_total(n, data))
+        if not args.skip_executor:
+            results.update(bench_executor(n, esp, rp))
+
+    path = save_results('data_path', results, args.output)
+    regressions = compare(results, args.baseline, args.ratio) \
+        if args.baseline else []
+    report(results, regressions)
+    print(f"結果を{path}に保存しました")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""MultiAxisGraphWidgetの描画のベンチマーク
+
+plotter/で python -m benchmarks.render として実行する。
+Qtのoffscreenプラットフォームでウィジェットを作り、点数を増やしながら
+合成データを描画して、1フレームあたりの間引き、curve.setData、
+ViewBoxの位置合わせ (sigRangeChangedからのsetGeometry) と
+再描画の時間の百分位点を求める。
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np  # noqa: E402
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+from benchmarks.common import (compare, percentiles, report,  # noqa: E402
+                               save_results)
+from pkgs.common.constants import BenchmarkSettings, RangeValues  # noqa: E402
+from pkgs.gui.multi_axis_graph import MultiAxisGraphWidget  # noqa: E402
+
+STAGES = ('decimate', 'set_data', 'geometry', 'paint', 'frame')
+
+
+def synthetic_columns(n, seed=0):
+    """10 ms間隔のn点の列 (t, y1, y2, y3, y4, y5) を作る"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) * 0.01
+    forces = 1.5 + 0.5 * np.sin(t[None, :] / 7) + rng.normal(0, 0.02, (2, n))
+    disps = np.cumsum(rng.normal(0, 0.01, (2, n)), axis=1)
+    sensor = 1.0 + rng.normal(0, 0.05, n)
+    return np.vstack((t, forces, disps, sensor))
+
+
+def sync_geometry(widget):
+    """各ViewBoxのsigRangeChangedを発行し、位置合わせの処理を走らせる"""
+    for view_box in widget.view_boxes:
+        view_box.sigRangeChanged.emit(
+            view_box, view_box.viewRange(), [True, True])
+
+
+def bench_frames(widget, columns, mode, frames):
+    """1つの点数で指定のフレーム数を描画し、段ごとの時間を集める
+
+    Arguments:
+        widget -- MultiAxisGraphWidgetオブジェクト
+        columns -- 列ごとの配列
+        mode -- 'full' (全体を表示) または 'scroll' (直近を表示)
+        frames -- フレーム数
+
+    Returns: {段: 時間のリスト}
+    """
+    app = QApplication.instance()
+    t = columns[0]
+    n = columns.shape[1]
+    if mode == 'scroll':
+        widget.set_scroll_window(RangeValues.SCROLL_WINDOW)
+    else:
+        widget.set_scroll_window(None)
+        widget.plotItem.setXRange(0, t[-1], padding=0)
+    samples = {stage: [] for stage in STAGES}
+    for frame in range(frames):
+        # スクロール表示では1フレームごとに新しい点が届いたことにする
+        end = n if mode == 'full' else n - (frames - 1 - frame) * max(
+            n // (frames * 10), 1)
+        view = columns[:, :max(end, 2)]
+
+        start = time.perf_counter()
+        widget.set_data(view)
+        refreshed = time.perf_counter()
+        sync_geometry(widget)
+        synced = time.perf_counter()
+        widget.viewport().repaint()
+        painted = time.perf_counter()
+        app.processEvents()
+
+        samples['decimate'].append(widget.stage_times['decimate'])
+        samples['set_data'].append(widget.stage_times['set_data'])
+        samples['geometry'].append(synced - refreshed)
+        samples['paint'].append(painted - synced)
+        samples['frame'].append(painted - start)
+    return samples
+
+
+def main():
+    """ベンチマークを実行して結果を保存する"""
+    parser = argparse.ArgumentParser(description='描画のベンチマーク')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=BenchmarkSettings.RENDER_SIZES,
+                        help='描画する点数')
+    parser.add_argument('--frames', type=int,
+                        default=BenchmarkSettings.RENDER_FRAMES,
+                        help='1つの点数で描画するフレーム数')
+    parser.add_argument('--baseline', help='比べる前回の結果のJSON')
+    parser.add_argument('--ratio', type=float,
+                        default=BenchmarkSettings.REGRESSION_RATIO,
+                        help='退行とみなす倍率')
+    parser.add_argument('--output', help='結果のJSONの保存先')
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)  # noqa: F841
+    widget = MultiAxisGraphWidget()
+    widget.resize(*BenchmarkSettings.RENDER_WINDOW)
+    widget.setVisible(True)
+    app.processEvents()
+
+    results = {}
+    for n in args.sizes:
+        print(f"{n}点を描画しています...", file=sys.stderr)
+        columns = synthetic_columns(n)
+        for mode in ('full', 'scroll'):
+            samples = bench_frames(widget, columns, mode, args.frames)
+            for stage in STAGES:
+                for key, value in percentiles(samples[stage]).items():
+                    results[f'{mode}/{stage}_{key}/{n}'] = value
+    widget.close()
+
+    path = save_results('render', results, args.output)
+    regressions = compare(results, args.baseline, args.ratio) \
+        if args.baseline else []
+    report(results, regressions)
+    print(f"結果を{path}に保存しました")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import datetime as dt
+import logging
+import sys
+
+from pkgs.common.constants import Formats
+from pkgs.common.headless_executor import HeadlessExecutor
+from pkgs.util.replay import ReplaySource
+from pkgs.util.serial_manager import SerialManager, SerialManagerError
+from pkgs.util.program import ProgramError, load_program
+from pkgs.util.trigger import TriggerError, parse_trigger
+
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(
+        description='KES-F System (ウィンドウを使わない記録)')
+    parser.add_argument('--esp32', metavar='PORT',
+                        help='ESP32 Dev ModuleのCOMポート')
+    parser.add_argument('--rp2040', metavar='PORT',
+                        help='RP2040 XiaoのCOMポート')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='ポートの代わりにCSVまたはジャーナルを再生する')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='再生の速さ (0なら最高速) (default: 1.0)')
+    parser.add_argument('--duration', type=float,
+                        help='計測する時間 (s) (default: Ctrl+Cまで)')
+    parser.add_argument('--max-rows', type=int,
+                        help='記録する行数の上限 (default: スプールでは'
+                             '無制限、それ以外はDATA_LENGTH)')
+    parser.add_argument('--output', metavar='NAME',
+                        default=dt.datetime.now().strftime(Formats.DATE_FMT),
+                        help='out/以下に保存するファイル名 (拡張子なし)')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='pyserial-asyncioで各ポートを並行に読む')
+    parser.add_argument('--spool', action='store_true',
+                        help='計測値をout/以下のスプールファイルに持つ')
+    parser.add_argument('--compact', action='store_true',
+                        help='計測値をメモリ上に生の値の小さい型で持つ')
+    parser.add_argument('--trigger', action='append', default=[],
+                        metavar='SPEC',
+                        help='モータを自動で止める条件 (種類:列:値[:モータ]、'
+                             '例: above:Force:2.5, drop:Force:30, '
+                             'above:Disp1:5:1)')
+    parser.add_argument('--program', metavar='PATH',
+                        help='計測の開始とともに実行する負荷プログラム (JSON)、'
+                             '終えたら計測を止める')
+    args = parser.parse_args(argv[1:])
+    if not args.replay and not (args.esp32 and args.rp2040):
+        parser.error('--esp32と--rp2040、または--replayを指定してください')
+    try:
+        args.trigger = [parse_trigger(spec) for spec in args.trigger]
+        if args.program:
+            args.program = load_program(args.program)
+    except (TriggerError, ProgramError) as e:
+        parser.error(str(e))
+    return args
+
+
+def main():
+    """メイン関数"""
+    args = parse_args(sys.argv)
+    should_stop = None
+    if args.replay:
+        source = ReplaySource.from_file(args.replay, args.speed or None)
+        sm1, sm2 = source.managers()
+        should_stop = lambda: source.finished  # noqa: E731
+    else:
+        sm1, sm2 = SerialManager(), SerialManager()
+        try:
+            sm1.open_port(args.esp32)
+            sm2.open_port(args.rp2040)
+        except SerialManagerError as e:
+            logger.error(str(e))
+            sys.exit(1)
+    executor = HeadlessExecutor(sm1, sm2, use_asyncio=args.asyncio,
+                                use_spool=args.spool,
+                                use_compact=args.compact,
+                                max_rows=args.max_rows,
+                                triggers=args.trigger,
+                                program=args.program)
+    try:
+        executor.run(args.output, args.duration, should_stop)
+    finally:
+        for sm in (sm1, sm2):
+            try:
+                sm.close_port()
+            except SerialManagerError as e:
+                logger.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
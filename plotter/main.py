@@ -1,14 +1,100 @@
+import argparse
 import sys
-from PyQt6.QtWidgets import QApplication
 
-from pkgs.common.executor import Executor
+from pkgs.util.startup import StartupProfiler, preload
+
+
+def parse_args(argv):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description='KES-F System')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='pyserial-asyncioで各ポートを並行に読む')
+    parser.add_argument('--spool', action='store_true',
+                        help='計測値をout/以下のスプールファイルに持つ')
+    parser.add_argument('--compact', action='store_true',
+                        help='計測値をメモリ上に生の値の小さい型で持つ')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='ポートの代わりにCSVまたはジャーナルを再生する')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='再生の速さ (0なら最高速) (default: 1.0)')
+    parser.add_argument('--port', action='append', default=[],
+                        metavar='PATH',
+                        help='ポートの一覧に加えるポート (仮想デバイスなど)')
+    parser.add_argument('--trigger', action='append', default=[],
+                        metavar='SPEC',
+                        help='モータを自動で止める条件 (種類:列:値[:モータ]、'
+                             '例: above:Force:2.5, drop:Force:30, '
+                             'above:Disp1:5:1)')
+    parser.add_argument('--program', metavar='PATH',
+                        help='計測の開始とともに実行する負荷プログラム (JSON)')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='最初の描画までの時間の内訳を表示する')
+    args, _ = parser.parse_known_args(argv[1:])  # 残りはQtに渡す
+    from pkgs.util.program import ProgramError, load_program
+    from pkgs.util.trigger import TriggerError, parse_trigger
+    try:
+        args.trigger = [parse_trigger(spec) for spec in args.trigger]
+        if args.program:
+            args.program = load_program(args.program)
+    except (TriggerError, ProgramError) as e:
+        parser.error(str(e))
+    return args
 
 
 def main():
-    """メイン関数"""
+    """メイン関数
+
+    最初の描画に要らないモジュールは、使うときか描画の後に
+    別スレッドで読み込む。
+    """
+    profiler = StartupProfiler()
+    args = parse_args(sys.argv)
+    from PyQt6.QtWidgets import QApplication
+    profiler.mark('PyQt6の読み込み')
     app = QApplication(sys.argv)
-    executor = Executor()
+    profiler.mark('QApplicationの生成')
+    from pkgs.common.executor import Executor
+    from pkgs.gui.paint_watcher import PaintWatcher
+    profiler.mark('モジュールの読み込み')
+    sm1 = sm2 = None
+    if args.replay:
+        from pkgs.util.replay import ReplaySource
+        source = ReplaySource.from_file(args.replay, args.speed or None)
+        sm1, sm2 = source.managers()
+        profiler.mark('再生する記録の読み込み')
+    executor = Executor(use_asyncio=args.asyncio, use_spool=args.spool,
+                        use_compact=args.compact, sm1=sm1, sm2=sm2,
+                        extra_ports=args.port, triggers=args.trigger,
+                        program=args.program)
+    profiler.mark('ウィンドウの構築')
     executor.window.show()
+    profiler.mark('ウィンドウの表示')
+
+    scanner = executor.window.port_watcher
+    state = {'painted': False, 'scanned': False}
+
+    def on_ports_scanned(*_):
+        if state['scanned']:
+            return
+        state['scanned'] = True
+        profiler.note('ポートの検索', scanner.elapsed)
+        if args.profile_startup and state['painted']:
+            print(f"ポートの検索 (別スレッド、描画の後に完了): "
+                  f"{scanner.elapsed * 1e3:.1f} ms", flush=True)
+
+    def on_first_paint():
+        profiler.mark('最初の描画')
+        if scanner.elapsed is not None:  # シグナルより先に終わっていた
+            on_ports_scanned()
+        state['painted'] = True
+        preload(['pandas'])  # 保存で使う
+        if args.profile_startup:
+            print(profiler.format(), flush=True)
+
+    scanner.changed.connect(on_ports_scanned)
+    scanner.failed.connect(on_ports_scanned)
+    watcher = PaintWatcher(executor.window.plot_area.viewport())
+    watcher.painted.connect(on_first_paint)
     sys.exit(app.exec())
 
 
@@ -0,0 +1,438 @@
+import datetime
+import glob
+import logging
+import shutil
+import time
+
+import numpy as np
+
+from pkgs.common.constants import (Formats, JournalSettings, MotorSettings,
+                                   ProgramSettings, SaveSettings,
+                                   StatsSettings)
+from pkgs.util.serial_manager import SerialManager, SerialManagerError
+from pkgs.util.acquisition_worker import AcquisitionWorker
+from pkgs.util.event_log import MotorEventLog
+from pkgs.util.journal import JournalWriter, find_unrecovered
+from pkgs.util.latency_stats import LatencyStats
+from pkgs.util.motor_controller import MotorController
+from pkgs.util.motor_writer import MotorWriterError
+from pkgs.util.plot_array_handler import (PlotArrayHandler,
+                                          PlotArrayHandlerError)
+from pkgs.util.program import REVERSE, ProgramRunner, StepRecord
+from pkgs.util.trigger import STOP_COMMANDS, TriggerEngine, TriggerEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+def log_message(message, level):
+    """メッセージをログに記録する (AcquisitionSessionの既定の知らせ先)"""
+    logger.log(level, message)
+
+
+class AcquisitionSession:
+    """GUIとヘッドレスで共通の計測の本体
+
+    取得スレッドの起動と停止、取り込み (micros()の周回の補正、初期時刻、
+    行数の上限、コマンドの時間軸の基準)、自動保存・スプール・ジャーナル、
+    統計やコマンドとプログラムの記録の書き出しを受け持つ。Qtに依存せず、
+    知らせることはすべてnotify(message, level)に、記録した行ブロックは
+    on_data(rows)に渡す。
+    """
+    def __init__(self, sm1: SerialManager, sm2: SerialManager,
+                 mc: MotorController, handler: PlotArrayHandler,
+                 use_asyncio=False, max_rows=None, triggers=(),
+                 program=None, metadata=None, notify=log_message,
+                 on_data=None):
+        """コンストラクタ
+
+        Arguments:
+            sm1 -- ESP32側のSerialManagerオブジェクト
+            sm2 -- RP2040側のSerialManagerオブジェクト
+            mc -- モータを動かすMotorControllerオブジェクト
+            handler -- 計測値を持つPlotArrayHandlerオブジェクト
+
+        Keyword Arguments:
+            use_asyncio -- asyncioの取得エンジンを使う (default: {False})
+            max_rows -- 記録する行数の上限 (Noneなら無制限)
+                        (default: {None})
+            triggers -- モータを自動で止める条件 (Triggerのリスト)
+                        (default: {()})
+            program -- 計測の開始とともに実行する負荷プログラム
+                       (default: {None})
+            metadata -- セッションアーカイブのメタデータに加える値
+                        (default: {None})
+            notify -- メッセージとログのレベルを受け取る関数
+                      (default: {log_message})
+            on_data -- 記録した行ブロックを受け取る関数 (停止時に
+                       取り込む残りの行も渡す) (default: {None})
+        """
+        self.sm1 = sm1
+        self.sm2 = sm2
+        self.mc = mc
+        self.handler = handler
+        self.use_asyncio = use_asyncio
+        self.max_rows = max_rows
+        self.metadata = dict(metadata or {})
+        self.notify = notify
+        self.on_data = on_data
+        self.stats = LatencyStats()
+        self.events = MotorEventLog()
+        self.trigger = (TriggerEngine(triggers, mc, self.stats)
+                        if triggers else None)
+        self.program = program
+        self.runner: ProgramRunner = None
+        self.program_done = False
+        self.worker: AcquisitionWorker = None
+        self.journal: JournalWriter = None
+        self.file_name = None
+        self.run_name = None  # 計測ごとに重ならない名前
+        self.started_at = None
+        self.rows = 0  # 記録した行数
+        self.t0 = None
+        self.dropped = 0
+        self.capped = False  # 行数の上限に達して止めにかかったか
+
+    @property
+    def running(self):
+        """取得スレッドが動いているか"""
+        return self.worker is not None
+
+    def full(self):
+        """行数の上限に達したか"""
+        return self.max_rows is not None and self.rows >= self.max_rows
+
+    def start(self, file_name):
+        """取得スレッドと自動保存、ジャーナル、負荷プログラムを始める
+
+        デバイスへのPLOT_STARTは呼び出し側が送っておく。
+
+        Arguments:
+            file_name -- 保存するファイル名 (out/以下、拡張子なし)
+        """
+        self.file_name = file_name
+        self.run_name = self.unique_run_name(file_name)
+        self.rows = 0
+        self.t0 = None
+        self.dropped = 0
+        self.capped = False
+        self.stats.reset()
+        self.events.reset()
+        if self.trigger is not None:
+            self.trigger.reset()
+        self.started_at = time.monotonic()
+        if self.handler.spool:
+            try:
+                self.handler.start_spool(self.run_name)
+            except PlotArrayHandlerError as e:
+                self.notify(f"スプールファイルを作れませんでした: {e}",
+                            logging.WARNING)
+        try:
+            self.handler.start_autosave(self.run_name,
+                                        self.session_metadata(file_name))
+        except PlotArrayHandlerError as e:
+            self.notify(f"自動保存を開始できませんでした: {e}",
+                        logging.WARNING)
+        self.start_journal(file_name)
+        if self.program is not None:
+            self.runner = ProgramRunner(self.program, self.mc, self.stats)
+            self.program_done = False
+        worker_class = AcquisitionWorker
+        if self.use_asyncio:
+            # serial_asyncioを起動時に読み込まないよう、使うときに読み込む
+            from pkgs.util.async_acquisition import AsyncAcquisitionEngine
+            worker_class = AsyncAcquisitionEngine
+        self.worker = worker_class(
+            self.sm1, self.sm2, self.handler.process_batch,
+            journal=self.journal, stats=self.stats, trigger=self.trigger,
+            program=self.runner)
+        self.worker.start()
+        if self.runner is not None:
+            self.runner.start()
+
+    @staticmethod
+    def unique_run_name(file_name):
+        """計測ごとに重ならない名前 (ファイル名.日時[-番号]) を返す
+
+        計測中に書くファイルはこの名前にし、同じファイル名で計測を
+        やり直しても前の計測のファイルを消さないようにする。
+        """
+        stamp = datetime.datetime.now().strftime(Formats.RUN_FMT)
+        base = f"{file_name}.{stamp}"
+        name, n = base, 1
+        while glob.glob(
+                glob.escape(f"{SaveSettings.OUT_DIR}/{name}") + '.*'):
+            n += 1
+            name = f"{base}-{n}"
+        return name
+
+    def run_path(self, suffix):
+        """計測ごとに重ならない名前でout/以下に書くファイルのパス"""
+        return f"{SaveSettings.OUT_DIR}/{self.run_name}{suffix}"
+
+    def start_journal(self, file_name):
+        """受信した行をout/以下のジャーナルに記録し始める
+
+        ジャーナルは計測ごとに重ならない名前で作り、前の計測のものを
+        消さない。同じファイル名で異常終了したまま復元していない
+        ジャーナルがあれば、復元のしかたを知らせる。
+        """
+        for path in find_unrecovered(file_name):
+            self.notify(f"復元していないジャーナルがあります: {path} "
+                        f"(python -m pkgs.util.journal {path} で復元できます)",
+                        logging.WARNING)
+        path = self.run_path(JournalSettings.SUFFIX)
+        try:
+            self.journal = JournalWriter(path)
+        except OSError as e:
+            self.notify(f"ジャーナルを作れませんでした: {e}", logging.WARNING)
+            return
+        self.journal.start()
+
+    def stop(self):
+        """取得を止め、残りの行を取り込んで記録を書き出す
+
+        デバイスへのPLOT_STOPは呼び出し側が送る。
+        """
+        self.stop_program()
+        worker, self.worker = self.worker, None
+        if worker is not None:
+            worker.stop()
+            self.ingest(worker)  # キューに残った行を取り込む
+            self.report_alignment(worker)
+            self.dump_stats(worker)
+            self.save_events()
+        runner, self.runner = self.runner, None
+        if runner is not None:
+            self.save_program_log(runner)
+        journal, self.journal = self.journal, None
+        if journal is not None:
+            try:
+                journal.close()
+            except OSError as e:
+                self.notify(f"ジャーナルの書き込みに失敗しました: {e}",
+                            logging.ERROR)
+        try:
+            self.handler.stop_autosave()
+            self.handler.sync_spool()
+        except PlotArrayHandlerError as e:
+            self.notify(str(e), logging.ERROR)
+
+    def stop_program(self):
+        """負荷プログラムを止める (途中ならモータを止める)
+
+        送信を止めたデバイスは読んだ1バイト目を捨てるので、モータの
+        停止がPLOT_STOPより先に届くよう、呼び出し側はPLOT_STOPの前に
+        これを呼ぶ。
+        """
+        if self.runner is not None:
+            self.runner.stop()
+
+    def ingest(self, worker: AcquisitionWorker = None):
+        """取得スレッドのキューに溜まった行を取り込む
+
+        Keyword Arguments:
+            worker -- 取り込む取得スレッド (Noneなら動いているもの)
+                      (default: {None})
+
+        Returns: 記録した行ブロック (計測開始からの時刻、取り込む行が
+                 無ければNone)
+        """
+        worker = worker or self.worker
+        for message in worker.drain_errors():
+            self.notify(message, logging.ERROR)
+        if self.trigger is not None:
+            for event in self.trigger.drain():
+                self.report_trigger(event)
+        if self.runner is not None:
+            self.drain_program(self.runner)
+
+        dropped = worker.aligner.dropped_count
+        if dropped > self.dropped:
+            self.dropped = dropped
+            self.notify(f"組にできない行を破棄しました (累計{dropped}行)",
+                        logging.WARNING)
+
+        batches = worker.drain()
+        if not batches:
+            return None
+        started = time.monotonic()
+        for received_at, _ in batches:
+            self.stats.record('queue', started - received_at)
+        data = np.vstack([rows for _, rows in batches])
+        self.handler.unwrap_time(data)
+
+        # 最初の行で初期時刻を格納
+        if self.t0 is None:
+            self.t0 = data[0, 0]
+        if self.max_rows is not None:
+            data = data[:max(self.max_rows - self.rows, 0)]
+        data[:, 0] -= self.t0
+        if len(data):
+            # 上限で切り詰めたときは、残した最後の行を含む行ブロックの
+            # 受信時刻を組にする
+            ends = np.cumsum([len(rows) for _, rows in batches])
+            received_at = batches[np.searchsorted(ends, len(data))][0]
+            self.events.set_reference(received_at, data[-1, 0],
+                                      self.rows + len(data))
+        stored = time.monotonic()
+        self.handler.update_arrays(data)
+        self.rows += len(data)
+        if self.on_data is not None:
+            self.on_data(data)
+        self.stats.record('store', time.monotonic() - stored)
+        if self.full() and not self.capped:
+            self.capped = True
+            self.stop_watched_motors()
+        return data
+
+    def stop_watched_motors(self):
+        """まだ働いていない条件が見張っているモータを止める
+
+        行数の上限で取得を止めると条件を評価しなくなるので、条件が
+        止めるはずだったモータをここで止めておく。
+        """
+        if self.trigger is None:
+            return
+        motors = sorted({motor for trigger in list(self.trigger.armed)
+                         for motor in trigger.motors})
+        for motor in motors:
+            try:
+                self.mc.send(STOP_COMMANDS[motor])
+            except (MotorWriterError, SerialManagerError) as e:
+                self.notify(f"モータ{motor}の停止を送れませんでした: {e}",
+                            logging.ERROR)
+        if motors:
+            self.notify(
+                "行数の上限で条件を評価できなくなるので、モータ"
+                f"{'と'.join(map(str, motors))}を止めました", logging.WARNING)
+
+    def drain_motor(self):
+        """送信を終えたモータのコマンドを記録し、エラーを知らせる"""
+        writer = self.mc.writer
+        if writer is None:
+            return
+        for command in writer.drain():
+            self.events.add(command)
+        for message in writer.drain_errors():
+            self.notify(message, logging.ERROR)
+
+    def save(self, file_name):
+        """計測値をCSVとセッションアーカイブに、コマンドの記録とともに保存する
+
+        Raises:
+            PlotArrayHandlerError: 計測値を保存できない
+        """
+        self.handler.save_to_csv(file_name)
+        self.handler.save_archive(file_name,
+                                  self.session_metadata(file_name))
+        self.save_events(file_name)
+
+    def save_events(self, file_name=None):
+        """モータのコマンドの記録をout/以下に書き出す
+
+        計測ごとに重ならない名前で書き出し、file_nameを渡せば保存先の
+        名前にコピーする。書き込みスレッドを使わないとき (その場で
+        書き込むとき) は記録するコマンドが無いので書き出さない。
+
+        Keyword Arguments:
+            file_name -- コピーする保存先のファイル名 (拡張子なし)
+                         (default: {None})
+        """
+        if self.mc.writer is None or self.run_name is None:
+            return
+        self.drain_motor()
+        path = self.run_path(MotorSettings.EVENT_SUFFIX)
+        try:
+            self.events.save_csv(path)
+            if file_name is not None:
+                shutil.copyfile(path, f"{SaveSettings.OUT_DIR}/{file_name}"
+                                      f"{MotorSettings.EVENT_SUFFIX}")
+        except OSError as e:
+            self.notify(f"コマンドの記録を保存できませんでした: {e}",
+                        logging.ERROR)
+
+    def session_metadata(self, file_name):
+        """セッションアーカイブのヘッダに書くメタデータ"""
+        metadata = {
+            'project': file_name,
+            'ports': {'ESP32': self.sm1.port, 'RP2040': self.sm2.port},
+        }
+        metadata.update(self.metadata)
+        return metadata
+
+    def dump_stats(self, worker: AcquisitionWorker):
+        """計測終了時に統計をout/以下に計測ごとの名前で書き出す"""
+        path = self.run_path(StatsSettings.SUFFIX)
+        aligner = worker.aligner
+        try:
+            self.stats.dump(path, {
+                'triggers': (self.trigger.summary()
+                             if self.trigger is not None else []),
+                'duration': time.monotonic() - self.started_at,
+                'rows': self.rows,
+                'dropped': {'ESP32': aligner.dropped[0],
+                            'RP2040': aligner.dropped[1],
+                            'duplicates': aligner.duplicates,
+                            'skipped': aligner.skipped},
+            })
+        except OSError as e:
+            self.notify(f"統計を書き出せませんでした: {e}", logging.WARNING)
+
+    def drain_program(self, runner: ProgramRunner):
+        """負荷プログラムの進み具合とエラーを知らせる"""
+        for record in runner.drain():
+            self.report_step(record)
+        for message in runner.drain_errors():
+            self.notify(f"負荷プログラムを中断しました: {message}",
+                        logging.ERROR)
+        if runner.finished and not self.program_done:
+            self.program_done = True
+            self.notify("負荷プログラムを終えました", logging.INFO)
+
+    def report_step(self, record: StepRecord):
+        """実行したステップを知らせる
+
+        反転の信号は取り込むスレッド (GUIならGUIスレッド) のここで送る。
+        """
+        step = record.step
+        if step.action == REVERSE:
+            getattr(self.mc, f"motor{step.motor}_reversed_signal").emit()
+        self.notify(
+            f"プログラム {record.number}: {step.describe()} "
+            f"(周回 {record.cycle}、遅れ {record.jitter * 1e3:.2f} ms)",
+            logging.INFO)
+
+    def save_program_log(self, runner: ProgramRunner):
+        """負荷プログラムの実行の記録をout/以下に計測ごとの名前で書き出す"""
+        self.drain_program(runner)
+        path = self.run_path(ProgramSettings.SUFFIX)
+        try:
+            runner.save_csv(path, self.events.sample_time)
+        except OSError as e:
+            self.notify(f"プログラムの記録を保存できませんでした: {e}",
+                        logging.ERROR)
+
+    def report_trigger(self, event: TriggerEvent):
+        """条件を満たしてモータを止めたことを知らせる"""
+        if event.error is not None:
+            self.notify(f"{event.spec}を満たしましたが、停止を送れません"
+                        f"でした: {event.error}", logging.ERROR)
+            return
+        latency = event.command_latency
+        written = ('' if latency is None
+                   else f"、書き込みまで {latency * 1e3:.1f} ms")
+        self.notify(
+            f"{event.spec}を満たしたので停止しました (値 {event.value:.4g}、"
+            f"検出まで {event.latency * 1e3:.1f} ms{written})",
+            logging.WARNING)
+
+    def report_alignment(self, worker: AcquisitionWorker):
+        """取得終了時に破棄した行数を報告する"""
+        aligner = worker.aligner
+        if aligner.dropped_count == 0 and aligner.skipped == 0:
+            return
+        self.notify(
+            f"破棄した行: ESP32 {aligner.dropped[0]}行, "
+            f"RP2040 {aligner.dropped[1]}行, 重複 {aligner.duplicates}行 "
+            f"(ESP32の欠落 {aligner.skipped}行)", logging.WARNING)
@@ -43,6 +43,163 @@ class ArithmeticConstants:
     """計算定数"""
     MICRO = 1e-6
     DATA_LENGTH = int(2**20)
+    ADC_VREF = 3.3  # RP2040のADC基準電圧 (V)
+    ADC_MAX = 4095  # 12ビットADCの最大値
+
+
+class CompactLayout:
+    """計測値を生の値で持つときの列ごとの型と換算
+
+    各列は (型, 係数, 除数) で、値 = 生の値 * 係数 / 除数 で換算する。
+    ADC値はprocess_batchと同じ順で計算するので、換算結果も一致する。
+    変位はESP32がSerial.print(float)で小数2桁に丸めて送るので、
+    0.01単位の整数で持つ (float32では2.00が2.0000000286...になる)。
+    """
+    DISP_DIVISOR = 100  # 変位の1カウント (1/100)
+    COLUMNS = (
+        ('<i8', ArithmeticConstants.MICRO, 1),  # Time (us)
+        ('<u2', ArithmeticConstants.ADC_VREF, ArithmeticConstants.ADC_MAX),
+        ('<u2', ArithmeticConstants.ADC_VREF, ArithmeticConstants.ADC_MAX),
+        ('<i4', 1, DISP_DIVISOR),  # Disp1
+        ('<i4', 1, DISP_DIVISOR),  # Disp2
+        ('<u2', ArithmeticConstants.ADC_VREF, ArithmeticConstants.ADC_MAX),
+    )
+
+
+class AcquisitionSettings:
+    """取得スレッドの設定"""
+    QUEUE_SIZE = 4096  # 取得スレッドからGUIへ渡す行ブロックの上限
+    PUT_TIMEOUT = 0.1  # キューが満杯のときに停止要求を確認する間隔 (s)
+    POLL_INTERVAL = 0.001  # どのポートにも届いていないときに待つ時間 (s)
+    DRAIN_INTERVAL = 10  # GUIがキューを取り出す間隔 (ms)
+    JOIN_TIMEOUT = 2.0  # 停止時にスレッドの終了を待つ時間 (s)
+    SMALL_BATCH = 32  # これ以下の行数は1組ずつ解析する (まとめる方が遅い)
+
+
+class MotorSettings:
+    """モータへのコマンドの送信の設定"""
+    QUEUE_SIZE = 256  # 送信待ちのコマンドの上限
+    DRAIN_INTERVAL = 50  # GUIが送信の結果を取り出す間隔 (ms)
+    EVENT_SUFFIX = '.events.csv'  # コマンドの記録の拡張子
+    REFERENCE_INTERVAL = 1.0  # 時間軸の基準を残す間隔 (s)
+    FLUSH_TIMEOUT = 1.0  # 計測の停止前に送信待ちのコマンドを待つ時間 (s)
+
+
+class TriggerSettings:
+    """しきい値による自動停止の設定"""
+    MIN_PEAK = 0.1  # ピークからの低下を見始めるピークの下限 (計測値の単位)
+    MOTORS = (1, 2)  # 止めるモータを書かなかったときに止めるモータ
+
+
+class ProgramSettings:
+    """負荷プログラムの実行の設定"""
+    SPIN_TIME = 0.002  # 時刻の直前にスリープをやめて待つ時間 (s)
+    POLL_INTERVAL = 0.05  # 条件を待つあいだに停止要求を確認する間隔 (s)
+    SUFFIX = '.program.csv'  # 実行の記録の拡張子
+
+
+class AlignmentSettings:
+    """2つのデバイスの行を組にする設定"""
+    SAMPLE_PERIOD = 0.01  # ESP32の送信周期 (s)
+    TOLERANCE = 0.005  # 組にする到着時刻の差の上限 (s)
+    OFFSET_GAIN = 0.05  # デバイス間の到着時刻差の追従の速さ
+    MAX_WAIT = 0.5  # 相手の行を待つ時間の上限 (s)
+    MAX_PENDING = 1024  # デバイスごとに溜めておく行の上限
+    MICROS_WRAP = 2**32  # micros()が一周する値
+
+
+class SaveSettings:
+    """保存の設定"""
+    OUT_DIR = 'out'  # 保存先のディレクトリ
+    CHUNK_ROWS = 4096  # 自動保存で1度に書き出す行数
+    SPOOL_ROWS = 2**20  # スプールファイルに最初に確保する行数
+    SPOOL_SYNC_INTERVAL = 1.0  # スプールファイルの行数を書き残す間隔 (s)
+    ARCHIVE_SUFFIX = '.kes'  # セッションアーカイブの拡張子
+    PARTIAL_SUFFIX = '.partial'  # 保存前の自動保存のファイルに付ける名前
+    ARCHIVE_CHUNK_ROWS = 2**16  # セッションアーカイブの1チャンクの行数
+    ARCHIVE_LEVEL = 6  # セッションアーカイブのzlibの圧縮レベル
+
+
+class JournalSettings:
+    """受信した行のジャーナルの設定"""
+    SUFFIX = '.journal'  # ジャーナルの拡張子
+    FSYNC_INTERVAL = 1.0  # ディスクへ同期する間隔 (s)
+
+
+class ReplaySettings:
+    """記録の再生の設定"""
+    MAX_SPEED_STEP = 0.1  # 最高速の再生で1回の読み取りで進める記録の時間 (s)
+    FIRST_LINE = '0,0,0'  # 取得スレッドが読み飛ばす1行目の代わり
+
+
+class SimulatorSettings:
+    """仮想デバイスの設定 (micon/のスケッチに合わせた値)"""
+    SAMPLE_RATE = 100  # 送信の頻度 (Hz) (スケッチのdelay(10))
+    STEP_DISP = 0.005  # モータの1ステップで進む変位 (mm)
+    STEP_PERIOD = 0.0045  # モータの1ステップの時間 (s)
+    FORCE_OFFSET = 600  # 無負荷の力のADCカウント
+    FORCE_GAIN = 400  # 変位1mmあたりの力のADCカウント
+    SENSOR_OFFSET = 1200  # センサ出力のADCカウント
+    NOISE = 3.0  # ADCカウントのノイズの標準偏差
+    STALL_TIME = 0.2  # 送信が止まる時間 (s)
+
+
+class BenchmarkSettings:
+    """ベンチマークの設定"""
+    SIZES = (10**3, 10**5, 2**20)  # 計る行数
+    QUICK_SIZES = (10**3, 10**4)  # --quickで計る行数
+    REPEAT = 3  # 繰り返して最良の値をとる回数
+    BLOCK_ROWS = 10  # 1回の取り込みの行数 (10 ms間隔で1 kHz相当)
+    PROBE_ROWS = 200  # 長さNでの1行あたりの時間を計る行数
+    RESULT_DIR = 'benchmarks/results'  # 結果のJSONの保存先
+    REGRESSION_RATIO = 1.25  # 基準よりこの倍率を超えて遅ければ退行
+    RENDER_SIZES = (10**3, 10**4, 10**5, 10**6, 2**20)  # 描画で計る点数
+    RENDER_FRAMES = 60  # 1つの点数で描画するフレーム数
+    RENDER_WINDOW = (1000, 560)  # 描画するウィジェットの大きさ (px)
+
+
+class StatsSettings:
+    """段ごとの所要時間の統計の設定"""
+    WINDOW = 1024  # 百分位点を求める直近のサンプル数
+    HISTOGRAM_BINS = 32  # 2のべき乗 (us) ごとのヒストグラムのビン数
+    UPDATE_INTERVAL = 1000  # 表示を更新する間隔 (ms)
+    SUFFIX = '.stats.json'  # 計測終了時に書き出すファイルの拡張子
+
+
+class DeviceIds:
+    """ポートのVID/PIDからデバイスを見分ける表"""
+    ESP32 = (
+        (0x10C4, 0xEA60),  # CP210x (ESP32 Dev Moduleの多く)
+        (0x1A86, 0x7523),  # CH340
+        (0x1A86, 0x55D4),  # CH9102
+        (0x0403, 0x6001),  # FT232R
+    )
+    RP2040 = (
+        (0x2886, 0x0042),  # Seeed XIAO RP2040 (Arduino)
+        (0x2E8A, 0x000A),  # Raspberry Pi RP2040 (Pico SDK)
+        (0x2E8A, 0x00C0),  # Raspberry Pi RP2040 (arduino-pico)
+    )
+
+
+class HotplugSettings:
+    """ポートの抜き差しの監視の設定"""
+    POLL_INTERVAL = 2.0  # ポートの一覧を調べ直す間隔 (s)
+
+
+class HeadlessSettings:
+    """ヘッドレスの取得の設定"""
+    REPORT_INTERVAL = 1.0  # 処理の統計を表示する間隔 (s)
+    # 表示する段
+    STAGES = ('read', 'parse', 'trigger', 'trigger_command', 'program',
+              'queue', 'store')
+
+
+class RenderSettings:
+    """描画ループの設定"""
+    TARGET_FPS = 30  # 目標フレームレート
+    MIN_FPS = 5  # 描画が重いときに下げる下限
+    BUDGET_RATIO = 0.5  # 1フレームの間隔のうち描画に使ってよい割合
+    COST_GAIN = 0.2  # 描画時間の移動平均の追従の速さ
 
 
 class RangeValues:
@@ -51,6 +208,12 @@ class RangeValues:
     Y_RANGE1 = (-0.1, 3.3)
     Y_RANGE2 = (-10, 10)
     RIGHT_AXIS_RANGE = (-10, 10)
+    SCROLL_WINDOW = 50  # スクロール表示で見せる直近の時間 (s)
+    # スクロール表示でSCROLL_WINDOW秒を欠けずに見せる行の頻度の上限 (Hz)
+    # (デバイスの100 Hzに対し、速めた再生にも余裕を持たせる。超えると
+    # 表示される時間がSCROLL_WINDOWより短くなる)
+    SCROLL_MAX_RATE = 2000
+    SCROLL_CAPACITY = SCROLL_WINDOW * SCROLL_MAX_RATE  # 保持する行数
 
 
 class ColourValues:
@@ -67,6 +230,7 @@ class Formats(StrEnum):
     """フォーマット"""
     # テキスト
     DATE_FMT = '%Y-%m%d-%H%M-プロジェクト名'
+    RUN_FMT = '%Y%m%d-%H%M%S'  # 計測ごとのファイル名に付ける日時
 
 
 class DataProperties:
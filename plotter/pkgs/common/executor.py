@@ -1,14 +1,20 @@
 import logging
+import time
 
 from PyQt6.QtWidgets import QComboBox
 from PyQt6.QtCore import QTimer
 
-from pkgs.common.constants import Styles, Commands, ArithmeticConstants
+from pkgs.common.acquisition_session import AcquisitionSession
+from pkgs.common.constants import (Styles, Commands, ArithmeticConstants,
+                                   AcquisitionSettings, MotorSettings,
+                                   RangeValues, StatsSettings)
 from pkgs.util.serial_manager import SerialManager, SerialManagerError
 from pkgs.util.motor_controller import MotorController
+from pkgs.util.motor_writer import MotorCommandWriter, MotorWriterError
 from pkgs.util.plot_array_handler import (PlotArrayHandler,
                                           PlotArrayHandlerError)
 from pkgs.gui.main_window import Window
+from pkgs.gui.render_loop import RenderLoop
 
 
 # ロガーを設定
@@ -18,17 +24,63 @@ logger = logging.getLogger(__name__)
 
 
 class Executor:
-    def __init__(self):
-        self.sm1 = SerialManager()
-        self.sm2 = SerialManager()
-        self.mc = MotorController(self.sm1)
-        self.handler = PlotArrayHandler()
-        self.window = Window()
+    def __init__(self, use_asyncio=False, use_spool=False, use_compact=False,
+                 sm1: SerialManager = None, sm2: SerialManager = None,
+                 extra_ports=(), triggers=(), program=None):
+        """コンストラクタ
+
+        Keyword Arguments:
+            use_asyncio -- asyncioの取得エンジンを使う (default: {False})
+            use_spool -- 計測値をスプールファイルに持ち、データ長の
+                         上限を外す (default: {False})
+            use_compact -- 計測値をメモリ上に生の値の小さい型で持つ
+                           (default: {False})
+            sm1 -- ESP32側に使うSerialManager (再生源など)。
+                   渡したときはポートの選択を無効にする (default: {None})
+            sm2 -- RP2040側に使うSerialManager (default: {None})
+            extra_ports -- ポートの一覧に加えるポート名 (default: {()})
+            triggers -- モータを自動で止める条件 (Triggerのリスト)
+                        (default: {()})
+            program -- 計測の開始とともに実行する負荷プログラム
+                       (default: {None})
+        """
+        self.sm1 = sm1 or SerialManager()
+        self.sm2 = sm2 or SerialManager()
+        self.motor_writer = MotorCommandWriter(self.sm1)
+        self.motor_writer.start()
+        self.mc = MotorController(self.sm1, self.motor_writer)
+        self.handler = PlotArrayHandler(spool=use_spool,
+                                        compact=use_compact)
+        # スプールファイルに持つときはディスクの空きまで取り続ける
+        self.session = AcquisitionSession(
+            self.sm1, self.sm2, self.mc, self.handler,
+            use_asyncio=use_asyncio,
+            max_rows=(None if use_spool
+                      else ArithmeticConstants.DATA_LENGTH - 1),
+            triggers=triggers, program=program, notify=self.show_message,
+            on_data=self.on_data)
+        self.stats = self.session.stats
+        self.window = Window(extra_ports)
+        self.timer: QTimer = None
+        self.stats_timer = QTimer(self.window)
+        self.stats_timer.timeout.connect(self.show_stats)
+        self.motor_timer = QTimer(self.window)
+        self.motor_timer.timeout.connect(self.session.drain_motor)
+        self.motor_timer.start(MotorSettings.DRAIN_INTERVAL)
+        self.render_loop = RenderLoop(self.render, parent=self.window)
         self.setup_event_handlers()
+        self.window.port_watcher.changed.connect(self.on_ports_changed)
+        self.window.port_watcher.failed.connect(
+            lambda message: self.show_message(message, logging.ERROR))
+        if sm1 is not None or sm2 is not None:
+            self.window.combobox1.setEnabled(sm1 is None)
+            self.window.combobox2.setEnabled(sm2 is None)
+            self.enable_plot_start()
 
     def init_signal(self, sender: QComboBox, sm: SerialManager):
         def select_port_slot(index):
-            port_name = sender.itemText(index)
+            # 見分けたデバイスの項目は表示名とポート名が違う
+            port_name = sender.itemData(index) or sender.itemText(index)
             sm.close_port()
             sm.open_port(port_name)
             if sm.is_ready:
@@ -53,26 +105,57 @@ class Executor:
 
         # MotorControllerUI
         self.window.motor_ui.start1.set_callback(
-            self.mc.start_motor1)
+            self.motor_command(self.mc.start_motor1))
         self.window.motor_ui.stop1.set_callback(
-            self.mc.stop_motor1)
+            self.motor_command(self.mc.stop_motor1))
         self.window.motor_ui.reverse1.set_callback(
-            self.mc.reverse_motor1)
+            self.motor_command(self.mc.reverse_motor1))
         self.window.motor_ui.start2.set_callback(
-            self.mc.start_motor2)
+            self.motor_command(self.mc.start_motor2))
         self.window.motor_ui.stop2.set_callback(
-            self.mc.stop_motor2)
+            self.motor_command(self.mc.stop_motor2))
         self.window.motor_ui.reverse2.set_callback(
-            self.mc.reverse_motor2)
+            self.motor_command(self.mc.reverse_motor2))
 
         # ComboBoxes
         self.init_signal(self.window.combobox1, self.sm1)
         self.init_signal(self.window.combobox2, self.sm2)
 
+        # CheckBoxes
+        self.window.scroll_checkbox.toggled.connect(self.set_scroll_mode)
+
+    def motor_command(self, send):
+        """モータのボタンのコールバックを作る (送信のエラーを表示する)"""
+        def callback():
+            try:
+                send()
+            except (MotorWriterError, SerialManagerError) as e:
+                self.show_message(str(e), logging.ERROR)
+        return callback
+
+    def set_scroll_mode(self, enabled):
+        """直近SCROLL_WINDOW秒だけを表示するスクロール表示を切り替える"""
+        self.handler.set_scroll_mode(enabled)
+        plot_area = self.window.plot_area
+        plot_area.set_scroll_window(
+            RangeValues.SCROLL_WINDOW if enabled else None)
+        plot_area.set_data(self.handler.plot_columns())
+
+    def on_ports_changed(self, added, removed):
+        """ポートの抜き差しを知らせる"""
+        for info in removed:
+            if info.device in (self.sm1.port, self.sm2.port):
+                self.show_message(f"{info.device}が外されました",
+                                  logging.WARNING)
+        for info in added:
+            if info.kind is not None:
+                self.show_message(f"{info.label}を検出しました",
+                                  logging.INFO)
+
     def save(self):
         try:
             file_name = self.window.line_edit.text()
-            self.handler.save_to_csv(file_name)
+            self.session.save(file_name)
             self.show_message(f"{file_name}を保存しました", logging.INFO)
         except PlotArrayHandlerError as e:
             self.show_message(str(e), logging.ERROR)
@@ -87,18 +170,27 @@ class Executor:
             return
 
         self.window.plot_stop_button.setEnabled(True)
+        self.session.start(self.window.line_edit.text())
+        self.last_stats = self.session.started_at
+        self.last_rows = 0
         self.timer = QTimer(self.window)  # QTimerのインスタンスをここで初期化
         self.timer.timeout.connect(self.update)
-        self.num = 0
-        self.timer.start(0)
+        self.timer.start(AcquisitionSettings.DRAIN_INTERVAL)
+        self.render_loop.start()
+        self.stats_timer.start(StatsSettings.UPDATE_INTERVAL)
 
     def plot_stop(self):
+        # モータの停止はPLOT_STOPより先にデバイスへ届ける
+        self.session.stop_program()
+        if not self.motor_writer.flush():
+            self.show_message("モータのコマンドを送り終える前に停止します",
+                              logging.WARNING)
         try:
             self.sm1.write(Commands.PLOT_STOP)
         except SerialManagerError as e:
             self.show_message(str(e), logging.ERROR)
         finally:
-            self.timer.stop()
+            self.stop_acquisition()
             self.window.plot_stop_button.setEnabled(False)
             self.window.plot_stop_button.setStyleSheet("")
             self.window.plot_start_button.setEnabled(False)
@@ -115,56 +207,78 @@ class Executor:
         self.window.plot_reset_button.setEnabled(False)
         self.window.plot_reset_button.setStyleSheet("")
 
+    def stop_acquisition(self):
+        """取得スレッドとキューの取り出しを止める"""
+        if self.timer is not None:
+            self.timer.stop()
+        self.stats_timer.stop()
+        self.session.stop()
+        self.render_loop.stop()
+
     def update(self):
-        # 1行読み飛ばし
-        if self.num == 0:
-            try:
-                self.sm1.read_serial_data()
-                self.sm2.read_serial_data()
-                self.num += 1
-                return
-            except SerialManagerError as e:
-                self.show_message(str(e), logging.ERROR)
-                return
+        """タイマーから呼ばれ、取得スレッドの行を取り込む"""
+        if self.session.running:
+            self.ingest()
 
-        # 2回目以降の処理
-        try:
-            input1 = self.sm1.read_serial_data()
-            input2 = self.sm2.read_serial_data()
-        except SerialManagerError as e:
-            self.show_message(str(e), logging.ERROR)
+    def ingest(self):
+        """取得スレッドのキューに溜まった行を取り込む"""
+        started = time.monotonic()
+        if self.session.ingest() is None:
             return
+        self.stats.record('ingest', time.monotonic() - started)
 
-        try:
-            processed_data = self.handler.process_data(input1, input2)
-            if processed_data is None:
-                raise ValueError("データの処理に失敗しました")
-        except ValueError as e:
-            self.show_message(str(e), logging.ERROR)
-            return
+        # 停止ボタンと同じく止める (停止中の取り込みはここを通らない)
+        if self.session.full() and self.session.running:
+            self.plot_stop()
+            self.show_message("データ長がオーバーしています", logging.WARNING)
 
-        # 2回目で初期時刻を格納
-        if self.num == 1:
-            self.t0 = processed_data[0]
+    def on_data(self, data):
+        """記録した行ブロックを表示用配列に加える
 
-        # 2回目以降の処理のつづき
-        processed_data[0] -= self.t0
-        self.handler.update_arrays(processed_data)
+        描画は描画ループが自分のフレームレートで行う。
+        """
+        self.handler.update_plts(data)
+        self.render_loop.mark_dirty()
 
-        if self.num % 5 == 0:
-            plot_array = self.handler.update_plts(processed_data)
-            t_plt = plot_array[0]
-            y_plts = plot_array[1:]
-            for curve, y_plt in zip(self.window.plot_area.curves, y_plts):
-                curve.setData(t_plt, y_plt)
+    def render(self):
+        """描画ループから呼ばれ、1フレーム分を描画する
 
-        self.num += 1
+        描画時間を測れるよう、再描画まで同期して行う。
+        間引きは表示範囲と画面の幅に合わせてグラフ側で行う。
+        """
+        plot_area = self.window.plot_area
+        plot_area.set_data(self.handler.plot_columns())
+        painted = time.monotonic()
+        plot_area.viewport().repaint()
+        for stage, seconds in plot_area.stage_times.items():
+            self.stats.record(stage, seconds)
+        self.stats.record('paint', time.monotonic() - painted)
 
-        if self.num >= ArithmeticConstants.DATA_LENGTH:
-            self.timer.stop()
-            self.show_message("データ長がオーバーしています", logging.WARNING)
+    def show_stats(self):
+        """計測中の処理の統計をメッセージ欄の下に表示する
+
+        直近の取り込みの速さ、キューの深さ、段ごとのp50/p99 (ms) と
+        破棄した行数を示す。
+        """
+        worker = self.session.worker
+        if worker is None:
+            return
+        rows = self.session.rows
+        now = time.monotonic()
+        rate = (rows - self.last_rows) / (now - self.last_stats)
+        self.last_stats, self.last_rows = now, rows
+        stages = self.stats.format_line(
+            ('read', 'parse', 'trigger', 'trigger_command', 'program',
+             'queue', 'store', 'decimate', 'set_data', 'paint'))
+        self.window.stats_label.setText(
+            f"{rate:.0f}行/s | キュー {worker.rows.qsize()} | "
+            f"破棄 {worker.aligner.dropped_count}行\n"
+            f"p50/p99 (ms): {stages}")
 
     def exit(self):
+        self.stop_acquisition()
+        self.window.port_watcher.stop()
+        self.motor_writer.stop()  # 送信待ちのコマンドを送り終える
         try:
             self.sm1.close_port()
             self.sm2.close_port()
@@ -0,0 +1,128 @@
+import logging
+import time
+
+from pkgs.common.acquisition_session import AcquisitionSession
+from pkgs.common.constants import (Commands, ArithmeticConstants,
+                                   AcquisitionSettings, HeadlessSettings)
+from pkgs.util.serial_manager import SerialManager, SerialManagerError
+from pkgs.util.motor_controller import MotorController
+from pkgs.util.plot_array_handler import (PlotArrayHandler,
+                                          PlotArrayHandlerError)
+
+
+logger = logging.getLogger(__name__)
+
+
+class HeadlessExecutor:
+    """Qtを使わずに計測値を記録する実行部
+
+    Executorと同じAcquisitionSessionで取得と記録を行うが、
+    ウィンドウと描画を持たない。取り込みはrun()のループで行い、
+    処理の統計を一定の間隔で表示する。
+    """
+    def __init__(self, sm1: SerialManager, sm2: SerialManager,
+                 use_asyncio=False, use_spool=False, use_compact=False,
+                 max_rows=None, triggers=(), program=None, out=print):
+        """コンストラクタ
+
+        Arguments:
+            sm1 -- ESP32側のSerialManagerオブジェクト (接続済み)
+            sm2 -- RP2040側のSerialManagerオブジェクト (接続済み)
+
+        Keyword Arguments:
+            use_asyncio -- asyncioの取得エンジンを使う (default: {False})
+            use_spool -- 計測値をスプールファイルに持つ (default: {False})
+            use_compact -- 計測値をメモリ上に生の値の小さい型で持つ
+                           (default: {False})
+            max_rows -- 記録する行数の上限 (Noneならスプールでは無制限、
+                        それ以外はDATA_LENGTH) (default: {None})
+            triggers -- モータを自動で止める条件 (Triggerのリスト)
+                        (default: {()})
+            program -- 実行する負荷プログラム。終えたら計測を止める
+                       (default: {None})
+            out -- 統計の行を出力する関数 (default: {print})
+        """
+        self.sm1 = sm1
+        self.sm2 = sm2
+        self.mc = MotorController(self.sm1)
+        self.handler = PlotArrayHandler(spool=use_spool,
+                                        compact=use_compact)
+        if max_rows is None and not use_spool:
+            max_rows = ArithmeticConstants.DATA_LENGTH - 1
+        self.session = AcquisitionSession(
+            self.sm1, self.sm2, self.mc, self.handler,
+            use_asyncio=use_asyncio, max_rows=max_rows, triggers=triggers,
+            program=program, metadata={'headless': True})
+        self.stats = self.session.stats
+        self.out = out
+
+    def run(self, file_name, duration=None, should_stop=None):
+        """計測して保存する
+
+        時間か行数の上限に達するか、should_stopが真を返すか、
+        Ctrl+Cで止める。
+
+        Arguments:
+            file_name -- 保存するファイル名 (out/以下、拡張子なし)
+
+        Keyword Arguments:
+            duration -- 計測する時間 (s) (Noneなら無制限) (default: {None})
+            should_stop -- 取り込みのたびに呼ばれ、真なら止める関数
+                           (default: {None})
+
+        Returns: 記録した行数
+        """
+        self.start(file_name)
+        session = self.session
+        started = last_report = time.monotonic()
+        last_rows = 0
+        interval = AcquisitionSettings.DRAIN_INTERVAL / 1000
+        try:
+            while not session.full():
+                time.sleep(interval)
+                session.ingest()
+                now = time.monotonic()
+                if now - last_report >= HeadlessSettings.REPORT_INTERVAL:
+                    self.report(now - started, (session.rows - last_rows)
+                                / (now - last_report))
+                    last_report, last_rows = now, session.rows
+                if duration is not None and now - started >= duration:
+                    break
+                if should_stop is not None and should_stop():
+                    break
+                runner = session.runner
+                if runner is not None and not runner.is_alive():
+                    break
+        except KeyboardInterrupt:
+            logger.info("中断しました")
+        finally:
+            self.stop(file_name)
+        return session.rows
+
+    def start(self, file_name):
+        """デバイスに送信を指示し、取得スレッドと自動保存を始める"""
+        self.sm1.write(Commands.PLOT_START)
+        self.session.start(file_name)
+
+    def stop(self, file_name):
+        """取得を止め、保存して統計を書き出す"""
+        self.session.stop_program()  # モータの停止をPLOT_STOPより先に送る
+        try:
+            self.sm1.write(Commands.PLOT_STOP)
+        except SerialManagerError as e:
+            logger.error(str(e))
+        self.session.stop()
+        try:
+            self.session.save(file_name)
+        except PlotArrayHandlerError as e:
+            logger.error(str(e))
+        duration = time.monotonic() - self.session.started_at
+        logger.info(f"{self.session.rows}行を{duration:.1f}秒で記録しました")
+
+    def report(self, elapsed, rate):
+        """処理の統計を1行で出力する"""
+        worker = self.session.worker
+        stages = self.stats.format_line(HeadlessSettings.STAGES)
+        self.out(f"{elapsed:7.1f}s {self.session.rows:9d}行 {rate:7.0f}行/s "
+                 f"キュー {worker.rows.qsize()} "
+                 f"破棄 {worker.aligner.dropped_count}行 | {stages}")
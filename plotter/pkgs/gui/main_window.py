@@ -1,24 +1,33 @@
 import datetime as dt
-import serial.tools.list_ports
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QLineEdit,
-                             QGridLayout, QLabel, QComboBox)
+                             QGridLayout, QLabel, QComboBox, QCheckBox)
 from PyQt6.QtGui import QFont
 
 from pkgs.common.constants import (Formats, FontConfig)
 from pkgs.gui.button import Button
 from pkgs.gui.multi_axis_graph import MultiAxisGraphWidget
 from pkgs.gui.motor_ctrl_widget import MotorControlWidget
+from pkgs.gui.port_watcher import PortWatcher
+from pkgs.util.port_enumeration import ESP32, RP2040
 
 
 class Window(QMainWindow):
     """メインウィンドウクラス"""
 
-    def __init__(self):
+    def __init__(self, extra_ports=()):
+        """コンストラクタ
+
+        Keyword Arguments:
+            extra_ports -- 一覧に加えるポート名 (仮想デバイスなど)
+                           (default: {()})
+        """
         super().__init__()
 
+        self.extra_ports = list(extra_ports)
         self.init_ui()
         self.configure_ui()
         self.arrange_layouts()
+        self.port_watcher.start()
 
     def init_ui(self):
         """UIの初期化
@@ -43,6 +52,7 @@ class Window(QMainWindow):
         self.line_edit = QLineEdit(
             dt.datetime.now().strftime(Formats.DATE_FMT))
         self.message_box = QLabel('シリアルポートを選択してください')
+        self.stats_label = QLabel('')  # 計測中の処理の統計
 
         # コンボボックス
         self.combobox1_label = QLabel('COM Port : ESP32 Dev Module')
@@ -50,6 +60,13 @@ class Window(QMainWindow):
         self.combobox2_label = QLabel('COM Port : RP2040 Xiao')
         self.combobox2 = QComboBox()
 
+        # チェックボックス
+        self.scroll_checkbox = QCheckBox('スクロール表示')
+
+        # ポートの一覧は別スレッドで調べ、抜き差しに合わせて更新する
+        self.port_watcher = PortWatcher(parent=self)
+        self.port_watcher.changed.connect(self.update_ports)
+
     def configure_ui(self):
         """UI要素の設定
         """
@@ -57,18 +74,13 @@ class Window(QMainWindow):
         self.setGeometry(100, 100, 800, 450)
         self.setCentralWidget(self.main_widget)
         self.plot_area.setMinimumSize(800, 450)
-        self.comport_ui.setMaximumHeight(160)
+        self.comport_ui.setMaximumHeight(190)
         self.line_edit.setFont(
             QFont(FontConfig.FONT_FAMILY, FontConfig.FONT_SIZE))
 
-        def get_serial_ports():
-            ports = serial.tools.list_ports.comports()
-            port_list = [port.device for port in ports]
-            port_list.insert(0, '---')
-            return port_list
-
-        self.combobox1.addItems(get_serial_ports())
-        self.combobox2.addItems(get_serial_ports())
+        port_list = ['---'] + self.extra_ports
+        self.combobox1.addItems(port_list)
+        self.combobox2.addItems(port_list)
 
     def arrange_layouts(self):
         """部品をレイアウトに追加
@@ -85,6 +97,7 @@ class Window(QMainWindow):
         self.main_layout.addWidget(self.exit_button, 6, 0)
         self.main_layout.addWidget(self.line_edit, 2, 1)
         self.main_layout.addWidget(self.message_box, 6, 1)
+        self.main_layout.addWidget(self.stats_label, 7, 1)
         self.main_layout.addWidget(self.motor_ui, 3, 1, 4, 1)
 
         # comport_ui_layout
@@ -94,3 +107,34 @@ class Window(QMainWindow):
         self.comport_ui_layout.addWidget(self.combobox1, 1, 0)
         self.comport_ui_layout.addWidget(self.combobox2_label, 2, 0)
         self.comport_ui_layout.addWidget(self.combobox2, 3, 0)
+        self.comport_ui_layout.addWidget(self.scroll_checkbox, 4, 0)
+
+    def update_ports(self, added, removed):
+        """ポートの抜き差しをコンボボックスに反映する
+
+        差の分だけ項目を出し入れし、選択中の項目は変えない。
+        VID/PIDで見分けたデバイスは名前を添えて、そのデバイス用の
+        コンボボックスでは'---'のすぐ下に置く。
+
+        Arguments:
+            added -- 加わったPortInfoのリスト
+            removed -- 無くなったPortInfoのリスト
+        """
+        for combobox, kind in ((self.combobox1, ESP32),
+                               (self.combobox2, RP2040)):
+            combobox.blockSignals(True)  # 選択の変更として扱わない
+            try:
+                for info in removed:
+                    index = combobox.findData(info.device)
+                    if index > 0 and index != combobox.currentIndex():
+                        combobox.removeItem(index)
+                for info in added:
+                    index = combobox.findData(info.device)
+                    if index > 0:  # 選択中のまま抜き差しされた
+                        combobox.setItemText(index, info.label)
+                    elif info.kind == kind:
+                        combobox.insertItem(1, info.label, info.device)
+                    else:
+                        combobox.addItem(info.label, info.device)
+            finally:
+                combobox.blockSignals(False)
@@ -1,8 +1,11 @@
+import time
+
 import pyqtgraph as pg
 from PyQt6.QtWidgets import QGraphicsWidget
 from PyQt6.QtGui import QFont
 from pkgs.common.constants import (
     FontConfig, GraphLabels, RangeValues, ColourValues, Styles)
+from pkgs.util.decimation import minmax_decimate, visible_slice
 
 
 class MultiAxisGraphWidget(pg.GraphicsLayoutWidget):
@@ -28,6 +31,13 @@ class MultiAxisGraphWidget(pg.GraphicsLayoutWidget):
         self.set_graph_frame_font()
         self.setup_labels()
 
+        # 表示するデータ (t, y1, y2, y3, y4, y5)
+        self.columns = None
+        self.scroll_window = None  # スクロール表示で見せる時間 (s)
+        self._refreshing = False
+        self.stage_times = {}  # 直前のrefreshの段ごとの時間 (s)
+        self.setup_lod_signals()
+
         pg.setConfigOptions(antialias=True)
 
     def create_curves(self):
@@ -125,3 +135,59 @@ class MultiAxisGraphWidget(pg.GraphicsLayoutWidget):
         self.view_boxes[2].setRange(yRange=RangeValues.Y_RANGE2, padding=0)
         self.view_boxes[3].setRange(yRange=RangeValues.Y_RANGE2, padding=0)
         self.view_boxes[4].setRange(yRange=RangeValues.Y_RANGE1, padding=0)
+
+    def setup_lod_signals(self):
+        """表示範囲や幅が変わったら間引き直す"""
+        self.plotItem.vb.sigXRangeChanged.connect(self.refresh)
+        self.plotItem.vb.sigResized.connect(self.refresh)
+
+    def set_scroll_window(self, seconds):
+        """スクロール表示を切り替える
+
+        Arguments:
+            seconds -- 直近何秒を表示するか (Noneで固定表示に戻す)
+        """
+        self.scroll_window = seconds
+        if seconds is None:
+            self.plotItem.setXRange(*RangeValues.X_RANGE, padding=0)
+        self.refresh()
+
+    def set_data(self, columns):
+        """表示するデータをセットして描画する
+
+        Arguments:
+            columns -- 列ごとの配列 (t, y1, y2, y3, y4, y5)
+        """
+        self.columns = columns
+        self.refresh()
+
+    def refresh(self):
+        """表示範囲の点だけを画面の幅に合わせて間引いて描画する
+
+        描画する点数は画面の幅で決まるので、計測が長くなっても
+        1回の描画の重さは変わらない。
+        スクロール表示では最新の点が右端に来るように表示範囲を動かす。
+        """
+        if self.columns is None or self._refreshing:
+            return
+        t, *ys = self.columns
+        if self.scroll_window is not None and len(t):
+            self._refreshing = True  # 範囲変更による再入を防ぐ
+            try:
+                self.plotItem.setXRange(
+                    t[-1] - self.scroll_window, t[-1], padding=0)
+            finally:
+                self._refreshing = False
+        start = time.perf_counter()
+        x_min, x_max = self.plotItem.vb.viewRange()[0]
+        visible = visible_slice(t, x_min, x_max)
+        num_bins = max(int(self.plotItem.vb.width()), 1)
+        t_plt, y_plts = minmax_decimate(
+            t[visible], [y[visible] for y in ys], num_bins)
+        decimated = time.perf_counter()
+        for curve, y_plt in zip(self.curves, y_plts):
+            curve.setData(t_plt, y_plt)
+        self.stage_times = {
+            'decimate': decimated - start,
+            'set_data': time.perf_counter() - decimated,
+        }
@@ -0,0 +1,23 @@
+from PyQt6.QtCore import QObject, QEvent, pyqtSignal
+
+
+class PaintWatcher(QObject):
+    """ウィジェットが最初に描画されたことを知らせる"""
+    painted = pyqtSignal()
+
+    def __init__(self, widget):
+        """コンストラクタ
+
+        Arguments:
+            widget -- 描画を見張るウィジェット
+        """
+        super().__init__(widget)
+        self.widget = widget
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        """最初の描画イベントの後でシグナルを送り、見張りをやめる"""
+        if obj is self.widget and event.type() == QEvent.Type.Paint:
+            self.widget.removeEventFilter(self)
+            self.painted.emit()
+        return False
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from pkgs.common.constants import HotplugSettings
+from pkgs.util.port_enumeration import enumerate_ports, diff_ports
+
+
+class PortWatcher(QObject):
+    """シリアルポートの抜き差しを別スレッドで見張る
+
+    ポートの列挙は環境によって時間がかかるので、GUIスレッドを
+    止めないよう別スレッドで一定の間隔で調べ直す。前回の列挙を
+    持っておき、差があったときだけシグナルで知らせる。
+    """
+    changed = pyqtSignal(list, list)  # (加わったPortInfo, 無くなったPortInfo)
+    failed = pyqtSignal(str)  # エラーメッセージ
+
+    def __init__(self, interval=HotplugSettings.POLL_INTERVAL, parent=None):
+        """コンストラクタ
+
+        Keyword Arguments:
+            interval -- 調べ直す間隔 (s)
+                        (default: {HotplugSettings.POLL_INTERVAL})
+            parent -- 親のQObject (default: {None})
+        """
+        super().__init__(parent)
+        self.interval = interval
+        self.ports = {}  # 前回の列挙 (ポート名からPortInfo)
+        self.elapsed = None  # 最初の列挙にかかった時間 (s)
+        self._error = None  # 続けて同じエラーを知らせないため
+        self._started = None
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self):
+        """見張りを始める"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """見張りをやめる"""
+        self._stop_event.set()
+
+    def _run(self):
+        """一定の間隔でポートを列挙する (別スレッド)"""
+        self._started = time.perf_counter()
+        self._scan()
+        while not self._stop_event.wait(self.interval):
+            self._scan()
+
+    def _scan(self):
+        """ポートを列挙し、前回との差があればシグナルを送る
+
+        最初の列挙は差が無くても知らせる。
+        """
+        try:
+            ports = enumerate_ports()
+        except Exception as e:
+            ports = None
+            message = f"ポートの一覧を取得できませんでした: {e}"
+        first = self.elapsed is None
+        if first:
+            self.elapsed = time.perf_counter() - self._started
+        if ports is None:
+            if message != self._error:
+                self._error = message
+                self.failed.emit(message)
+            return
+        self._error = None
+        added, removed = diff_ports(self.ports, ports)
+        self.ports = ports
+        if added or removed or first:
+            self.changed.emit(added, removed)
@@ -0,0 +1,78 @@
+import time
+
+from PyQt6.QtCore import QObject, QTimer
+
+from pkgs.common.constants import RenderSettings
+
+
+class RenderLoop(QObject):
+    """取得から切り離した描画ループ
+
+    一定のフレームレートで、前回の描画から新しいデータが届いている
+    ときだけ描画関数を呼ぶ。描画時間が予算を超えるとフレームレートを
+    下げ、余裕が戻れば目標まで上げ直す。
+    """
+    def __init__(self, render, target_fps=RenderSettings.TARGET_FPS,
+                 min_fps=RenderSettings.MIN_FPS, parent=None):
+        """コンストラクタ
+
+        Arguments:
+            render -- 1フレーム分を描画する関数
+
+        Keyword Arguments:
+            target_fps -- 目標フレームレート
+                          (default: {RenderSettings.TARGET_FPS})
+            min_fps -- フレームレートの下限 (default: {RenderSettings.MIN_FPS})
+            parent -- 親のQObject (default: {None})
+        """
+        super().__init__(parent)
+        self.render = render
+        self.target_fps = target_fps
+        self.min_fps = min_fps
+        self.fps = target_fps
+        self.frame_cost = 0.0  # 描画時間の移動平均 (s)
+        self.dirty = False
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.on_frame)
+
+    def start(self):
+        """描画ループを開始する"""
+        self.fps = self.target_fps
+        self.frame_cost = 0.0
+        self.timer.start(self.interval())
+
+    def stop(self):
+        """描画ループを止め、残っている更新があれば描画する"""
+        self.timer.stop()
+        self.on_frame()
+
+    def mark_dirty(self):
+        """新しいデータが届いたことを知らせる"""
+        self.dirty = True
+
+    def interval(self):
+        """現在のフレーム間隔 (ms)"""
+        return round(1000 / self.fps)
+
+    def on_frame(self):
+        """タイマーから呼ばれ、更新があれば描画する"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        start = time.perf_counter()
+        self.render()
+        cost = time.perf_counter() - start
+        self.frame_cost += RenderSettings.COST_GAIN * (cost - self.frame_cost)
+        self.adjust_fps()
+
+    def adjust_fps(self):
+        """描画時間に合わせてフレームレートを上げ下げする"""
+        budget = RenderSettings.BUDGET_RATIO / self.fps
+        if self.frame_cost > budget and self.fps > self.min_fps:
+            self.fps = max(self.min_fps, self.fps / 2)
+        elif self.frame_cost < budget / 4 and self.fps < self.target_fps:
+            self.fps = min(self.target_fps, self.fps * 2)
+        else:
+            return
+        if self.timer.isActive():
+            self.timer.setInterval(self.interval())
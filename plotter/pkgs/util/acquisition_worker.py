@@ -0,0 +1,174 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from pkgs.common.constants import AcquisitionSettings
+from pkgs.util.serial_manager import SerialManager, SerialManagerError
+from pkgs.util.stream_aligner import StreamAligner
+
+
+class AcquisitionWorker(threading.Thread):
+    """シリアルの読み取りをGUIスレッドから切り離す取得スレッド
+
+    2つのSerialManagerを所有し、StreamAlignerで組にした行を解析して
+    有界キューに積む。GUIはdrain()で自分のペースで取り出す。
+    """
+    def __init__(self, sm1: SerialManager, sm2: SerialManager, parser,
+                 queue_size=AcquisitionSettings.QUEUE_SIZE, journal=None,
+                 stats=None, trigger=None, program=None):
+        """コンストラクタ
+
+        Arguments:
+            sm1 -- ESP32側のSerialManagerオブジェクト
+            sm2 -- RP2040側のSerialManagerオブジェクト
+            parser -- 両デバイスの行リストを受け取り
+                      (行ブロック, 有効行マスク) を返す関数
+
+        Keyword Arguments:
+            queue_size -- キューの上限 (default: {AcquisitionSettings.QUEUE_SIZE})
+            journal -- 受信した行を記録するJournalWriterオブジェクト
+                       (default: {None})
+            stats -- 段ごとの所要時間を記録するLatencyStatsオブジェクト
+                     (default: {None})
+            trigger -- 解析した行で停止の条件を評価するTriggerEngine
+                       オブジェクト (default: {None})
+            program -- 解析した行で待ちの条件を評価するProgramRunner
+                       オブジェクト (default: {None})
+        """
+        super().__init__(daemon=True)
+        self.sm1 = sm1
+        self.sm2 = sm2
+        self.parser = parser
+        self.journal = journal
+        self.stats = stats
+        self.trigger = trigger
+        self.program = program
+        self.rows = queue.Queue(maxsize=queue_size)  # (受信時刻, 行ブロック)
+        self.errors = queue.Queue()  # エラーメッセージ
+        self.aligner = StreamAligner()
+        self._stop_event = threading.Event()
+
+    @property
+    def stopped(self):
+        """停止要求が出ているか"""
+        return self._stop_event.is_set()
+
+    def run(self):
+        """取得ループ
+
+        各ポートに届いている分を待たずにまとめて読み、整列段で組にして
+        からまとめて解析する。一方のポートで待たないので、受信時刻は
+        どちらのデバイスもPOLL_INTERVAL程度の精度になる。
+        """
+        skipped = [False, False]
+        while not self.stopped:
+            started = time.monotonic()
+            try:
+                batches = (self.sm1.read_lines(block=False),
+                           self.sm2.read_lines(block=False))
+            except SerialManagerError as e:
+                self._report(str(e))
+                self._stop_event.wait(AcquisitionSettings.PUT_TIMEOUT)
+                continue
+            received_at = time.monotonic()
+            if self.stopped:
+                break
+            if not any(batches):
+                self._stop_event.wait(AcquisitionSettings.POLL_INTERVAL)
+                continue
+            if self.stats is not None:
+                self.stats.record('read', received_at - started)
+
+            for index, lines in enumerate(batches):
+                # 1行読み飛ばし
+                if lines and not skipped[index]:
+                    skipped[index] = True
+                    lines = lines[1:]
+                self._push(index, lines, received_at)
+
+            rows = self._parse_aligned()
+            if rows is not None:
+                self._observe(received_at, rows)
+                self._publish(received_at, rows)
+
+    def stop(self):
+        """停止を要求し、スレッドの終了を待つ"""
+        self._stop_event.set()
+        for sm in (self.sm1, self.sm2):
+            try:
+                sm.cancel_read()
+            except SerialManagerError as e:
+                self._report(str(e))
+        if self.is_alive():
+            self.join(AcquisitionSettings.JOIN_TIMEOUT)
+
+    def drain(self):
+        """キューに溜まった行ブロックをすべて取り出す
+
+        Returns: (受信時刻, 行ブロック) のリスト
+        """
+        items = []
+        while True:
+            try:
+                items.append(self.rows.get_nowait())
+            except queue.Empty:
+                return items
+
+    def drain_errors(self):
+        """溜まったエラーメッセージをすべて取り出す"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.errors.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _push(self, index, lines, received_at):
+        """受信した行をジャーナルに記録し、整列段に積む"""
+        if self.journal is not None:
+            self.journal.record(index, lines, received_at)
+        self.aligner.push(index, lines, received_at)
+
+    def _parse_aligned(self):
+        """整列段で組になった行をまとめて解析する
+
+        Returns: 行ブロック (1行も得られなければNone)
+        """
+        started = time.monotonic()
+        lines1, lines2 = self.aligner.pop_pairs(started)
+        if not lines1:
+            return None
+        data, mask = self.parser(lines1, lines2)
+        if self.stats is not None:
+            self.stats.record('parse', time.monotonic() - started)
+        failed = len(lines1) - np.count_nonzero(mask)
+        if failed:
+            self._report(f"データの処理に失敗しました ({failed}行)")
+            data = data[mask]
+        if len(data) == 0:
+            return None
+        return data
+
+    def _observe(self, received_at, rows):
+        """キューに積む前に停止の条件と負荷プログラムの条件を評価する"""
+        if self.trigger is not None:
+            self.trigger.process(rows, received_at)
+        if self.program is not None:
+            self.program.process(rows, received_at)
+
+    def _publish(self, received_at, rows):
+        """キューに空きができるまで待って行ブロックを積む"""
+        while not self.stopped:
+            try:
+                self.rows.put((received_at, rows),
+                              timeout=AcquisitionSettings.PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def _report(self, message):
+        """停止中でなければエラーを通知する"""
+        if not self.stopped:
+            self.errors.put(message)
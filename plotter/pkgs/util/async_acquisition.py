@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import serial_asyncio
+
+from pkgs.common.constants import AcquisitionSettings
+from pkgs.util.acquisition_worker import AcquisitionWorker
+from pkgs.util.serial_manager import SerialManager, SerialManagerError
+
+
+class AsyncAcquisitionEngine(AcquisitionWorker):
+    """pyserial-asyncioで各デバイスを並行に読む取得エンジン
+
+    専用スレッドでイベントループを1つ回し、デバイスごとに
+    StreamReaderを割り当てる。行は1行ずつ到着時刻付きで整列段に入り、
+    組になった時点で解析する。
+    整列段、キューとdrain()はAcquisitionWorkerと共通。
+    """
+    def __init__(self, sm1: SerialManager, sm2: SerialManager, parser,
+                 queue_size=AcquisitionSettings.QUEUE_SIZE, journal=None,
+                 stats=None, trigger=None, program=None):
+        """コンストラクタ
+
+        Arguments:
+            sm1 -- ESP32側のSerialManagerオブジェクト
+            sm2 -- RP2040側のSerialManagerオブジェクト
+            parser -- 両デバイスの行リストを受け取り
+                      (行ブロック, 有効行マスク) を返す関数
+
+        Keyword Arguments:
+            queue_size -- キューの上限 (default: {AcquisitionSettings.QUEUE_SIZE})
+            journal -- 受信した行を記録するJournalWriterオブジェクト
+                       (default: {None})
+            stats -- 段ごとの所要時間を記録するLatencyStatsオブジェクト
+                     (default: {None})
+            trigger -- 解析した行で停止の条件を評価するTriggerEngine
+                       オブジェクト (default: {None})
+            program -- 解析した行で待ちの条件を評価するProgramRunner
+                       オブジェクト (default: {None})
+        """
+        super().__init__(sm1, sm2, parser, queue_size, journal, stats,
+                         trigger, program)
+        self.loop: asyncio.AbstractEventLoop = None
+        self._wakeup: asyncio.Event = None
+
+    def run(self):
+        """イベントループを回す"""
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        """停止を要求し、スレッドの終了を待つ"""
+        self._stop_event.set()
+        if self.loop is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self._notify_stop)
+            except RuntimeError:
+                pass  # ループは既に閉じている
+        if self.is_alive():
+            self.join(AcquisitionSettings.JOIN_TIMEOUT)
+
+    def _notify_stop(self):
+        """ループ内で停止要求を伝える"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _main(self):
+        """各デバイスの読み取りタスクを起動し、停止要求まで待つ"""
+        self._wakeup = asyncio.Event()
+        if self.stopped:
+            return
+
+        connections = []
+        try:
+            for sm in (self.sm1, self.sm2):
+                connections.append(await self._connect(sm))
+        except SerialManagerError as e:
+            self._report(str(e))
+            self._release(connections)
+            return
+
+        tasks = [
+            asyncio.create_task(self._read_lines(reader, index))
+            for index, (reader, _, _) in enumerate(connections)]
+        try:
+            await self._wakeup.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._release(connections)
+
+    async def _connect(self, sm: SerialManager):
+        """開いているポートにStreamReaderを接続する
+
+        Returns: (StreamReader, SerialTransport, 元のタイムアウト)
+        """
+        if not (sm.ser and sm.ser.is_open):
+            raise SerialManagerError("シリアルポートが開いていません")
+        timeouts = (sm.ser.timeout, sm.ser.write_timeout)
+        reader = asyncio.StreamReader()
+        protocol = asyncio.StreamReaderProtocol(reader)
+        try:
+            transport, _ = await serial_asyncio.connection_for_serial(
+                self.loop, lambda: protocol, sm.ser)
+        except Exception as e:
+            raise SerialManagerError(f"非同期読み取りを開始できませんでした: {e}")
+        return reader, transport, timeouts
+
+    def _release(self, connections):
+        """ポートを閉じずに読み取りだけを止め、タイムアウトを戻す
+
+        ポートはSerialManagerの所有なので、トランスポートは閉じない。
+        """
+        for _, transport, (timeout, write_timeout) in connections:
+            transport.pause_reading()
+            serial_instance = transport.serial
+            if serial_instance is not None and serial_instance.is_open:
+                serial_instance.timeout = timeout
+                serial_instance.write_timeout = write_timeout
+
+    async def _read_lines(self, reader: asyncio.StreamReader, index):
+        """1デバイス分の行を読み、揃った組を解析する"""
+        skipped = False
+        while not self.stopped:
+            try:
+                line = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError) as e:
+                self._report(f"値エラーが発生しました: {e}")
+                continue
+            if not line:
+                self._report("シリアルポートが閉じられました")
+                return
+            received_at = time.monotonic()
+
+            # 1行読み飛ばし
+            if not skipped:
+                skipped = True
+                continue
+
+            try:
+                self._push(index, [line.rstrip().decode()], received_at)
+            except UnicodeDecodeError as e:
+                self._report(f"Unicode デコードエラーが発生しました: {e}")
+                continue
+            rows = self._parse_aligned()
+            if rows is not None:
+                self._observe(received_at, rows)
+                await self._publish_async(received_at, rows)
+
+    async def _publish_async(self, received_at, rows):
+        """ループを止めずにキューの空きを待って行ブロックを積む"""
+        while not self.stopped:
+            if not self.rows.full():
+                self.rows.put_nowait((received_at, rows))
+                return
+            await asyncio.sleep(AcquisitionSettings.PUT_TIMEOUT)
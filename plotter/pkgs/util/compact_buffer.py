@@ -0,0 +1,199 @@
+import numpy as np
+
+from pkgs.common.constants import CompactLayout
+
+
+def column_limits(layout=CompactLayout.COLUMNS):
+    """列ごとに生の値の型で持てる換算後の値の範囲を返す
+
+    Keyword Arguments:
+        layout -- 列ごとの (型, 係数, 除数)
+                  (default: {CompactLayout.COLUMNS})
+
+    Returns: (下限のタプル, 上限のタプル) (どちらも有限の値)
+    """
+    lower, upper = [], []
+    for dtype, scale, divisor in layout:
+        dtype = np.dtype(dtype)
+        if dtype.kind in 'iu':
+            info = np.iinfo(dtype)
+            lower.append(float(info.min) * scale / divisor)
+            upper.append(float(info.max) * scale / divisor)
+        else:
+            info = np.finfo(dtype)
+            lower.append(float(info.min))
+            upper.append(float(info.max))
+    return tuple(lower), tuple(upper)
+
+
+class ScaledColumn:
+    """生の値の配列を換算後の値として読ませる列
+
+    切り出した範囲だけをfloat64に換算するので、表示範囲の点だけを
+    描画するときは計測全体を換算しない。
+    """
+    def __init__(self, raw, scale, divisor):
+        """コンストラクタ
+
+        Arguments:
+            raw -- 生の値の配列
+            scale -- 換算の係数
+            divisor -- 換算の除数
+        """
+        self.raw = raw
+        self.scale = scale
+        self.divisor = divisor
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key):
+        return self.decode(self.raw[key])
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.decode(self.raw)
+        return values if dtype is None else values.astype(dtype)
+
+    def decode(self, raw):
+        """生の値を換算する"""
+        return np.asarray(raw, dtype=np.float64) * self.scale / self.divisor
+
+    def searchsorted(self, value, side='left'):
+        """換算後の値で生の値の配列を二分探索する (昇順の列のみ)"""
+        return np.searchsorted(self.raw, value * self.divisor / self.scale,
+                               side=side)
+
+
+class CompactBuffer:
+    """計測値を列ごとの小さい型の生の値で持つ伸長可能なバッファ
+
+    SampleBufferと同じ使い方ができる。追加した行はCompactLayoutの型に
+    戻して持ち (時刻はint64のマイクロ秒、ADC値はuint16のカウント、
+    変位はint32の0.01単位)、1行48バイトが22バイトになる。
+    秒やボルトへの換算は取り出すときに必要な範囲だけ行う。
+    """
+    def __init__(self, layout=CompactLayout.COLUMNS, capacity=1024):
+        """コンストラクタ
+
+        Keyword Arguments:
+            layout -- 列ごとの (型, 係数, 除数)
+                      (default: {CompactLayout.COLUMNS})
+            capacity -- 初期容量 (default: {1024})
+        """
+        self.layout = [(np.dtype(dtype), scale, divisor)
+                       for dtype, scale, divisor in layout]
+        self.num_columns = len(self.layout)
+        self.initial_capacity = capacity
+        self.clear()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        """確保済みの行数"""
+        return len(self._raw[0])
+
+    @property
+    def nbytes(self):
+        """確保済みのバイト数"""
+        return sum(raw.nbytes for raw in self._raw)
+
+    def clear(self):
+        """データを破棄して初期容量に戻す"""
+        self._raw = [np.empty(self.initial_capacity, dtype=dtype)
+                     for dtype, _, _ in self.layout]
+        self._size = 0
+
+    def append(self, row):
+        """1行追加する
+
+        Arguments:
+            row -- 長さnum_columnsの換算後の値の配列
+        """
+        self.extend(row)
+
+    def extend(self, rows):
+        """複数行をまとめて追加する
+
+        型に収まらない値 (NaNや範囲外) を含むときは、どの行も追加せずに
+        例外を送出する (キャストで周回した値を黙って持たないように)。
+
+        Arguments:
+            rows -- (N, num_columns)の換算後の値の配列
+
+        Raises:
+            CompactBufferError: 型に収まらない値を含む
+        """
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        n = rows.shape[0]
+        if n == 0:
+            return
+        encoded = []
+        for i, (values, (dtype, scale, divisor)) in enumerate(
+                zip(rows.T, self.layout)):
+            if dtype.kind in 'iu':
+                values = np.rint(values * divisor / scale)
+                info = np.iinfo(dtype)
+                # NaNは比較が偽になるので、範囲内の判定で一緒に弾く
+                inside = (values >= info.min) & (values <= info.max)
+                if not inside.all():
+                    bad = rows[np.argmin(inside), i]
+                    raise CompactBufferError(
+                        f"{i}列目の値{bad}は{dtype}で持てません")
+            encoded.append(values)
+        self._reserve(self._size + n)
+        end = self._size + n
+        for raw, values in zip(self._raw, encoded):
+            raw[self._size:end] = values
+        self._size = end
+
+    def raw_columns(self):
+        """生の値の列を返す (コピーしないビュー)
+
+        Returns: 列ごとの生の値の配列のリスト
+        """
+        return [raw[:self._size] for raw in self._raw]
+
+    def columns(self):
+        """換算後の値として読める列を返す (換算は切り出したときに行う)
+
+        Returns: ScaledColumnのリスト
+        """
+        return [ScaledColumn(raw, scale, divisor)
+                for raw, (_, scale, divisor)
+                in zip(self.raw_columns(), self.layout)]
+
+    def rows(self, start=0, stop=None):
+        """行ごとの換算後の配列を返す (換算したコピー)
+
+        Keyword Arguments:
+            start -- 最初の行 (default: {0})
+            stop -- 最後の行の次 (default: {None})
+
+        Returns: (N, num_columns)の配列
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        start = min(start, stop)
+        data = np.empty((stop - start, self.num_columns))
+        for i, column in enumerate(self.columns()):
+            data[:, i] = column[start:stop]
+        return data
+
+    def _reserve(self, size):
+        """必要なら容量を倍々に増やす"""
+        capacity = self.capacity
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for i, raw in enumerate(self._raw):
+            grown = np.empty(capacity, dtype=raw.dtype)
+            grown[:self._size] = raw[:self._size]
+            self._raw[i] = grown
+
+
+class CompactBufferError(Exception):
+    pass
@@ -0,0 +1,116 @@
+import os
+import queue
+import threading
+
+from pkgs.common.constants import DataProperties
+
+
+def format_header():
+    """DataPropertiesの属性名を並べたCSVのヘッダ行"""
+    return ','.join(DataProperties.list_properties()) + os.linesep
+
+
+def format_rows(rows):
+    """行をCSVの文字列にする
+
+    pandasのto_csv(index=False)と同じく、数値はreprで、
+    NaNは空欄で書く。
+
+    Arguments:
+        rows -- (N, 列数)の配列
+
+    Returns: 改行で終わるN行分の文字列
+    """
+    lines = [','.join('' if value != value else repr(value) for value in row)
+             for row in rows.tolist()]
+    if not lines:
+        return ''
+    return os.linesep.join(lines) + os.linesep
+
+
+class StreamingCsvWriter(threading.Thread):
+    """計測中に行ブロックをCSVへ追記していく書き込みスレッド
+
+    渡された行ブロックは書き終わるまで保持するだけでコピーしないので、
+    保存に使うメモリは書き出し待ちの1ブロック分の文字列で済む。
+    ヘッダはDataPropertiesの属性名で、pandasのto_csv(index=False)と
+    同じ内容のファイルになる。
+    セッションアーカイブのライタを渡すと、同じ行ブロックを1チャンク
+    としてそちらにも書く。
+    """
+    def __init__(self, path, archive=None):
+        """コンストラクタ
+
+        Arguments:
+            path -- 書き込むCSVファイルのパス
+
+        Keyword Arguments:
+            archive -- SessionArchiveWriterオブジェクト (default: {None})
+        """
+        super().__init__(daemon=True)
+        self.path = path
+        self.archive = archive
+        self.chunks = queue.Queue()
+        self.written = 0  # 書き終えた行数
+        self.error: Exception = None
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._file.write(format_header())
+
+    def run(self):
+        """キューの行ブロックを順に書き込む"""
+        try:
+            while True:
+                rows = self.chunks.get()
+                try:
+                    if rows is None:
+                        return
+                    if self.error is None:
+                        self._write(rows)
+                finally:
+                    self.chunks.task_done()
+        finally:
+            self._file.close()
+            if self.archive is not None:
+                self._close_archive()
+
+    def _write(self, rows):
+        """1ブロックを書き込み、OSに渡すまでフラッシュする"""
+        try:
+            self._file.write(format_rows(rows))
+            self._file.flush()
+            if self.archive is not None:
+                self.archive.write_chunk(rows)
+            self.written += len(rows)
+        except Exception as e:
+            self.error = e  # 以降のブロックは捨て、flush()で報告する
+
+    def _close_archive(self):
+        """セッションアーカイブに索引を書いて閉じる"""
+        try:
+            self.archive.close()
+        except Exception as e:
+            self.error = self.error or e
+
+    def write(self, rows):
+        """行ブロックを書き込み待ちに積む
+
+        Arguments:
+            rows -- (N, 列数)の配列 (書き終わるまで書き換えないこと)
+        """
+        self.chunks.put(rows)
+
+    def flush(self):
+        """積んだ行ブロックをすべて書き終えるまで待つ
+
+        書き込みに失敗していればその例外を送出する。
+        """
+        self.chunks.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """残りを書き終えてファイルを閉じる"""
+        self.chunks.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
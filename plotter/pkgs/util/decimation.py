@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def visible_slice(t, x_min, x_max):
+    """表示範囲に入る区間を求める
+
+    線が画面端で途切れないよう、範囲の外側の1点ずつも含める。
+
+    Arguments:
+        t -- 昇順の時刻の配列 (searchsortedを持つ列)
+        x_min -- 表示範囲の左端
+        x_max -- 表示範囲の右端
+
+    Returns: slice
+    """
+    start = max(t.searchsorted(x_min, side='left') - 1, 0)
+    stop = min(t.searchsorted(x_max, side='right') + 1, len(t))
+    return slice(start, stop)
+
+
+def minmax_decimate(t, ys, num_bins):
+    """ビンごとの最小値と最大値の2点に間引く
+
+    細いピークもビンの最大値・最小値として残るので、画面の
+    横幅程度のビン数に間引いても見た目は変わらない。
+    点数が少なければ間引かずにそのまま返す。
+
+    Arguments:
+        t -- 昇順の時刻の配列
+        ys -- tと同じ長さの値の配列のリスト
+        num_bins -- ビンの数 (画面の横幅のピクセル数程度)
+
+    Returns: (時刻の配列, 値の配列のリスト)
+    """
+    n = len(t)
+    per_bin = n // max(num_bins, 1)
+    if per_bin < 2:
+        return t, list(ys)
+
+    # 割り切れない末尾の点は間引かずに足す
+    m = num_bins * per_bin
+    t_out = np.concatenate((np.repeat(t[:m:per_bin], 2), t[m:]))
+    ys_out = []
+    for y in ys:
+        bins = y[:m].reshape(num_bins, per_bin)
+        pairs = np.empty((num_bins, 2), dtype=y.dtype)
+        pairs[:, 0] = bins.min(axis=1)
+        pairs[:, 1] = bins.max(axis=1)
+        ys_out.append(np.concatenate((pairs.ravel(), y[m:])))
+    return t_out, ys_out
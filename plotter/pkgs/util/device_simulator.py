@@ -0,0 +1,244 @@
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+from pkgs.common.constants import (AlignmentSettings, ArithmeticConstants,
+                                   Commands, SimulatorSettings)
+
+
+class Faults:
+    """送信に混ぜる障害の確率
+
+    drop -- 1行を送らない確率
+    garbage -- 1行の代わりに不正なバイト列を送る確率
+    stall -- 送信がstall_time秒止まり、その間の行をまとめて送る確率
+    """
+    def __init__(self, drop=0.0, garbage=0.0, stall=0.0,
+                 stall_time=SimulatorSettings.STALL_TIME):
+        """コンストラクタ"""
+        self.drop = drop
+        self.garbage = garbage
+        self.stall = stall
+        self.stall_time = stall_time
+
+
+class VirtualPort:
+    """ptyの組で作る仮想シリアルポート
+
+    アプリはslave側をserial.Serialで開き、シミュレータはmaster側に
+    読み書きする。アプリが読まないうちにバッファがあふれた分は、
+    実機のUSBシリアルと同じく捨てる。
+    """
+    def __init__(self):
+        """コンストラクタ"""
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # エコーや改行の変換をしない
+        os.set_blocking(self.master, False)
+        self.name = os.ttyname(self.slave)
+        self.overflow = 0  # あふれて捨てたバイト数
+
+    def write(self, data):
+        """書けるだけ書き、残りは捨てる"""
+        try:
+            written = os.write(self.master, data)
+        except (BlockingIOError, OSError):
+            written = 0
+        self.overflow += len(data) - written
+
+    def read(self, timeout):
+        """届いたバイト列を読む (timeout秒まで待つ)"""
+        ready, _, _ = select.select([self.master], [], [], max(timeout, 0))
+        if not ready:
+            return b''
+        try:
+            return os.read(self.master, 1024)
+        except (BlockingIOError, OSError):
+            return b''
+
+    def close(self):
+        """ptyの組を閉じる"""
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class DeviceSimulator(threading.Thread):
+    """ESP32とRP2040のスケッチの通信をまねる仮想デバイス
+
+    ESP32側は0で送信を始め、1で止める。3/4と7/8でモータ1/2を
+    動かし止め、5/9で向きを変える。送信のたびに「disp1,disp2,micros」を
+    送り、同じタイミングでRP2040側が「d,f1,f2」のADCカウントを送る。
+    力は変位に比例させ、ノイズを足す。
+    """
+    def __init__(self, rate=SimulatorSettings.SAMPLE_RATE,
+                 noise=SimulatorSettings.NOISE, faults: Faults = None,
+                 micros_offset=0, seed=None):
+        """コンストラクタ
+
+        Keyword Arguments:
+            rate -- 送信の頻度 (Hz) (default: {SimulatorSettings.SAMPLE_RATE})
+            noise -- ADCカウントのノイズの標準偏差
+                     (default: {SimulatorSettings.NOISE})
+            faults -- 送信に混ぜる障害 (default: {None})
+            micros_offset -- micros()の初期値 (周回の試験用) (default: {0})
+            seed -- 乱数の種 (default: {None})
+        """
+        super().__init__(daemon=True)
+        self.esp32 = VirtualPort()
+        self.rp2040 = VirtualPort()
+        self.period = 1 / rate
+        self.noise = noise
+        self.faults = faults or Faults()
+        self.micros_offset = micros_offset
+        self.random = random.Random(seed)
+        self.streaming = False
+        self.running = [False, False]  # モータ1, 2が動いているか
+        self.sign = [1, 1]
+        self.disp = [0.0, 0.0]
+        self.sent = 0  # 送った行の組の数
+        self._booted_at = time.monotonic()
+        self._held = [[], []]  # 送信が止まっている間の行
+        self._stall_until = 0.0
+        self._stop_event = threading.Event()
+
+    @property
+    def ports(self):
+        """(ESP32側のポート名, RP2040側のポート名)"""
+        return self.esp32.name, self.rp2040.name
+
+    def stop(self):
+        """止めてポートを閉じる"""
+        self._stop_event.set()
+        self.join()
+        self.esp32.close()
+        self.rp2040.close()
+
+    def run(self):
+        """コマンドを受け取りながら周期ごとに行を送る"""
+        next_send = time.monotonic()
+        last = next_send
+        while not self._stop_event.is_set():
+            timeout = next_send - time.monotonic() if self.streaming else 0.02
+            for byte in self.esp32.read(timeout):
+                self.handle_command(bytes([byte]))
+            now = time.monotonic()
+            self.advance(now - last)
+            last = now
+            if not self.streaming:
+                next_send = now
+                continue
+            # 遅れたときは追いつくまでまとめて送る
+            while next_send <= now:
+                self.send(next_send)
+                next_send += self.period
+
+    def handle_command(self, command):
+        """ESP32側に届いた1バイトのコマンドを処理する"""
+        if command == Commands.PLOT_START:
+            self.streaming = True
+        elif command == Commands.PLOT_STOP:
+            self.streaming = False
+        elif command == Commands.MOTOR_START1:
+            self.running[0] = True
+        elif command == Commands.MOTOR_STOP1:
+            self.running[0] = False
+        elif command == Commands.MOTOR_REVERSE1:
+            self.sign[0] *= -1
+        elif command == Commands.MOTOR_START2:
+            self.running[1] = True
+        elif command == Commands.MOTOR_STOP2:
+            self.running[1] = False
+        elif command == Commands.MOTOR_REVERSE2:
+            self.sign[1] *= -1
+
+    def advance(self, elapsed):
+        """動いているモータの変位を進める"""
+        step = SimulatorSettings.STEP_DISP / SimulatorSettings.STEP_PERIOD
+        for i in range(2):
+            if self.running[i]:
+                self.disp[i] += step * self.sign[i] * elapsed
+
+    def send(self, at):
+        """1組の行を送る (障害の確率に従って崩す)"""
+        micros = (int((at - self._booted_at) / ArithmeticConstants.MICRO)
+                  + self.micros_offset) % AlignmentSettings.MICROS_WRAP
+        # Serial.print(float)は小数2桁
+        esp_line = f"{self.disp[0]:.2f},{self.disp[1]:.2f},{micros}\r\n"
+        rp_line = "{},{},{}\r\n".format(*self.adc_counts())
+        self.sent += 1
+
+        if self._stall_until <= at and \
+                self.random.random() < self.faults.stall:
+            self._stall_until = at + self.faults.stall_time
+        for index, (port, line) in enumerate(
+                ((self.esp32, esp_line), (self.rp2040, rp_line))):
+            if self.random.random() < self.faults.drop:
+                continue
+            data = line.encode()
+            if self.random.random() < self.faults.garbage:
+                data = bytes(self.random.randrange(256)
+                             for _ in range(len(data) - 1)) + b'\n'
+            self._held[index].append(data)
+            if at >= self._stall_until:
+                port.write(b''.join(self._held[index]))
+                self._held[index].clear()
+
+    def adc_counts(self):
+        """RP2040のd, f1, f2のADCカウント"""
+        def count(value):
+            value += self.random.gauss(0, self.noise)
+            return min(max(round(value), 0), ArithmeticConstants.ADC_MAX)
+
+        force = SimulatorSettings.FORCE_OFFSET
+        return (count(SimulatorSettings.SENSOR_OFFSET),
+                count(force + SimulatorSettings.FORCE_GAIN * self.disp[0]),
+                count(force + SimulatorSettings.FORCE_GAIN * self.disp[1]))
+
+
+def main():
+    """仮想デバイスを起動してポート名を表示する"""
+    parser = argparse.ArgumentParser(
+        description='ESP32とRP2040の仮想シリアルデバイス')
+    parser.add_argument('--rate', type=float,
+                        default=SimulatorSettings.SAMPLE_RATE,
+                        help='送信の頻度 (Hz)')
+    parser.add_argument('--noise', type=float,
+                        default=SimulatorSettings.NOISE,
+                        help='ADCカウントのノイズの標準偏差')
+    parser.add_argument('--drop', type=float, default=0.0,
+                        help='1行を送らない確率')
+    parser.add_argument('--garbage', type=float, default=0.0,
+                        help='1行の代わりに不正なバイト列を送る確率')
+    parser.add_argument('--stall', type=float, default=0.0,
+                        help='送信が止まる確率 (1組ごと)')
+    parser.add_argument('--stall-time', type=float,
+                        default=SimulatorSettings.STALL_TIME,
+                        help='送信が止まる時間 (s)')
+    parser.add_argument('--micros-offset', type=int, default=0,
+                        help='micros()の初期値')
+    parser.add_argument('--seed', type=int, help='乱数の種')
+    args = parser.parse_args()
+
+    faults = Faults(args.drop, args.garbage, args.stall, args.stall_time)
+    simulator = DeviceSimulator(args.rate, args.noise, faults,
+                                args.micros_offset, args.seed)
+    simulator.start()
+    esp32, rp2040 = simulator.ports
+    print(f"ESP32: {esp32}")
+    print(f"RP2040: {rp2040}")
+    print(f"python main.py --port {esp32} --port {rp2040}")
+    try:
+        while simulator.is_alive():
+            simulator.join(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        print(f"{simulator.sent}組を送りました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import bisect
+import csv
+
+from pkgs.common.constants import MotorSettings
+from pkgs.util.motor_writer import MotorCommand
+
+
+class MotorEventLog:
+    """モータへのコマンドを計測値の時間軸に並べた記録
+
+    コマンドの時刻はホストのtime.monotonic()なので、取り込んだ行の
+    受信時刻と計測値の時刻の組を基準に、計測値の時間軸に直す。
+    基準はREFERENCE_INTERVALごとに残しておき、時刻に最も近いものを
+    使うので、保存するときの基準で計測の初めの方の時刻がずれない。
+    """
+    HEADER = ('Time', 'Command', 'Status', 'Queued', 'Sent', 'Latency',
+              'Row')
+
+    def __init__(self):
+        """コンストラクタ"""
+        self.events = []  # (MotorCommand, 記録したときに取り込み済みの行数)
+        self.received = []  # 基準の受信時刻 (昇順)
+        self.samples = []  # 基準の計測値の時刻
+        self.rows = 0
+
+    def reset(self):
+        """記録を破棄する"""
+        self.events = []
+        self.received = []
+        self.samples = []
+        self.rows = 0
+
+    def set_reference(self, received_at, sample_time, rows):
+        """時間軸の基準を更新する
+
+        Arguments:
+            received_at -- 最後に取り込んだ行の受信時刻 (time.monotonic())
+            sample_time -- その行の計測値の時刻 (s)
+            rows -- 取り込んだ行数
+        """
+        if (not self.received or received_at - self.received[-1]
+                >= MotorSettings.REFERENCE_INTERVAL):
+            self.received.append(received_at)
+            self.samples.append(sample_time)
+        self.rows = rows
+
+    def add(self, command: MotorCommand):
+        """送信を終えたコマンドを記録する"""
+        self.events.append((command, self.rows))
+
+    def sample_time(self, monotonic, near=None):
+        """ホストの時刻を計測値の時間軸に直す (基準が無ければNone)
+
+        Arguments:
+            monotonic -- 直す時刻 (time.monotonic())
+
+        Keyword Arguments:
+            near -- この時刻に最も近い基準を使う (1つの記録の時刻を
+                    同じ基準で直すため。Noneならmonotonic)
+                    (default: {None})
+        """
+        if monotonic is None or not self.received:
+            return None
+        near = monotonic if near is None else near
+        i = bisect.bisect_left(self.received, near)
+        if i == len(self.received) or (
+                i > 0 and near - self.received[i - 1]
+                < self.received[i] - near):
+            i -= 1  # 前後で近い方の基準を使う
+        return self.samples[i] + (monotonic - self.received[i])
+
+    def save_csv(self, path):
+        """記録をCSVに書き出す
+
+        Timeは書き込んだ時刻 (送っていなければ頼んだ時刻)、Latencyは
+        頼んでから書き込むまでの時間 (ms)。時刻はいずれも計測値の
+        時間軸 (s)。
+        """
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.HEADER)
+            for command, row in self.events:
+                queued = self.sample_time(command.queued_at,
+                                          command.queued_at)
+                sent = self.sample_time(command.sent_at, command.queued_at)
+                latency = (None if command.sent_at is None else
+                           (command.sent_at - command.queued_at) * 1e3)
+                writer.writerow((
+                    sent if sent is not None else queued,
+                    command.command.name, command.status, queued, sent,
+                    latency, row))
@@ -0,0 +1,296 @@
+import argparse
+import datetime
+import glob
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from pkgs.common.constants import JournalSettings, SaveSettings
+from pkgs.util.csv_writer import format_header, format_rows
+from pkgs.util.plot_array_handler import PlotArrayHandler
+from pkgs.util.session_archive import SessionArchiveWriter
+from pkgs.util.stream_aligner import StreamAligner
+
+# 1行目はヘッダ、以降は受信した1行ごとに「デバイス番号\t受信時刻\t行」
+HEADER_PREFIX = '# kes-journal v1'
+# 正常に閉じたときに最後に書く行 (無ければ異常終了したジャーナル)
+FOOTER_PREFIX = '# kes-journal closed'
+
+
+class JournalWriter(threading.Thread):
+    """受信した生の行を追記していくジャーナルの書き込みスレッド
+
+    取得スレッドはrecord()でキューに積むだけで、整形と書き込みは
+    このスレッドが行う。fsyncはFSYNC_INTERVALごとにまとめて行うので、
+    異常終了しても失うのはその間に受信した行だけになる。
+    正常に閉じたときは最後にFOOTER_PREFIXの行を書く。
+    """
+    def __init__(self, path, fsync_interval=JournalSettings.FSYNC_INTERVAL):
+        """コンストラクタ
+
+        既にあるジャーナルは、復元する前のものかもしれないので上書きしない。
+
+        Arguments:
+            path -- ジャーナルのパス
+
+        Keyword Arguments:
+            fsync_interval -- ディスクへ同期する間隔 (s)
+                              (default: {JournalSettings.FSYNC_INTERVAL})
+
+        Raises:
+            FileExistsError: 同じパスのジャーナルが既にある
+        """
+        super().__init__(daemon=True)
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.records = queue.Queue()  # (デバイス番号, 受信時刻, 行のリスト)
+        self.written = 0  # 書き終えた行数
+        self.error: Exception = None
+        self._file = open(path, 'x', encoding='utf-8', newline='\n')
+        started = datetime.datetime.now().isoformat(timespec='seconds')
+        self._file.write(f"{HEADER_PREFIX} started={started}\n")
+
+    def record(self, index, lines, received_at):
+        """受信した行を書き込み待ちに積む (待たない)
+
+        Arguments:
+            index -- デバイス番号
+            lines -- 行のリスト
+            received_at -- 受信時刻 (time.monotonic())
+        """
+        if lines:
+            self.records.put_nowait((index, received_at, lines))
+
+    def run(self):
+        """溜まった行をまとめて書き、間隔ごとにfsyncする"""
+        synced_at = time.monotonic()
+        closing = False
+        try:
+            while not closing:
+                try:
+                    items = [self.records.get(timeout=self.fsync_interval)]
+                except queue.Empty:
+                    items = []
+                while True:
+                    try:
+                        items.append(self.records.get_nowait())
+                    except queue.Empty:
+                        break
+                if items and items[-1] is None:
+                    closing = True
+                    items.pop()
+                self._write(items)
+                if closing:
+                    self._write_footer()
+                if closing or time.monotonic() - synced_at >= \
+                        self.fsync_interval:
+                    self._sync()
+                    synced_at = time.monotonic()
+        finally:
+            self._file.close()
+
+    def close(self):
+        """残りを書いてディスクに同期し、ファイルを閉じる"""
+        self.records.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def _write(self, items):
+        """行を整形して書く"""
+        if not items or self.error is not None:
+            return
+        text = ''.join(
+            f"{index}\t{received_at!r}\t{line}\n"
+            for index, received_at, lines in items for line in lines)
+        try:
+            self._file.write(text)
+            self._file.flush()
+            self.written += sum(len(lines) for _, _, lines in items)
+        except Exception as e:
+            self.error = e  # 以降は捨て、close()で報告する
+
+    def _write_footer(self):
+        """正常に閉じたことを示す最後の行を書く"""
+        if self.error is not None:
+            return
+        try:
+            self._file.write(f"{FOOTER_PREFIX} rows={self.written}\n")
+            self._file.flush()
+        except Exception as e:
+            self.error = e
+
+    def _sync(self):
+        """OSのバッファをディスクに書き出す"""
+        if self.error is not None:
+            return
+        try:
+            os.fsync(self._file.fileno())
+        except Exception as e:
+            self.error = e
+
+
+def read_journal(path):
+    """ジャーナルを読む
+
+    同じデバイスの同じ受信時刻の行は1回の読み取り分としてまとめる。
+    書きかけの最後の行や壊れた行は飛ばす。
+
+    Arguments:
+        path -- ジャーナルのパス
+
+    Returns: (デバイス番号, 受信時刻, 行のリスト) のイテレータ
+    """
+    batch = None
+    with open(path, encoding='utf-8', errors='replace', newline='\n') as f:
+        for record in f:
+            if record.startswith('#') or not record.endswith('\n'):
+                continue
+            fields = record[:-1].split('\t', 2)
+            if len(fields) != 3:
+                continue
+            try:
+                index, received_at = int(fields[0]), float(fields[1])
+            except ValueError:
+                continue
+            if batch is not None and batch[:2] == (index, received_at):
+                batch[2].append(fields[2])
+                continue
+            if batch is not None:
+                yield batch
+            batch = (index, received_at, [fields[2]])
+    if batch is not None:
+        yield batch
+
+
+def is_closed(path):
+    """ジャーナルが正常に閉じられているか (最後の行がFOOTER_PREFIXか)"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 256, 0))
+        tail = f.read().decode('utf-8', errors='replace')
+    lines = tail.splitlines()
+    return bool(lines) and lines[-1].startswith(FOOTER_PREFIX)
+
+
+def recovered_path(path):
+    """ジャーナルから復元したセッションアーカイブの既定のパス"""
+    return (f"{os.path.splitext(path)[0]}.recovered"
+            f"{SaveSettings.ARCHIVE_SUFFIX}")
+
+
+def find_unrecovered(file_name, out_dir=None):
+    """同じファイル名の計測のうち、異常終了して復元していない
+    ジャーナルを探す
+
+    Arguments:
+        file_name -- 保存するファイル名 (拡張子なし)
+
+    Keyword Arguments:
+        out_dir -- 探すディレクトリ (Noneなら保存先) (default: {None})
+
+    Returns: ジャーナルのパスのリスト
+    """
+    out_dir = SaveSettings.OUT_DIR if out_dir is None else out_dir
+    base = glob.escape(f"{out_dir}/{file_name}")
+    paths = (glob.glob(f"{base}{JournalSettings.SUFFIX}")
+             + glob.glob(f"{base}.*{JournalSettings.SUFFIX}"))
+    unrecovered = []
+    for path in sorted(paths):
+        try:
+            if is_closed(path) or os.path.exists(recovered_path(path)):
+                continue
+        except OSError:
+            continue
+        unrecovered.append(path)
+    return unrecovered
+
+
+def recover(path, archive_path=None, csv_path=None):
+    """ジャーナルを解析し直してセッションアーカイブ (とCSV) にする
+
+    取得時と同じく受信時刻で行を組にし、process_batchで解析して、
+    micros()の周回をつなげて最初の行からの時刻にする。
+
+    Arguments:
+        path -- ジャーナルのパス
+
+    Keyword Arguments:
+        archive_path -- 書き出すセッションアーカイブのパス
+                        (Noneなら「ジャーナル名.recovered」に拡張子を
+                        付けたパス) (default: {None})
+        csv_path -- 書き出すCSVのパス (Noneなら書かない) (default: {None})
+
+    Returns: (書き出した行数, 組にできず捨てた行数)
+    """
+    if archive_path is None:
+        archive_path = recovered_path(path)
+    project = os.path.splitext(os.path.basename(path))[0]
+    aligner = StreamAligner()
+    handler = PlotArrayHandler()
+    t0 = None
+    count = 0
+    blocks = []  # チャンクにまとめる前の行ブロック
+    csv_file = None
+    if csv_path is not None:
+        csv_file = open(csv_path, 'w', newline='', encoding='utf-8')
+        csv_file.write(format_header())
+
+    def flush(writer):
+        """溜めた行ブロックを1チャンクとして書く"""
+        if not blocks:
+            return
+        data = np.vstack(blocks)
+        blocks.clear()
+        writer.write_chunk(data)
+        if csv_file is not None:
+            csv_file.write(format_rows(data))
+
+    try:
+        with SessionArchiveWriter(archive_path, {'project': project,
+                                                 'source': path}) as writer:
+            pending = 0
+            for index, received_at, lines in read_journal(path):
+                aligner.push(index, lines, received_at)
+                lines1, lines2 = aligner.pop_pairs(received_at)
+                if not lines1:
+                    continue
+                data, mask = handler.process_batch(lines1, lines2)
+                data = data[mask]
+                if len(data) == 0:
+                    continue
+                handler.unwrap_time(data)
+                if t0 is None:
+                    t0 = data[0, 0]
+                data[:, 0] -= t0
+                blocks.append(data)
+                count += len(data)
+                pending += len(data)
+                if pending >= SaveSettings.ARCHIVE_CHUNK_ROWS:
+                    flush(writer)
+                    pending = 0
+            flush(writer)
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+    return count, aligner.dropped_count
+
+
+def main():
+    """ジャーナルからセッションを復元する"""
+    parser = argparse.ArgumentParser(
+        description='ジャーナルからセッションを復元する')
+    parser.add_argument('journal', help='ジャーナルのパス')
+    parser.add_argument('--archive', help='書き出すセッションアーカイブのパス')
+    parser.add_argument('--csv', help='CSVにも書き出すときのパス')
+    args = parser.parse_args()
+
+    count, dropped = recover(args.journal, args.archive, args.csv)
+    print(f"{count}行を復元しました (組にできず捨てた行: {dropped}行)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import json
+import math
+import threading
+
+import numpy as np
+
+from pkgs.common.constants import StatsSettings
+
+
+class StageTimer:
+    """1つの段の所要時間の統計
+
+    直近WINDOW個のサンプルを固定長の配列に持って百分位点を求め、
+    計測全体は2のべき乗 (us) ごとのビンのヒストグラムに数える。
+    record()は配列への代入と整数の加算だけなので、取得の経路で
+    呼んでも負担にならない。
+    """
+    def __init__(self, window=StatsSettings.WINDOW,
+                 bins=StatsSettings.HISTOGRAM_BINS):
+        """コンストラクタ
+
+        Keyword Arguments:
+            window -- 百分位点を求める直近のサンプル数
+                      (default: {StatsSettings.WINDOW})
+            bins -- ヒストグラムのビン数
+                    (default: {StatsSettings.HISTOGRAM_BINS})
+        """
+        self.recent = np.zeros(window)
+        self.histogram = [0] * bins  # ビンkは [2^(k-1), 2^k) us
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        """1回分の所要時間を記録する
+
+        Arguments:
+            seconds -- 所要時間 (s)
+        """
+        self.recent[self.count % len(self.recent)] = seconds
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        exponent = math.frexp(seconds * 1e6)[1] if seconds > 0 else 0
+        self.histogram[min(max(exponent, 0), len(self.histogram) - 1)] += 1
+
+    def percentiles(self, points=(50, 99)):
+        """直近のサンプルの百分位点 (s) を返す (サンプルが無ければNone)"""
+        samples = self.recent[:min(self.count, len(self.recent))]
+        if len(samples) == 0:
+            return [None] * len(points)
+        return np.percentile(samples, points).tolist()
+
+    def summary(self):
+        """記録の要約を辞書で返す"""
+        p50, p90, p99 = self.percentiles((50, 90, 99))
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.maximum,
+            'recent_p50': p50,
+            'recent_p90': p90,
+            'recent_p99': p99,
+            'histogram_us': {
+                f"<{2 ** k}": n for k, n in enumerate(self.histogram) if n},
+        }
+
+
+class LatencyStats:
+    """段ごとの所要時間をまとめて持つ統計
+
+    取得スレッドとGUIスレッドの両方から記録する。段の追加だけを
+    ロックで守り、記録自体はロックを取らない。
+    """
+    def __init__(self):
+        """コンストラクタ"""
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """記録を破棄する"""
+        with self._lock:
+            self.stages = {}
+
+    def stage(self, name):
+        """段の統計を返す (無ければ作る)"""
+        timer = self.stages.get(name)
+        if timer is None:
+            with self._lock:
+                timer = self.stages.setdefault(name, StageTimer())
+        return timer
+
+    def record(self, name, seconds):
+        """段の所要時間を記録する
+
+        Arguments:
+            name -- 段の名前
+            seconds -- 所要時間 (s)
+        """
+        self.stage(name).record(seconds)
+
+    def summary(self):
+        """すべての段の要約を辞書で返す"""
+        return {
+            'stages': {name: timer.summary()
+                       for name, timer in list(self.stages.items())},
+        }
+
+    def format_line(self, names):
+        """表示用に各段のp50/p99をms単位で1行にする"""
+        parts = []
+        for name in names:
+            timer = self.stages.get(name)
+            if timer is None or timer.count == 0:
+                continue
+            p50, p99 = timer.percentiles()
+            parts.append(f"{name} {p50 * 1e3:.2f}/{p99 * 1e3:.2f}")
+        return ' | '.join(parts)
+
+    def dump(self, path, extra=None):
+        """要約をJSONに書き出す
+
+        Arguments:
+            path -- 書き出すパス
+
+        Keyword Arguments:
+            extra -- 要約に加える値 (default: {None})
+        """
+        summary = self.summary()
+        summary.update(extra or {})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
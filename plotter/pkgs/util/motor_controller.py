@@ -1,46 +1,62 @@
-from PyQt6.QtCore import QObject, pyqtSignal
 from .serial_manager import SerialManager
+from .signal import Signal
 
 from pkgs.common.constants import Commands as Commands
 
 
-class MotorController(QObject):
-    """モーターコントローラ"""
+class MotorController:
+    """モーターコントローラ
 
-    motor1_reversed_signal = pyqtSignal()
-    motor2_reversed_signal = pyqtSignal()
+    Qtに依存しないので、ヘッドレスの取得でもそのまま使える。
+    """
 
-    def __init__(self, serial_manager: SerialManager):
+    def __init__(self, serial_manager: SerialManager, writer=None):
         """コンストラクタ
 
         Arguments:
             serial_manager -- SerialManagerオブジェクト
+
+        Keyword Arguments:
+            writer -- コマンドを別スレッドで送るMotorCommandWriter
+                      (Noneならその場で書き込む) (default: {None})
         """
-        super().__init__()
         self.sm = serial_manager
+        self.writer = writer
+        self.motor1_reversed_signal = Signal()
+        self.motor2_reversed_signal = Signal()
+
+    def send(self, command: Commands):
+        """コマンドを送る (書き込みスレッドがあれば積むだけで戻る)
+
+        Returns: 積んだMotorCommand (その場で書き込んだときはNone)
+        """
+        if self.writer is not None:
+            return self.writer.send(command)
+        self.sm.write(command)
+        return None
 
     def start_motor1(self):
         """モーター1を開始する"""
-        self.sm.write(Commands.MOTOR_START1)
+        self.send(Commands.MOTOR_START1)
 
     def stop_motor1(self):
         """モーター1を停止する"""
-        self.sm.write(Commands.MOTOR_STOP1)
+        self.send(Commands.MOTOR_STOP1)
 
     def reverse_motor1(self):
         """モーター1を反転する"""
-        self.sm.write(Commands.MOTOR_REVERSE1)
+        self.send(Commands.MOTOR_REVERSE1)
         self.motor1_reversed_signal.emit()
 
     def start_motor2(self):
         """モーター2を開始する"""
-        self.sm.write(Commands.MOTOR_START2)
+        self.send(Commands.MOTOR_START2)
 
     def stop_motor2(self):
         """モーター2を停止する"""
-        self.sm.write(Commands.MOTOR_STOP2)
+        self.send(Commands.MOTOR_STOP2)
 
     def reverse_motor2(self):
         """モーター2を反転する"""
-        self.sm.write(Commands.MOTOR_REVERSE2)
+        self.send(Commands.MOTOR_REVERSE2)
         self.motor2_reversed_signal.emit()
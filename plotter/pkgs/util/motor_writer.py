@@ -0,0 +1,206 @@
+import queue
+import threading
+import time
+
+from pkgs.common.constants import Commands, MotorSettings
+from pkgs.util.serial_manager import SerialManager, SerialManagerError
+
+
+START, STOP, REVERSE = 'start', 'stop', 'reverse'
+QUEUED, SENT, COALESCED, FAILED = 'queued', 'sent', 'coalesced', 'failed'
+
+# コマンドから (モータ番号, 動作)
+ACTIONS = {
+    Commands.MOTOR_START1: (1, START),
+    Commands.MOTOR_STOP1: (1, STOP),
+    Commands.MOTOR_REVERSE1: (1, REVERSE),
+    Commands.MOTOR_START2: (2, START),
+    Commands.MOTOR_STOP2: (2, STOP),
+    Commands.MOTOR_REVERSE2: (2, REVERSE),
+}
+
+
+class MotorCommand:
+    """モータへの1つのコマンドとその時刻
+
+    queued_at -- 送信を頼んだ時刻 (time.monotonic())
+    sent_at -- 書き込みを終えた時刻 (送っていなければNone)
+    status -- QUEUED, SENT, COALESCEDまたはFAILED
+    """
+    def __init__(self, command: Commands, queued_at):
+        """コンストラクタ"""
+        self.command = command
+        self.queued_at = queued_at
+        self.sent_at = None
+        self.status = QUEUED
+
+
+def coalesce(commands):
+    """まとめて送るコマンドから冗長なものを除く
+
+    モータごとに、開始と停止が反転を挟まずに続いたときは最後の1つ
+    だけを送り、開始や停止を挟まない反転の対は打ち消す。
+    デバイスでの最終的な状態は変わらない。
+
+    Arguments:
+        commands -- MotorCommandのリスト (頼んだ順)
+
+    Returns: 送るMotorCommandのリスト (頼んだ順)
+    """
+    kept = []
+    last_run = {}  # モータ番号から、反転の後の最後の開始/停止の位置
+    last_reverse = {}  # モータ番号から、開始/停止を挟まない反転の位置
+    for command in commands:
+        motor, action = ACTIONS.get(command.command, (None, None))
+        if motor is None:
+            kept.append(command)
+        elif action == REVERSE:
+            if last_reverse.get(motor) is not None:
+                kept[last_reverse.pop(motor)] = None  # 反転の対を打ち消す
+                continue
+            last_run.pop(motor, None)
+            kept.append(command)
+            last_reverse[motor] = len(kept) - 1
+        else:
+            if last_run.get(motor) is not None:
+                kept[last_run[motor]] = None
+            last_reverse.pop(motor, None)
+            kept.append(command)
+            last_run[motor] = len(kept) - 1
+    return [command for command in kept if command is not None]
+
+
+class MotorCommandWriter(threading.Thread):
+    """モータへのコマンドをGUIスレッドから切り離して送る書き込みスレッド
+
+    send()はキューに積むだけですぐに戻る。スレッドは書き込みの
+    あいだに溜まったコマンドをまとめて取り出し、coalesce()で冗長な
+    ものを除いてから送る。各コマンドの時刻と結果はdrain()で取り出す。
+    """
+    def __init__(self, sm: SerialManager,
+                 queue_size=MotorSettings.QUEUE_SIZE):
+        """コンストラクタ
+
+        Arguments:
+            sm -- 書き込むSerialManagerオブジェクト (ESP32側)
+
+        Keyword Arguments:
+            queue_size -- キューの上限 (default: {MotorSettings.QUEUE_SIZE})
+        """
+        super().__init__(daemon=True)
+        self.sm = sm
+        self.commands = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue()  # 送信を終えたMotorCommand
+        self.errors = queue.Queue()  # エラーメッセージ
+        self._stop_event = threading.Event()
+
+    def send(self, command: Commands):
+        """コマンドを送信のキューに積む
+
+        Arguments:
+            command -- モータ制御コマンド
+
+        Returns: 積んだMotorCommand
+
+        Raises:
+            MotorWriterError: キューが満杯
+        """
+        item = MotorCommand(command, time.monotonic())
+        try:
+            self.commands.put_nowait(item)
+        except queue.Full:
+            item.status = FAILED
+            self.results.put(item)
+            raise MotorWriterError(
+                f"送信待ちのコマンドが多すぎます ({command.name})")
+        return item
+
+    def run(self):
+        """溜まったコマンドをまとめて送るループ"""
+        while not self._stop_event.is_set():
+            try:
+                first = self.commands.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while True:
+                try:
+                    batch.append(self.commands.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self.commands.task_done()
+
+    def flush(self, timeout=MotorSettings.FLUSH_TIMEOUT):
+        """積んだコマンドをすべて送り終えるまで待つ
+
+        Keyword Arguments:
+            timeout -- 待つ時間の上限 (s)
+                       (default: {MotorSettings.FLUSH_TIMEOUT})
+
+        Returns: 送り終えたか
+        """
+        deadline = time.monotonic() + timeout
+        with self.commands.all_tasks_done:
+            while self.commands.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.commands.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self):
+        """溜まったコマンドを送り終えてからスレッドを止める"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        batch = []
+        while True:
+            try:
+                batch.append(self.commands.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+            for _ in batch:
+                self.commands.task_done()
+
+    def drain(self):
+        """送信を終えたMotorCommandをすべて取り出す"""
+        items = []
+        while True:
+            try:
+                items.append(self.results.get_nowait())
+            except queue.Empty:
+                return items
+
+    def drain_errors(self):
+        """溜まったエラーメッセージをすべて取り出す"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.errors.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _write(self, batch):
+        """冗長なコマンドを除いて順に書き込む"""
+        kept = coalesce(batch)
+        kept_ids = {id(item) for item in kept}
+        for item in batch:
+            if id(item) in kept_ids:
+                try:
+                    self.sm.write(item.command)
+                    item.sent_at = time.monotonic()
+                    item.status = SENT
+                except SerialManagerError as e:
+                    item.status = FAILED
+                    self.errors.put(str(e))
+            else:
+                item.status = COALESCED
+            self.results.put(item)
+
+
+class MotorWriterError(Exception):
+    pass
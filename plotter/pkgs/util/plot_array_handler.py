@@ -1,59 +1,469 @@
+import os
+import re
+import shutil
+from operator import le
+
 import numpy as np
-import pandas as pd
 
-from pkgs.common.constants import ArithmeticConstants, DataProperties
+from pkgs.common.constants import (AcquisitionSettings, ArithmeticConstants,
+                                   AlignmentSettings, DataProperties,
+                                   RangeValues, SaveSettings)
+from pkgs.util.compact_buffer import CompactBuffer, column_limits
+from pkgs.util.csv_writer import StreamingCsvWriter
+from pkgs.util.session_archive import SessionArchiveWriter
+from pkgs.util.sample_buffer import SampleBuffer, RingBuffer
+from pkgs.util.spool_buffer import SpoolBuffer
+
+# 数値3つをカンマで区切った1行
+# float()は'1_0'や全角・アラビア数字も受け付けるので、ASCIIの数字に限る
+# 桁の区切り方が1通りになるように書く (不正な行でのバックトラックを抑える)
+_NUMBER = (r'[ \t]*[-+]?(?:(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)'
+           r'(?:[eE][-+]?[0-9]+)?|(?i:nan|inf|infinity))[ \t]*')
+_LINE = f'{_NUMBER},{_NUMBER},{_NUMBER}'
+_LINE_PATTERN = re.compile(_LINE)
+# 1行ずつの検査と同じ行の並び (ブロックの成否が他の行によらないように)
+_BLOCK_PATTERN = re.compile(f'(?:{_LINE}\n)*')
+_INVALID_ROW = (np.nan,) * 6  # 不正な組の行
+# どちらの保存用配列にも同じ行が入るよう、CompactLayoutの型で持てない値
+# (NaNや無限大、ADCの範囲を大きく外れた値) を含む行も不正として扱う
+_LOWER, _UPPER = column_limits()
 
 
 class PlotArrayHandler:
     """プロットに使う配列のハンドリング
     """
-    def __init__(self):
-        """コンストラクタ"""
+    def __init__(self, spool=False, compact=False):
+        """コンストラクタ
+
+        Keyword Arguments:
+            spool -- 計測値をメモリでなくスプールファイルに持つ
+                     (default: {False})
+            compact -- 計測値をメモリ上に生の値の小さい型で持つ
+                       (default: {False})
+        """
+        self.spool = spool
+        self.compact = compact
+        self.scroll_mode = False
+        self.scroll_buffer = RingBuffer(capacity=RangeValues.SCROLL_CAPACITY)
+        self.autosave: StreamingCsvWriter = None
+        self.data_buffer = None
         self.reset_data()
 
     def reset_data(self):
         """データをリセット"""
-        self.data_array = np.empty((0, 6))  # t, y1, y2, y3, y4, y5
-        self.plot_array = np.empty((0, 6))  # t, y1, y2, y3, y4, y5
+        try:
+            self.stop_autosave()
+        except PlotArrayHandlerError:
+            pass  # 破棄するデータの保存失敗は報告済み
+        self.autosave = None
+        self.autosave_queued = 0  # 自動保存に渡した行数
+        if self.spooling:
+            self.data_buffer.sync()  # ファイルは計測の記録として残す
+        # t, y1, y2, y3, y4, y5
+        self.data_buffer = CompactBuffer() if self.compact else SampleBuffer()
+        self.scroll_buffer.clear()
+        self._time_offset = 0.0  # micros()の周回分の補正 (s)
+        self._last_time = None
+
+    @property
+    def spooling(self):
+        """計測値をスプールファイルに持っているか"""
+        return isinstance(self.data_buffer, SpoolBuffer)
+
+    @property
+    def data_array(self):
+        """保存用配列 (N行×6列のビュー)"""
+        return self.data_buffer.rows()
+
+    @property
+    def plot_array(self):
+        """表示用配列 (N行×6列)"""
+        if self.scroll_mode:
+            return self.scroll_buffer.rows()
+        return self.data_buffer.rows()
+
+    def set_scroll_mode(self, enabled):
+        """スクロール表示を切り替える
+
+        スクロール表示では、保存用配列とは別の固定長のリングバッファに
+        直近の行だけを持ち、それを表示する。
+
+        Arguments:
+            enabled -- スクロール表示にするか
+        """
+        if enabled and not self.scroll_mode:
+            self.scroll_buffer.clear()
+            self.scroll_buffer.extend(self.data_buffer.rows())
+        self.scroll_mode = enabled
+
+    def plot_columns(self):
+        """表示用の列ごとの配列を返す
+
+        間引きは描画側で行うので、通常は保存用配列をそのまま表示する。
+        生の値で持っているときは、描画側が切り出した範囲だけを換算する。
+        スクロール表示では、リングバッファのビューが次の追加で書き換わる
+        ので、表示する直近SCROLL_WINDOW秒 (とその直前の1行) をコピーして
+        返す。
+        """
+        if self.scroll_mode:
+            columns = self.scroll_buffer.columns()
+            t = columns[0]
+            start = 0
+            if len(t):
+                start = max(int(np.searchsorted(
+                    t, t[-1] - RangeValues.SCROLL_WINDOW)) - 1, 0)
+            return columns[:, start:].copy()
+        return self.data_buffer.columns()
 
     def process_data(self, input1, input2):
-        """一時データの切り出しと加工"""
-        try:
-            tmp3, tmp4, tmp6 = input1.split(",")
-            tmp5, tmp1, tmp2 = input2.split(",")
-            tmp1 = float(tmp1) * 3.3 / 4095
-            tmp2 = float(tmp2) * 3.3 / 4095
-            tmp3 = float(tmp3)
-            tmp4 = float(tmp4)
-            tmp5 = float(tmp5) * 3.3 / 4095
-            tmp6 = float(tmp6) * ArithmeticConstants.MICRO
-            return np.array([tmp6, tmp1, tmp2, tmp3, tmp4, tmp5])
+        """一時データの切り出しと加工 (1組分)
+
+        Returns: 1行分の配列 (不正な行ならNone)
+        """
+        data, mask = self.process_batch([input1], [input2])
+        return data[0] if mask[0] else None
+
+    @staticmethod
+    def process_batch(lines1, lines2):
+        """N組の行をまとめて切り出して加工する
+
+        ESP32の行 (disp1, disp2, micros) とRP2040の行 (d, f1, f2) を
+        組にし、ADC値の電圧換算と時刻の秒換算を配列演算で行う。
+
+        Arguments:
+            lines1 -- ESP32側の行のリスト
+            lines2 -- RP2040側の行のリスト (lines1と同じ長さ)
+
+        Returns: ((N, 6)の配列, 長さNの有効行マスク)
+            不正な組 (NaNや型に収まらない値を含む組も) の行はNaNで埋める
+        """
+        if len(lines1) != len(lines2):
+            raise ValueError(
+                f"行数が一致しません: {len(lines1)}, {len(lines2)}")
+        n = len(lines1)
+        if n <= AcquisitionSettings.SMALL_BATCH:
+            return PlotArrayHandler._process_small(lines1, lines2)
+        esp = PlotArrayHandler._parse_block(lines1)
+        rp = PlotArrayHandler._parse_block(lines2)
+        if esp is not None and rp is not None:
+            mask = np.ones(n, dtype=bool)
+            valid = slice(None)
+        else:
+            # 不正な行を含むブロックだけ1行ずつ検査し直す
+            mask = np.fromiter(
+                (_LINE_PATTERN.fullmatch(line) is not None
+                 and _LINE_PATTERN.fullmatch(other) is not None
+                 for line, other in zip(lines1, lines2)), bool, n)
+            valid_flags = mask.tolist()
+            esp = PlotArrayHandler._parse_block(
+                [line for line, ok in zip(lines1, valid_flags) if ok])
+            rp = PlotArrayHandler._parse_block(
+                [line for line, ok in zip(lines2, valid_flags) if ok])
+            valid = np.flatnonzero(mask)
+
+        data = np.full((n, 6), np.nan)
+        adc = rp * ArithmeticConstants.ADC_VREF / ArithmeticConstants.ADC_MAX
+
+        data[valid, 0] = esp[:, 2] * ArithmeticConstants.MICRO  # Time
+        data[valid, 1] = adc[:, 1]  # Force1
+        data[valid, 2] = adc[:, 2]  # Force
+        data[valid, 3] = esp[:, 0]  # Disp1
+        data[valid, 4] = esp[:, 1]  # Disp2
+        data[valid, 5] = adc[:, 0]  # Sensor
+        inside = ((data >= _LOWER) & (data <= _UPPER)).all(axis=1)
+        if not inside.all():
+            mask &= inside
+            data[~mask] = np.nan
+        return data, mask
+
+    @staticmethod
+    def _process_small(lines1, lines2):
+        """少ない行を1組ずつ切り出して加工する
+
+        行をつなげて配列にする手間は行数によらずかかるので、1回の
+        読み取りで届くような数行ではこちらが速い。検査と換算の順は
+        process_batchと同じなので、結果も一致する。
+        """
+        vref = ArithmeticConstants.ADC_VREF
+        vmax = ArithmeticConstants.ADC_MAX
+        micro = ArithmeticConstants.MICRO
+        match = _LINE_PATTERN.fullmatch
+        rows = []
+        mask = []
+        for line1, line2 in zip(lines1, lines2):
+            if match(line1) is None or match(line2) is None:
+                rows.append(_INVALID_ROW)
+                mask.append(False)
+                continue
+            disp1, disp2, micros, sensor, force1, force = map(
+                float, f'{line1},{line2}'.split(','))
+            row = (micros * micro, force1 * vref / vmax,
+                   force * vref / vmax, disp1, disp2, sensor * vref / vmax)
+            ok = all(map(le, _LOWER, row)) and all(map(le, row, _UPPER))
+            rows.append(row if ok else _INVALID_ROW)
+            mask.append(ok)
+        return (np.array(rows, dtype=float).reshape(-1, 6),
+                np.array(mask, dtype=bool))
+
+    @staticmethod
+    def _parse_block(lines):
+        """全行をつなげて一度に数値化する
+
+        Returns: (行数, 3)の配列 (_LINE_PATTERNに合わない行があればNone)
+        """
+        if not lines:
+            return np.empty((0, 3))
+        text = '\n'.join(lines) + '\n'
+        if _BLOCK_PATTERN.fullmatch(text) is None:
+            return None
+        try:
+            return np.array(text[:-1].replace('\n', ',').split(','),
+                            dtype=float).reshape(-1, 3)
         except ValueError:
             return None
 
+    def unwrap_time(self, data):
+        """micros()の周回で戻った時刻をつなげる (その場で書き換える)
+
+        micros()は約71分で一周するので、前の行より半周以上戻った行から
+        一周分を足していく。
+
+        Arguments:
+            data -- process_batchが返した(N, 6)の配列
+        """
+        t = data[:, 0]
+        if len(t) == 0:
+            return
+        wrap = AlignmentSettings.MICROS_WRAP * ArithmeticConstants.MICRO
+        last = t[0] if self._last_time is None else self._last_time
+        previous = np.concatenate(([last], t[:-1]))
+        wraps = np.cumsum(t - previous < -wrap / 2)
+        self._last_time = t[-1]
+        t += self._time_offset + wraps * wrap
+        self._time_offset += wraps[-1] * wrap
+
+    def start_spool(self, file_name):
+        """計測値をout/以下のスプールファイルに持つように切り替える
+
+        スプールファイルは作るときに中身を消すので、前の計測のファイルを
+        消さないよう、file_nameには計測ごとに重ならない名前を渡す。
+
+        Arguments:
+            file_name -- スプールファイル名 (拡張子なし)
+        """
+        if self.spooling:
+            self.data_buffer.sync()
+        try:
+            buffer = SpoolBuffer(
+                f"{SaveSettings.OUT_DIR}/{file_name}.spool")
+        except Exception as e:
+            raise self._save_error(e)
+        buffer.extend(self.data_buffer.rows())
+        self.data_buffer = buffer
+
+    def sync_spool(self):
+        """スプールファイルに書いた行をディスクに反映する"""
+        if not self.spooling:
+            return
+        try:
+            self.data_buffer.sync()
+        except Exception as e:
+            raise self._save_error(e)
+
     def update_arrays(self, data):
-        """保存用配列に値を追加"""
-        self.data_array = np.vstack((self.data_array, data))
+        """保存用配列に値を追加 (1行または行ブロック)
+
+        自動保存中はCHUNK_ROWS行たまるごとに書き込みスレッドへ渡す。
+        """
+        self.data_buffer.extend(data)
+        if self.autosave is not None and self.autosave.is_alive():
+            self._queue_autosave()
 
     def update_plts(self, data):
-        """表示用配列に値を追加"""
-        self.plot_array = np.vstack((self.plot_array, data))
-        return self.plot_array.T  # 転置して、個別の配列として返す
+        """表示用配列に値を追加して返す
+
+        通常はdataがupdate_arraysで保存用配列に追加済みなので、
+        スクロール表示のときだけリングバッファに追加する。
+        """
+        if self.scroll_mode:
+            self.scroll_buffer.extend(data)
+        return self.plot_columns()  # 列ごとの配列として返す
+
+    def start_autosave(self, file_name, metadata=None):
+        """計測中にCSVとセッションアーカイブへ追記していく自動保存を始める
+
+        CSVとアーカイブは保存先と別の「ファイル名.partial.csv」と
+        「ファイル名.partial.kes」に書き、save_to_csvとsave_archiveで
+        保存先の名前に変える。前の計測の保存を上書きしないよう、
+        file_nameには計測ごとに重ならない名前を渡す。
+
+        Arguments:
+            file_name -- 自動保存のファイル名 (拡張子なし)
+
+        Keyword Arguments:
+            metadata -- セッションアーカイブのメタデータ (default: {None})
+        """
+        self.stop_autosave()
+        archive = None
+        try:
+            archive = SessionArchiveWriter(
+                self._partial_path(file_name, SaveSettings.ARCHIVE_SUFFIX),
+                metadata)
+            self.autosave = StreamingCsvWriter(
+                self._partial_path(file_name, '.csv'), archive)
+        except Exception as e:
+            if archive is not None:
+                archive.close()
+            raise self._save_error(e)
+        self.autosave_queued = 0
+        self.autosave.start()
+        self._queue_autosave(flush=True)  # 既にある行から書く
+
+    def stop_autosave(self):
+        """残りの行を書き出して自動保存を終える
+
+        書き終えたファイルは、後のsave_to_csvでそのまま使う。
+        """
+        if self.autosave is None or not self.autosave.is_alive():
+            return
+        self._queue_autosave(flush=True)
+        try:
+            self.autosave.close()
+        except Exception as e:
+            raise self._save_error(e)
+
+    def _queue_autosave(self, flush=False):
+        """まだ渡していない行を書き込みスレッドに渡す
+
+        保存用配列は追加しかしないので、渡すのはコピーしないビューでよい。
+        生の値で持っているときは渡す範囲だけを換算したコピーになる。
+
+        Keyword Arguments:
+            flush -- CHUNK_ROWSに満たない残りも渡す (default: {False})
+        """
+        pending = len(self.data_buffer) - self.autosave_queued
+        if not flush:
+            pending -= pending % SaveSettings.CHUNK_ROWS
+        if pending <= 0:
+            return
+        start = self.autosave_queued
+        self.autosave.write(self.data_buffer.rows(start, start + pending))
+        self.autosave_queued += pending
 
     def save_to_csv(self, file_name):
-        """データをCSVに保存する"""
+        """データをCSVに保存する
+
+        自動保存のファイルがすべての行を含んでいれば、残りを書き出して
+        済ませる。書き終えた自動保存のファイル (.partial.csv) は保存先の
+        名前に変え、計測中や保存済みのファイルからはコピーする。
+        """
+        path = self._csv_path(file_name)
         try:
+            if self._autosave_covers_data():
+                alive = self.autosave.is_alive()
+                if alive:
+                    self._queue_autosave(flush=True)
+                    self.autosave.flush()
+                source = self.autosave.path
+                if os.path.abspath(source) == os.path.abspath(path):
+                    return
+                if alive or not self._is_partial(source):
+                    shutil.copyfile(source, path)
+                else:
+                    os.replace(source, path)
+                    self.autosave.path = path
+                return
+            import pandas as pd  # 起動を速くするため保存時に読み込む
             data = pd.DataFrame(self.data_array,
                                 columns=DataProperties.list_properties())
-            data.to_csv(f"out/{file_name}.csv", index=False)
-        except FileNotFoundError as e:
-            raise PlotArrayHandlerError(f"ファイルが見つかりません: {e}")
-        except PermissionError as e:
-            raise PlotArrayHandlerError(f"パーミッションがありません: {e}")
-        except ValueError as e:
-            raise PlotArrayHandlerError(f"カラムまたは数値に不正な値が含まれています: {e}")
+            data.to_csv(path, index=False)
+        except Exception as e:
+            raise self._save_error(e)
+
+    def save_archive(self, file_name, metadata=None):
+        """データをセッションアーカイブに保存する
+
+        自動保存のアーカイブがすべての行を含んでいれば、それを使う。
+        計測中のアーカイブは索引を閉じるときに書くので、索引を付けた
+        写しを作る。書き終えた自動保存のアーカイブ (.partial.kes) は
+        保存先の名前に変え、保存済みのアーカイブからはコピーする。
+
+        Arguments:
+            file_name -- 保存するファイル名 (拡張子なし)
+
+        Keyword Arguments:
+            metadata -- ヘッダに書くメタデータ (default: {None})
+        """
+        path = self._archive_path(file_name)
+        try:
+            archive = self.autosave and self.autosave.archive
+            if archive is not None and self._autosave_covers_data():
+                same = os.path.abspath(archive.path) == os.path.abspath(path)
+                if self.autosave.is_alive():
+                    self._queue_autosave(flush=True)
+                    self.autosave.flush()
+                    if not same:
+                        archive.snapshot(path)
+                elif same:
+                    pass
+                elif self._is_partial(archive.path):
+                    os.replace(archive.path, path)
+                    archive.path = path
+                else:
+                    shutil.copyfile(archive.path, path)
+                return
+            with SessionArchiveWriter(path, metadata) as writer:
+                chunk_rows = SaveSettings.ARCHIVE_CHUNK_ROWS
+                for start in range(0, len(self.data_buffer), chunk_rows):
+                    writer.write_chunk(
+                        self.data_buffer.rows(start, start + chunk_rows))
         except Exception as e:
-            raise PlotArrayHandlerError(f"計測値ハンドラの予期しないエラーです: {e}")
+            raise self._save_error(e)
+
+    def _autosave_covers_data(self):
+        """自動保存のファイルで保存を済ませられるか"""
+        if self.autosave is None or self.autosave.error is not None:
+            return False
+        if self.autosave.is_alive():
+            return True
+        return self.autosave.written == len(self.data_buffer)
+
+    @staticmethod
+    def _csv_path(file_name):
+        """保存先のCSVファイルのパス"""
+        return f"{SaveSettings.OUT_DIR}/{file_name}.csv"
+
+    @staticmethod
+    def _partial_path(file_name, suffix):
+        """保存する前の自動保存のファイルのパス"""
+        return (f"{SaveSettings.OUT_DIR}/{file_name}"
+                f"{SaveSettings.PARTIAL_SUFFIX}{suffix}")
+
+    @staticmethod
+    def _is_partial(path):
+        """保存する前の自動保存のファイルか"""
+        stem = os.path.splitext(path)[0]
+        return stem.endswith(SaveSettings.PARTIAL_SUFFIX)
+
+    @staticmethod
+    def _archive_path(file_name):
+        """保存先のセッションアーカイブのパス"""
+        return (f"{SaveSettings.OUT_DIR}/{file_name}"
+                f"{SaveSettings.ARCHIVE_SUFFIX}")
+
+    @staticmethod
+    def _save_error(e):
+        """保存時の例外をPlotArrayHandlerErrorに置き換える"""
+        if isinstance(e, PlotArrayHandlerError):
+            return e
+        if isinstance(e, FileNotFoundError):
+            return PlotArrayHandlerError(f"ファイルが見つかりません: {e}")
+        if isinstance(e, PermissionError):
+            return PlotArrayHandlerError(f"パーミッションがありません: {e}")
+        if isinstance(e, ValueError):
+            return PlotArrayHandlerError(
+                f"カラムまたは数値に不正な値が含まれています: {e}")
+        return PlotArrayHandlerError(f"計測値ハンドラの予期しないエラーです: {e}")
 
 
 class PlotArrayHandlerError(Exception):
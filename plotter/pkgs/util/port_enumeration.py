@@ -0,0 +1,73 @@
+from pkgs.common.constants import DeviceIds
+
+
+ESP32 = 'ESP32'
+RP2040 = 'RP2040'
+
+
+class PortInfo:
+    """列挙したシリアルポート
+
+    device -- ポート名
+    vid, pid -- USBのVID/PID (USBでなければNone)
+    kind -- VID/PIDから見分けたデバイス (ESP32, RP2040またはNone)
+    """
+    def __init__(self, device, vid=None, pid=None):
+        """コンストラクタ"""
+        self.device = device
+        self.vid = vid
+        self.pid = pid
+        self.kind = device_kind(vid, pid)
+
+    def __eq__(self, other):
+        return (isinstance(other, PortInfo) and
+                (self.device, self.vid, self.pid) ==
+                (other.device, other.vid, other.pid))
+
+    def __hash__(self):
+        return hash((self.device, self.vid, self.pid))
+
+    @property
+    def label(self):
+        """コンボボックスに表示する名前"""
+        return f"{self.device} ({self.kind})" if self.kind else self.device
+
+
+def device_kind(vid, pid):
+    """VID/PIDからデバイスを見分ける
+
+    Returns: ESP32, RP2040 (見分けられなければNone)
+    """
+    if (vid, pid) in DeviceIds.ESP32:
+        return ESP32
+    if (vid, pid) in DeviceIds.RP2040:
+        return RP2040
+    return None
+
+
+def enumerate_ports():
+    """シリアルポートを列挙する
+
+    環境によって時間がかかるので、GUIスレッドからは呼ばない。
+
+    Returns: ポート名からPortInfoへの辞書
+    """
+    import serial.tools.list_ports  # 起動を速くするため使うときに読み込む
+    return {port.device: PortInfo(port.device, port.vid, port.pid)
+            for port in serial.tools.list_ports.comports()}
+
+
+def diff_ports(old, new):
+    """2回の列挙の差を返す
+
+    Arguments:
+        old -- 前回のポート名からPortInfoへの辞書
+        new -- 今回のポート名からPortInfoへの辞書
+
+    Returns: (加わったPortInfoのリスト, 無くなったPortInfoのリスト)
+             (VID/PIDが変わったポートは両方に入る)
+    """
+    added = [info for device, info in new.items() if old.get(device) != info]
+    removed = [info for device, info in old.items()
+               if new.get(device) != info]
+    return added, removed
@@ -0,0 +1,369 @@
+import csv
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+
+from pkgs.common.constants import Commands, DataProperties, ProgramSettings
+from pkgs.util.motor_controller import MotorController
+from pkgs.util.motor_writer import MotorWriterError
+from pkgs.util.serial_manager import SerialManagerError
+
+
+START, STOP, REVERSE = 'start', 'stop', 'reverse'
+WAIT, WAIT_UNTIL, REPEAT = 'wait', 'wait_until', 'repeat'
+
+MOTOR_COMMANDS = {
+    (START, 1): Commands.MOTOR_START1,
+    (STOP, 1): Commands.MOTOR_STOP1,
+    (REVERSE, 1): Commands.MOTOR_REVERSE1,
+    (START, 2): Commands.MOTOR_START2,
+    (STOP, 2): Commands.MOTOR_STOP2,
+    (REVERSE, 2): Commands.MOTOR_REVERSE2,
+}
+
+
+class Step:
+    """負荷プログラムの1ステップ
+
+    action -- start, stop, reverse (motorのモータに送る)、
+              wait (seconds秒待つ)、
+              wait_until (columnがvalueを超える/下回るまで待つ)、
+              repeat (stepsをcount回繰り返す)
+    """
+    def __init__(self, action, motor=None, seconds=None, column=None,
+                 value=None, above=True, timeout=None, count=None,
+                 steps=()):
+        """コンストラクタ"""
+        self.action = action
+        self.motor = motor
+        self.seconds = seconds
+        self.column = column
+        self.index = (DataProperties.get_key(column) - 1
+                      if column is not None else None)
+        self.value = value
+        self.above = above
+        self.timeout = timeout
+        self.count = count
+        self.steps = list(steps)
+
+    def describe(self):
+        """記録に書く説明"""
+        if self.action in (START, STOP, REVERSE):
+            return f"{self.action} {self.motor}"
+        if self.action == WAIT:
+            return f"wait {self.seconds}"
+        if self.action == WAIT_UNTIL:
+            return (f"wait_until {self.column} "
+                    f"{'>' if self.above else '<'} {self.value}")
+        return f"repeat {self.count}"
+
+
+class Program:
+    """負荷プログラム (ステップの並び)"""
+    def __init__(self, steps, name='program'):
+        """コンストラクタ
+
+        Arguments:
+            steps -- Stepのリスト
+
+        Keyword Arguments:
+            name -- プログラムの名前 (default: {'program'})
+        """
+        self.steps = list(steps)
+        self.name = name
+
+
+def parse_step(item):
+    """辞書からStepを作る
+
+    Raises:
+        ProgramError: ステップが正しくない
+    """
+    if not isinstance(item, dict):
+        raise ProgramError(f"ステップは辞書で書いてください: {item!r}")
+    action = item.get('action')
+    try:
+        if action in (START, STOP, REVERSE):
+            motor = int(item['motor'])
+            if (action, motor) not in MOTOR_COMMANDS:
+                raise ProgramError(f"モータは1か2です: {item!r}")
+            return Step(action, motor=motor)
+        if action == WAIT:
+            seconds = float(item['seconds'])
+            if seconds < 0:
+                raise ProgramError(f"待つ時間が負です: {item!r}")
+            return Step(action, seconds=seconds)
+        if action == WAIT_UNTIL:
+            column = item['column']
+            key = DataProperties.get_key(column)
+            if key is None or key == 1:
+                raise ProgramError(f"条件に使えない列です: {column}")
+            if ('above' in item) == ('below' in item):
+                raise ProgramError(
+                    f"aboveかbelowのどちらかを書いてください: {item!r}")
+            above = 'above' in item
+            timeout = item.get('timeout')
+            return Step(action, column=column,
+                        value=float(item['above' if above else 'below']),
+                        above=above,
+                        timeout=None if timeout is None else float(timeout))
+        if action == REPEAT:
+            count = int(item['count'])
+            if count < 1:
+                raise ProgramError(f"繰り返しの回数は1以上です: {item!r}")
+            return Step(action, count=count,
+                        steps=[parse_step(step) for step in item['steps']])
+    except KeyError as e:
+        raise ProgramError(f"ステップに{e}がありません: {item!r}")
+    except (TypeError, ValueError) as e:
+        raise ProgramError(f"ステップの値が正しくありません: {item!r} ({e})")
+    raise ProgramError(f"ステップの種類が正しくありません: {action!r}")
+
+
+def load_program(path):
+    """JSONファイルから負荷プログラムを読む
+
+    書式:
+        {"name": "tensile",
+         "steps": [
+            {"action": "repeat", "count": 3, "steps": [
+                {"action": "start", "motor": 1},
+                {"action": "wait_until", "column": "Force", "above": 2.5,
+                 "timeout": 60},
+                {"action": "stop", "motor": 1},
+                {"action": "reverse", "motor": 1},
+                {"action": "start", "motor": 1},
+                {"action": "wait_until", "column": "Disp1", "below": 0},
+                {"action": "stop", "motor": 1},
+                {"action": "reverse", "motor": 1},
+                {"action": "wait", "seconds": 1.0}]}]}
+
+    Raises:
+        ProgramError: ファイルが読めないか、プログラムが正しくない
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ProgramError(f"プログラムを読めませんでした: {e}")
+    if not isinstance(data, dict) or 'steps' not in data:
+        raise ProgramError("プログラムにstepsがありません")
+    return Program([parse_step(step) for step in data['steps']],
+                   data.get('name', 'program'))
+
+
+class StepRecord:
+    """ステップを実行した記録
+
+    scheduled -- 実行するはずだった時刻 (time.perf_counter())
+    executed -- 実行した時刻 (time.perf_counter())
+    executed_at -- 実行した時刻 (time.monotonic()、時間軸の変換用)
+    """
+    def __init__(self, number, step: Step, cycle, scheduled, executed):
+        """コンストラクタ"""
+        self.number = number
+        self.step = step
+        self.cycle = cycle
+        self.scheduled = scheduled
+        self.executed = executed
+        self.executed_at = time.monotonic()
+        self.command = None  # 頼んだMotorCommand
+        self.value = None  # wait_untilで条件を満たした値
+
+    @property
+    def jitter(self):
+        """実行した時刻の遅れ (s)"""
+        return self.executed - self.scheduled
+
+
+class ProgramRunner(threading.Thread):
+    """負荷プログラムを実行するタイミングスレッド
+
+    ステップの時刻は、待ち時間を前のステップの予定時刻に足して
+    決めるので、繰り返しても遅れが積み重ならない。wait_untilは
+    取得スレッドがprocess()で条件を満たした行を見つけた時刻を
+    次の予定時刻にする。時刻の直前まではスリープし、最後の
+    SPIN_TIMEだけ待ち続けて1 ms未満の遅れで実行する。
+    """
+    def __init__(self, program: Program, mc: MotorController, stats=None):
+        """コンストラクタ
+
+        Arguments:
+            program -- 実行するProgram
+            mc -- コマンドを送るMotorControllerオブジェクト
+
+        Keyword Arguments:
+            stats -- 遅れを記録するLatencyStatsオブジェクト (default: {None})
+        """
+        super().__init__(daemon=True)
+        self.program = program
+        self.mc = mc
+        self.stats = stats
+        self.records = []  # StepRecord
+        self.progress = queue.Queue()  # GUIに知らせるStepRecord
+        self.errors = queue.Queue()  # エラーメッセージ
+        self.finished = False
+        self._stop_event = threading.Event()
+        self._condition = None  # (Step, 満たしたら立てるEvent, 結果のリスト)
+        self._number = 0
+        self._time = None  # 予定の時刻 (time.perf_counter())
+
+    def run(self):
+        """プログラムを実行し、中断したときは両方のモータを止める"""
+        self._time = time.perf_counter()
+        try:
+            self._run_steps(self.program.steps, 0)
+            self.finished = not self._stop_event.is_set()
+        except (ProgramError, MotorWriterError, SerialManagerError) as e:
+            self.errors.put(str(e))
+        if not self.finished:
+            self._stop_motors()
+
+    def stop(self):
+        """実行を中断し、スレッドの終了を待つ"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def process(self, rows, received_at):
+        """取得スレッドから行ブロックを受け取り、待っている条件を評価する
+
+        Arguments:
+            rows -- 解析した行ブロック
+            received_at -- 行を受信した時刻 (予定時刻には、同じ時計で
+                           比べられるよう見つけた時刻を使う)
+        """
+        condition = self._condition
+        if condition is None:
+            return
+        step, event, result = condition
+        values = rows[:, step.index]
+        hits = np.flatnonzero(values > step.value if step.above
+                              else values < step.value)
+        if len(hits) and not event.is_set():
+            result.append((time.perf_counter(), float(values[hits[0]])))
+            event.set()
+
+    def drain(self):
+        """実行したステップの記録をすべて取り出す"""
+        records = []
+        while True:
+            try:
+                records.append(self.progress.get_nowait())
+            except queue.Empty:
+                return records
+
+    def drain_errors(self):
+        """溜まったエラーメッセージをすべて取り出す"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.errors.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def save_csv(self, path, sample_time):
+        """実行の記録をCSVに書き出す
+
+        Arguments:
+            path -- 書き出すパス
+            sample_time -- time.monotonic()の時刻を計測値の時間軸に
+                           直す関数 (MotorEventLog.sample_time)
+        """
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(('Time', 'Step', 'Cycle', 'Action', 'Jitter',
+                             'Value', 'Sent'))
+            for record in self.records:
+                command = record.command
+                writer.writerow((
+                    sample_time(record.executed_at, record.executed_at),
+                    record.number,
+                    record.cycle, record.step.describe(),
+                    record.jitter * 1e3, record.value,
+                    sample_time(command.sent_at, record.executed_at)
+                    if command is not None else None))
+
+    def _run_steps(self, steps, cycle):
+        """ステップの並びを順に実行する"""
+        for step in steps:
+            if self._stop_event.is_set():
+                return
+            if step.action == REPEAT:
+                for n in range(step.count):
+                    self._run_steps(step.steps, n + 1)
+                    if self._stop_event.is_set():
+                        return
+                continue
+            record = self._run_step(step, cycle)
+            if record is None:
+                return
+            self.records.append(record)
+            self.progress.put(record)
+            if self.stats is not None:
+                self.stats.record('program', abs(record.jitter))
+
+    def _run_step(self, step: Step, cycle):
+        """1ステップを実行し、記録を返す (中断したらNone)"""
+        self._number += 1
+        if step.action == WAIT:
+            self._time += step.seconds
+            if not self._sleep_until(self._time):
+                return None
+            return StepRecord(self._number, step, cycle, self._time,
+                              time.perf_counter())
+        if step.action == WAIT_UNTIL:
+            return self._wait_until(step, cycle)
+        command = self.mc.send(MOTOR_COMMANDS[(step.action, step.motor)])
+        record = StepRecord(self._number, step, cycle, self._time,
+                            time.perf_counter())
+        record.command = command
+        return record
+
+    def _wait_until(self, step: Step, cycle):
+        """条件を満たす行が届くまで待つ"""
+        event, result = threading.Event(), []
+        self._condition = (step, event, result)
+        deadline = (None if step.timeout is None
+                    else time.perf_counter() + step.timeout)
+        try:
+            while not event.wait(ProgramSettings.POLL_INTERVAL):
+                if self._stop_event.is_set():
+                    return None
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise ProgramError(
+                        f"{step.describe()}が{step.timeout}秒で満たされ"
+                        f"ませんでした")
+        finally:
+            self._condition = None
+        self._time, value = result[0]
+        record = StepRecord(self._number, step, cycle, self._time,
+                            time.perf_counter())
+        record.value = value
+        return record
+
+    def _sleep_until(self, deadline):
+        """時刻までスリープし、直前は待ち続ける (中断したらFalse)"""
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return True
+            if remaining > ProgramSettings.SPIN_TIME:
+                if self._stop_event.wait(
+                        remaining - ProgramSettings.SPIN_TIME):
+                    return False
+
+    def _stop_motors(self):
+        """中断したときに両方のモータを止める"""
+        for motor in (1, 2):
+            try:
+                self.mc.send(MOTOR_COMMANDS[(STOP, motor)])
+            except (MotorWriterError, SerialManagerError) as e:
+                self.errors.put(str(e))
+
+
+class ProgramError(Exception):
+    pass
@@ -0,0 +1,250 @@
+import bisect
+import os
+import threading
+import time
+
+import numpy as np
+
+from pkgs.common.constants import (ArithmeticConstants, AlignmentSettings,
+                                   Commands, DataProperties, JournalSettings,
+                                   ReplaySettings)
+from pkgs.util.journal import read_journal
+from pkgs.util.serial_manager import SerialManager
+from pkgs.util.stream_aligner import ESP32, RP2040
+
+
+class ReplaySource:
+    """記録した行を元の時間間隔で2つのデバイスから流し直す再生源
+
+    行は記録の時刻 (最初の行を0とする秒) を付けてデバイスごとに持ち、
+    PLOT_STARTを受けてから speed 倍の速さで時刻が来た行を返す。
+    speedがNoneなら待たずに、読み取り1回ごとにMAX_SPEED_STEP秒分ずつ
+    進める。読み取りはmanagers()が返すSerialManager互換の
+    オブジェクトを通して行う。
+    """
+    def __init__(self, events, speed=1.0, name='replay'):
+        """コンストラクタ
+
+        Arguments:
+            events -- デバイスごとの (時刻, 行) のリスト (時刻の昇順)
+
+        Keyword Arguments:
+            speed -- 再生の速さ (Noneなら最高速) (default: {1.0})
+            name -- ポート名に使う名前 (default: {'replay'})
+        """
+        self.events = events
+        self.times = [[t for t, _ in device] for device in events]
+        self.speed = speed
+        self.name = name
+        self._cursor = [0, 0]
+        self._position = 0.0  # 最高速の再生で進めた記録の時刻 (s)
+        self._started_at = None
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_file(cls, path, speed=1.0):
+        """CSVまたはジャーナルから再生源を作る
+
+        Arguments:
+            path -- out/*.csvまたはジャーナルのパス
+
+        Keyword Arguments:
+            speed -- 再生の速さ (Noneなら最高速) (default: {1.0})
+        """
+        name = os.path.basename(path)
+        if path.endswith(JournalSettings.SUFFIX):
+            return cls(load_journal(path), speed, name)
+        return cls(load_csv(path), speed, name)
+
+    @property
+    def playing(self):
+        """再生中か"""
+        return self._started_at is not None
+
+    @property
+    def finished(self):
+        """すべての行を返し終えたか"""
+        return all(cursor >= len(device)
+                   for cursor, device in zip(self._cursor, self.events))
+
+    def managers(self):
+        """ESP32側とRP2040側のSerialManager互換オブジェクトを返す"""
+        return (ReplaySerialManager(self, ESP32),
+                ReplaySerialManager(self, RP2040))
+
+    def start(self):
+        """先頭から再生を始める"""
+        with self._condition:
+            self._cursor = [0, 0]
+            self._position = 0.0
+            self._started_at = time.monotonic()
+            self._condition.notify_all()
+
+    def stop(self):
+        """再生を止める"""
+        with self._condition:
+            self._started_at = None
+            self._condition.notify_all()
+
+    def cancel(self):
+        """ブロック中の読み取りを起こす"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def read(self, index, block=True):
+        """時刻が来た行を返す
+
+        Arguments:
+            index -- デバイス番号
+
+        Keyword Arguments:
+            block -- 1行も無ければ次の行の時刻まで待つ
+                     (最高速の再生では待たない) (default: {True})
+
+        Returns: 行のリスト
+        """
+        with self._condition:
+            lines = self._take(index)
+            while block and not lines and self._waitable(index):
+                # 最高速の再生は読み取りで進むので待たない
+                self._condition.wait(self._wait_time(index))
+                lines = self._take(index)
+            return lines
+
+    def _take(self, index):
+        """今の位置までの行を取り出す"""
+        if not self.playing:
+            return []
+        if self.speed is None:
+            if index == ESP32:
+                self._position += ReplaySettings.MAX_SPEED_STEP
+            position = self._position
+        else:
+            position = (time.monotonic() - self._started_at) * self.speed
+        start = self._cursor[index]
+        stop = bisect.bisect_right(self.times[index], position, lo=start)
+        self._cursor[index] = stop
+        return [line for _, line in self.events[index][start:stop]]
+
+    def _waitable(self, index):
+        """待てば行が来るか"""
+        return (self.playing and self.speed is not None
+                and self._cursor[index] < len(self.events[index]))
+
+    def _wait_time(self, index):
+        """次の行の時刻までの実時間 (s)"""
+        position = (time.monotonic() - self._started_at) * self.speed
+        next_time = self.times[index][self._cursor[index]]
+        return max(next_time - position, 0) / self.speed
+
+
+class ReplaySerialManager(SerialManager):
+    """ReplaySourceの1デバイス分を読むSerialManager
+
+    PLOT_STARTとPLOT_STOPの書き込みで再生を始め、止める。
+    モータのコマンドは受け取るだけで何もしない。
+    """
+    def __init__(self, source: ReplaySource, index):
+        """コンストラクタ
+
+        Arguments:
+            source -- ReplaySourceオブジェクト
+            index -- デバイス番号 (ESP32またはRP2040)
+        """
+        super().__init__()
+        self.source = source
+        self.index = index
+        self.is_ready = True
+        self._pending = []  # read_serial_dataでまだ返していない行
+
+    @property
+    def port(self):
+        """再生源の名前とデバイス番号から作ったポート名."""
+        return f"{self.source.name}:{self.index}"
+
+    def open_port(self, port):
+        """何もしない (再生源は常に開いている)."""
+
+    def close_port(self):
+        """再生を止める."""
+        self.source.stop()
+
+    def write(self, data):
+        """コマンドを受け取る.
+
+        Arguments:
+            data -- 値
+        """
+        if self.index != ESP32:
+            return
+        if data == Commands.PLOT_START:
+            self.source.start()
+        elif data == Commands.PLOT_STOP:
+            self.source.stop()
+
+    def cancel_read(self):
+        """ブロック中の読み取りを中断する."""
+        self.source.cancel()
+
+    def read_serial_data(self):
+        """1行読む.
+
+        Returns: 一行分 (再生が終わっていれば空文字列)
+        """
+        if not self._pending:
+            self._pending = self.source.read(self.index)
+        return self._pending.pop(0) if self._pending else ''
+
+    def read_lines(self, block=True):
+        """時刻が来た行をまとめて読む.
+
+        Keyword Arguments:
+            block -- 1行も無ければ次の行の時刻まで待つ (default: {True})
+
+        Returns: 行のリスト (空のこともある)
+        """
+        return self.source.read(self.index, block)
+
+
+def load_csv(path):
+    """保存したCSVからデバイスごとの (時刻, 行) を作る
+
+    process_batchの換算を逆にたどり、ESP32の行 (disp1, disp2, micros) と
+    RP2040の行 (d, f1, f2) のADCカウントに戻す。1行目は取得スレッドが
+    読み飛ばすので、代わりの行を先頭に足す。
+
+    Returns: [ESP32の (時刻, 行) のリスト, RP2040の (時刻, 行) のリスト]
+    """
+    import pandas as pd  # 起動を速くするため使うときに読み込む
+    data = pd.read_csv(path, float_precision='round_trip')
+    data = data[DataProperties.list_properties()].dropna().to_numpy()
+    t = data[:, 0] - data[0, 0] if len(data) else data[:, 0]
+    micros = np.rint(t / ArithmeticConstants.MICRO).astype(np.int64) \
+        % AlignmentSettings.MICROS_WRAP
+    counts = np.rint(data[:, [5, 1, 2]] * ArithmeticConstants.ADC_MAX
+                     / ArithmeticConstants.ADC_VREF).astype(np.int64)
+    esp = [(0.0, ReplaySettings.FIRST_LINE)]
+    rp = [(0.0, ReplaySettings.FIRST_LINE)]
+    for time_, row, value, count in zip(t.tolist(), data.tolist(),
+                                        micros.tolist(), counts.tolist()):
+        esp.append((time_, f"{row[3]!r},{row[4]!r},{value}"))
+        rp.append((time_, f"{count[0]},{count[1]},{count[2]}"))
+    return [esp, rp]
+
+
+def load_journal(path):
+    """ジャーナルからデバイスごとの (時刻, 行) を作る
+
+    時刻は記録した受信時刻で、1回の読み取りでまとめて届いた行は
+    再生でもまとめて届く。
+
+    Returns: [ESP32の (時刻, 行) のリスト, RP2040の (時刻, 行) のリスト]
+    """
+    events = [[(0.0, ReplaySettings.FIRST_LINE)],
+              [(0.0, ReplaySettings.FIRST_LINE)]]
+    first = None
+    for index, received_at, lines in read_journal(path):
+        if first is None:
+            first = received_at
+        events[index].extend((received_at - first, line) for line in lines)
+    return events
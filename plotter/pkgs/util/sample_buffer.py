@@ -0,0 +1,153 @@
+import numpy as np
+
+
+class SampleBuffer:
+    """計測値を列ごとに保持する伸長可能なバッファ
+
+    容量が足りなくなったときだけ倍の大きさに確保し直すので、
+    追加は償却O(1)で済む。
+    """
+    def __init__(self, num_columns=6, capacity=1024):
+        """コンストラクタ
+
+        Keyword Arguments:
+            num_columns -- 列数 (default: {6})
+            capacity -- 初期容量 (default: {1024})
+        """
+        self.num_columns = num_columns
+        self.initial_capacity = capacity
+        self.clear()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        """確保済みの行数"""
+        return self._data.shape[1]
+
+    def clear(self):
+        """データを破棄して初期容量に戻す"""
+        self._data = np.empty((self.num_columns, self.initial_capacity))
+        self._size = 0
+
+    def append(self, row):
+        """1行追加する
+
+        Arguments:
+            row -- 長さnum_columnsの配列
+        """
+        self._reserve(self._size + 1)
+        self._data[:, self._size] = row
+        self._size += 1
+
+    def extend(self, rows):
+        """複数行をまとめて追加する
+
+        Arguments:
+            rows -- (N, num_columns)の配列
+        """
+        rows = np.asarray(rows)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        n = rows.shape[0]
+        if n == 0:
+            return
+        self._reserve(self._size + n)
+        self._data[:, self._size:self._size + n] = rows.T
+        self._size += n
+
+    def columns(self):
+        """列ごとの配列を返す (コピーしないビュー)
+
+        Returns: (num_columns, N)の配列
+        """
+        return self._data[:, :self._size]
+
+    def rows(self, start=0, stop=None):
+        """行ごとの配列を返す (コピーしないビュー)
+
+        Keyword Arguments:
+            start -- 最初の行 (default: {0})
+            stop -- 最後の行の次 (default: {None})
+
+        Returns: (N, num_columns)の配列
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        return self._data[:, start:stop].T
+
+    def _reserve(self, size):
+        """必要なら容量を倍々に増やす"""
+        capacity = self.capacity
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        data = np.empty((self.num_columns, capacity))
+        data[:, :self._size] = self._data[:, :self._size]
+        self._data = data
+
+
+class RingBuffer:
+    """直近の一定行数だけを列ごとに保持するリングバッファ
+
+    各行を2か所 (i と i + capacity) に書くので、古い順に並んだ
+    直近の行を常にコピーなしの連続したビューとして返せる。
+    ビューの中身は次の追加で書き換わるので、使うたびに取り直すこと。
+    """
+    def __init__(self, num_columns=6, capacity=2**16):
+        """コンストラクタ
+
+        Keyword Arguments:
+            num_columns -- 列数 (default: {6})
+            capacity -- 保持する行数 (default: {2**16})
+        """
+        self.num_columns = num_columns
+        self.capacity = capacity
+        self._data = np.empty((num_columns, 2 * capacity))
+        self.clear()
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        """データを破棄する"""
+        self._write = 0  # 次に書く位置
+        self._size = 0
+
+    def extend(self, rows):
+        """複数行をまとめて追加する (古い行は上書きされる)
+
+        Arguments:
+            rows -- (N, num_columns)の配列
+        """
+        rows = np.asarray(rows)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        values = rows[-self.capacity:].T
+        n = values.shape[1]
+        if n == 0:
+            return
+        cap = self.capacity
+        first = min(n, cap - self._write)
+        for offset in (0, cap):
+            start = self._write + offset
+            self._data[:, start:start + first] = values[:, :first]
+            self._data[:, offset:offset + n - first] = values[:, first:]
+        self._write = (self._write + n) % cap
+        self._size = min(self._size + n, cap)
+
+    def columns(self):
+        """古い順に並んだ列ごとの配列を返す (コピーしないビュー)
+
+        Returns: (num_columns, N)の配列
+        """
+        end = self._write + self.capacity
+        return self._data[:, end - self._size:end]
+
+    def rows(self):
+        """古い順に並んだ行ごとの配列を返す (コピーしないビュー)
+
+        Returns: (N, num_columns)の配列
+        """
+        return self.columns().T
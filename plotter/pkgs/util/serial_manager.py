@@ -13,6 +13,12 @@ class SerialManager:
         self.ser = None
         self.baudrate = baudrate
         self.is_ready = False
+        self._buffer = bytearray()  # read_linesで行末待ちのバイト列
+
+    @property
+    def port(self):
+        """接続したCOMポート名 (未接続ならNone)."""
+        return self.ser.port if self.ser else None
 
     def open_port(self, port):
         """シリアルをオープン.
@@ -21,6 +27,7 @@ class SerialManager:
             port -- COMポート名
         """
         try:
+            self._buffer.clear()
             self.ser = serial.Serial(port, self.baudrate, timeout=None)
             if self.ser and self.ser.is_open:
                 self.is_ready = True
@@ -52,6 +59,15 @@ class SerialManager:
             except Exception as e:
                 raise SerialManagerError(f"データを書き込む際に予期しないエラーが発生しました: {e}")
 
+    def cancel_read(self):
+        """ブロック中の読み取りを中断する.
+        """
+        if self.ser and self.ser.is_open:
+            try:
+                self.ser.cancel_read()
+            except Exception as e:
+                raise SerialManagerError(f"読み取りの中断中に予期しないエラーが発生しました: {e}")
+
     def read_serial_data(self):
         """シリアルから値を読む.
 
@@ -70,6 +86,35 @@ class SerialManager:
         else:
             raise SerialManagerError("シリアルポートが開いていません")
 
+    def read_lines(self, block=True):
+        """シリアルに届いている分をまとめて読む.
+
+        in_waitingの分を一度に読み、完全な行だけを返す。
+        行末の無い残りは次の呼び出しに持ち越す。
+        デコードできないバイトは置換文字にし、解析側で不正行として扱う。
+
+        Keyword Arguments:
+            block -- 何も届いていなければ1バイト待つ (default: {True})
+
+        Returns: 行のリスト (空のこともある)
+        """
+        if self.ser and self.ser.is_open:
+            try:
+                size = self.ser.in_waiting
+                if size == 0 and not block:
+                    return []
+                self._buffer += self.ser.read(max(1, size))
+                end = self._buffer.rfind(b'\n')
+                if end < 0:
+                    return []
+                text = self._buffer[:end].decode(errors='replace')
+                del self._buffer[:end + 1]
+                return [line.rstrip() for line in text.split('\n')]
+            except Exception as e:
+                raise SerialManagerError(f"データを読み取る際に予期しないエラーが発生しました: {e}")
+        else:
+            raise SerialManagerError("シリアルポートが開いていません")
+
 
 class SerialManagerError(Exception):
     pass
@@ -0,0 +1,365 @@
+import argparse
+import datetime
+import glob
+import json
+import os
+import shutil
+import struct
+import zlib
+
+import numpy as np
+
+from pkgs.common.constants import (ArithmeticConstants, DataProperties,
+                                   MotorSettings, ProgramSettings,
+                                   SaveSettings)
+
+# ファイルの構成:
+#   ヘッダ   MAGIC, バージョン, メタデータ長, メタデータ (JSON)
+#   チャンク 行数, 先頭と末尾の時刻, 列ごとの圧縮長, 圧縮した列の並び
+#   索引     チャンクごとの (位置, 行数, 最小時刻, 最大時刻) のJSON
+#   末尾     索引の位置, INDEX_MAGIC
+MAGIC = b'KESF'
+INDEX_MAGIC = b'KIDX'
+VERSION = 1
+_HEADER = struct.Struct('<4sHI')
+_FOOTER = struct.Struct('<Q4s')
+_DTYPE = np.dtype('<f8')
+
+
+def calibration():
+    """ファイルに書き残す換算の定数"""
+    return {
+        'micro': ArithmeticConstants.MICRO,
+        'adc_vref': ArithmeticConstants.ADC_VREF,
+        'adc_max': ArithmeticConstants.ADC_MAX,
+    }
+
+
+class SessionArchiveWriter:
+    """計測値を列ごとに圧縮したチャンクで書き出すライタ
+
+    列はバイト順に並べ替えてからzlibで圧縮する (値の上位バイトが
+    そろうので、そのまま圧縮するより小さくなる)。
+    チャンクごとの時刻の範囲を索引として末尾に書くので、
+    SessionArchiveReaderは必要なチャンクだけを読める。
+    """
+    def __init__(self, path, metadata=None):
+        """コンストラクタ
+
+        Arguments:
+            path -- 書き込むファイルのパス
+
+        Keyword Arguments:
+            metadata -- ヘッダに書くメタデータ (default: {None})
+        """
+        self.path = path
+        self.metadata = {
+            'columns': DataProperties.list_properties(),
+            'calibration': calibration(),
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        self.metadata.update(metadata or {})
+        self.chunks = []
+        self._file = open(path, 'wb')
+        header = json.dumps(self.metadata, ensure_ascii=False).encode()
+        self._file.write(_HEADER.pack(MAGIC, VERSION, len(header)))
+        self._file.write(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, rows, chunk_rows=SaveSettings.ARCHIVE_CHUNK_ROWS):
+        """行をchunk_rowsごとのチャンクに分けて書き込む
+
+        Arguments:
+            rows -- (N, 列数)の配列
+
+        Keyword Arguments:
+            chunk_rows -- 1チャンクの行数
+                          (default: {SaveSettings.ARCHIVE_CHUNK_ROWS})
+        """
+        for start in range(0, len(rows), chunk_rows):
+            self.write_chunk(rows[start:start + chunk_rows])
+
+    def write_chunk(self, rows):
+        """1チャンクを書き込む
+
+        Arguments:
+            rows -- (N, 列数)の配列
+        """
+        rows = np.asarray(rows, dtype=_DTYPE)
+        if len(rows) == 0:
+            return
+        t_min, t_max = _time_range(rows[:, 0])
+        blocks = [zlib.compress(_shuffle(np.ascontiguousarray(column)),
+                                SaveSettings.ARCHIVE_LEVEL)
+                  for column in rows.T]
+        self.chunks.append({
+            'offset': self._file.tell(),
+            'rows': len(rows),
+            't_min': t_min,
+            't_max': t_max,
+        })
+        self._file.write(struct.pack(f'<I{len(blocks)}I', len(rows),
+                                     *(len(block) for block in blocks)))
+        for block in blocks:
+            self._file.write(block)
+
+    def snapshot(self, path):
+        """ここまでに書いたチャンクに索引を付けた写しを作る
+
+        書き込みの途中でも使えるが、write_chunkと同時に呼ばないこと。
+
+        Arguments:
+            path -- 写しのパス
+        """
+        self._file.flush()
+        index_offset = self._file.tell()
+        shutil.copyfile(self.path, path)
+        with open(path, 'r+b') as f:
+            f.truncate(index_offset)
+            f.seek(index_offset)
+            self._write_index(f, index_offset)
+
+    def close(self):
+        """索引を書いてファイルを閉じる"""
+        if self._file.closed:
+            return
+        self._write_index(self._file, self._file.tell())
+        self._file.close()
+
+    def _write_index(self, f, index_offset):
+        """索引と末尾を書く"""
+        f.write(json.dumps(self.chunks).encode())
+        f.write(_FOOTER.pack(index_offset, INDEX_MAGIC))
+
+
+class SessionArchiveReader:
+    """セッションアーカイブを読むリーダ
+
+    ヘッダと索引だけを開いたときに読み、行は求められた時刻の範囲に
+    かかるチャンクだけを読んで展開する。
+    """
+    def __init__(self, path):
+        """コンストラクタ
+
+        Arguments:
+            path -- 読むファイルのパス
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, length = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise SessionArchiveError(
+                    f"セッションアーカイブではありません: {path}")
+            if version > VERSION:
+                raise SessionArchiveError(
+                    f"未対応のバージョンです: {version}")
+            self.metadata = json.loads(f.read(length).decode())
+            self.columns = self.metadata['columns']
+            self._data_start = f.tell()
+            self.chunks = self._read_index(f)
+
+    def __len__(self):
+        return sum(chunk['rows'] for chunk in self.chunks)
+
+    @property
+    def time_range(self):
+        """記録された時刻の範囲 (最小, 最大)"""
+        stamps = [chunk for chunk in self.chunks if chunk['t_min'] is not None]
+        if not stamps:
+            return None
+        return (min(chunk['t_min'] for chunk in stamps),
+                max(chunk['t_max'] for chunk in stamps))
+
+    def read(self, t_start=None, t_end=None):
+        """時刻がt_startからt_endまでの行を読む
+
+        Keyword Arguments:
+            t_start -- 範囲の始め (Noneなら先頭から) (default: {None})
+            t_end -- 範囲の終わり (Noneなら末尾まで) (default: {None})
+
+        Returns: (N, 列数)の配列
+        """
+        selected = [chunk for chunk in self.chunks
+                    if self._overlaps(chunk, t_start, t_end)]
+        blocks = []
+        with open(self.path, 'rb') as f:
+            for chunk in selected:
+                rows = self._read_chunk(f, chunk)
+                if t_start is not None or t_end is not None:
+                    t = rows[:, 0]
+                    keep = np.ones(len(rows), dtype=bool)
+                    if t_start is not None:
+                        keep &= t >= t_start
+                    if t_end is not None:
+                        keep &= t <= t_end
+                    rows = rows[keep]
+                blocks.append(rows)
+        if not blocks:
+            return np.empty((0, len(self.columns)))
+        return np.vstack(blocks)
+
+    @staticmethod
+    def _overlaps(chunk, t_start, t_end):
+        """チャンクの時刻の範囲が求める範囲にかかるか"""
+        if chunk['t_min'] is None:
+            return t_start is None and t_end is None
+        if t_start is not None and chunk['t_max'] < t_start:
+            return False
+        if t_end is not None and chunk['t_min'] > t_end:
+            return False
+        return True
+
+    def _read_chunk(self, f, chunk):
+        """1チャンクを読んで展開する"""
+        num_columns = len(self.columns)
+        sizes = struct.Struct(f'<I{num_columns}I')
+        f.seek(chunk['offset'])
+        rows, *lengths = sizes.unpack(f.read(sizes.size))
+        data = np.empty((rows, num_columns))
+        for i, length in enumerate(lengths):
+            data[:, i] = _unshuffle(zlib.decompress(f.read(length)))
+        return data
+
+    def _read_index(self, f):
+        """末尾の索引を読む
+
+        索引が無い (書き込み中に止まった) ときはチャンクを先頭から
+        たどって索引を作り直す。
+        """
+        end = f.seek(0, os.SEEK_END)
+        if end >= self._data_start + _FOOTER.size:
+            f.seek(end - _FOOTER.size)
+            offset, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic == INDEX_MAGIC and self._data_start <= offset < end:
+                f.seek(offset)
+                try:
+                    return json.loads(f.read(end - _FOOTER.size - offset))
+                except ValueError:
+                    pass  # 索引が壊れているときはたどり直す
+        return self._scan_chunks(f, end)
+
+    def _scan_chunks(self, f, end):
+        """チャンクを先頭からたどって索引を作る"""
+        num_columns = len(self.columns)
+        sizes = struct.Struct(f'<I{num_columns}I')
+        offset = self._data_start
+        chunks = []
+        while offset + sizes.size <= end:
+            f.seek(offset)
+            rows, *lengths = sizes.unpack(f.read(sizes.size))
+            if offset + sizes.size + sum(lengths) > end:
+                break  # 書きかけのチャンク
+            chunk = {'offset': offset, 'rows': rows}
+            try:
+                t = self._read_chunk(f, chunk)[:, 0]
+            except (zlib.error, ValueError):
+                break
+            chunk['t_min'], chunk['t_max'] = _time_range(t)
+            chunks.append(chunk)
+            offset += sizes.size + sum(lengths)
+        return chunks
+
+
+def _time_range(t):
+    """NaNを除いた時刻の (最小, 最大) (すべてNaNなら (None, None))"""
+    t = t[~np.isnan(t)]
+    if len(t) == 0:
+        return None, None
+    return float(t.min()), float(t.max())
+
+
+def _shuffle(column):
+    """float64の列をバイトの位ごとに並べ替える"""
+    return column.astype(_DTYPE, copy=False).view(np.uint8) \
+        .reshape(-1, _DTYPE.itemsize).T.tobytes()
+
+
+def _unshuffle(data):
+    """_shuffleで並べ替えたバイト列を列に戻す"""
+    return np.frombuffer(data, dtype=np.uint8) \
+        .reshape(_DTYPE.itemsize, -1).T.copy().view(_DTYPE).ravel()
+
+
+def convert_csv(csv_path, archive_path=None,
+                chunk_rows=SaveSettings.ARCHIVE_CHUNK_ROWS):
+    """保存済みのCSVをセッションアーカイブに変換する
+
+    CSVはchunk_rowsずつ読むので、大きいファイルでもメモリは増えない。
+
+    Arguments:
+        csv_path -- CSVのパス
+
+    Keyword Arguments:
+        archive_path -- 書き出すパス (Noneなら拡張子を変えたパス)
+                        (default: {None})
+        chunk_rows -- 1チャンクの行数
+                      (default: {SaveSettings.ARCHIVE_CHUNK_ROWS})
+
+    Returns: 書き出したパス
+    """
+    import pandas as pd  # 起動を速くするため使うときに読み込む
+    if archive_path is None:
+        archive_path = \
+            f"{os.path.splitext(csv_path)[0]}{SaveSettings.ARCHIVE_SUFFIX}"
+    project = os.path.splitext(os.path.basename(csv_path))[0]
+    columns = DataProperties.list_properties()
+    with SessionArchiveWriter(archive_path, {'project': project,
+                                             'source': csv_path}) as writer:
+        for frame in pd.read_csv(csv_path, chunksize=chunk_rows,
+                                 float_precision='round_trip'):
+            writer.write_chunk(frame.reindex(columns=columns).to_numpy(
+                dtype=float))
+    return archive_path
+
+
+def saved_csvs(out_dir=None):
+    """保存した計測値のCSVを返す
+
+    自動保存中のCSV (.partial.csv) や、コマンドと負荷プログラムの記録の
+    CSVは計測値ではないので含めない。
+
+    Keyword Arguments:
+        out_dir -- 探すディレクトリ (Noneなら保存先) (default: {None})
+
+    Returns: CSVのパスのリスト (名前順)
+    """
+    out_dir = SaveSettings.OUT_DIR if out_dir is None else out_dir
+    excluded = (f"{SaveSettings.PARTIAL_SUFFIX}.csv",
+                MotorSettings.EVENT_SUFFIX, ProgramSettings.SUFFIX)
+    return sorted(path for path in glob.glob(f"{out_dir}/*.csv")
+                  if not path.endswith(excluded))
+
+
+def main():
+    """out/のCSVをセッションアーカイブに変換する"""
+    parser = argparse.ArgumentParser(
+        description='CSVをセッションアーカイブに変換する')
+    parser.add_argument('csv', nargs='*',
+                        help='変換するCSV (default: 保存した計測値のCSV)')
+    parser.add_argument('--force', action='store_true',
+                        help='既にあるアーカイブも作り直す')
+    args = parser.parse_args()
+
+    paths = args.csv or saved_csvs()
+    for path in paths:
+        archive_path = \
+            f"{os.path.splitext(path)[0]}{SaveSettings.ARCHIVE_SUFFIX}"
+        if os.path.exists(archive_path) and not args.force:
+            print(f"{archive_path}は既にあるので飛ばします")
+            continue
+        convert_csv(path, archive_path)
+        print(f"{path} -> {archive_path} "
+              f"({len(SessionArchiveReader(archive_path))}行)")
+
+
+class SessionArchiveError(Exception):
+    pass
+
+
+if __name__ == '__main__':
+    main()
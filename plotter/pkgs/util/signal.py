@@ -0,0 +1,33 @@
+class Signal:
+    """Qtに依存しない最小限のシグナル
+
+    pyqtSignalと同じくconnect()で登録した関数をemit()で呼ぶ。
+    呼び出しはemit()したスレッドでそのまま行う。
+    """
+    def __init__(self):
+        """コンストラクタ"""
+        self._slots = []
+
+    def connect(self, slot):
+        """スロットを登録する
+
+        Arguments:
+            slot -- emit()の引数で呼ばれる関数
+        """
+        self._slots.append(slot)
+
+    def disconnect(self, slot=None):
+        """スロットの登録を解除する
+
+        Keyword Arguments:
+            slot -- 解除する関数 (Noneならすべて) (default: {None})
+        """
+        if slot is None:
+            self._slots.clear()
+        else:
+            self._slots.remove(slot)
+
+    def emit(self, *args):
+        """登録したスロットを順に呼ぶ"""
+        for slot in list(self._slots):
+            slot(*args)
@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from pkgs.common.constants import DataProperties, SaveSettings
+from pkgs.util.csv_writer import format_header, format_rows
+
+
+class SpoolBuffer:
+    """計測値をファイルに書きながら保持するメモリマップのバッファ
+
+    SampleBufferと同じ使い方ができ、行はout/以下のファイルに
+    (行数, 列数) の順で並ぶ。容量が足りなくなったらファイルを倍に
+    伸ばしてマップし直すので、データ長はディスクの空きで決まる。
+    書き込んだ行数はSPOOL_SYNC_INTERVALごとに隣のJSONファイルへ
+    書き残すので、異常終了してもload_spoolでそこまでを読み戻せる。
+    """
+    def __init__(self, path, num_columns=6, capacity=SaveSettings.SPOOL_ROWS):
+        """コンストラクタ
+
+        Arguments:
+            path -- スプールファイルのパス
+
+        Keyword Arguments:
+            num_columns -- 列数 (default: {6})
+            capacity -- 最初に確保する行数 (default: {SaveSettings.SPOOL_ROWS})
+        """
+        self.path = path
+        self.index_path = index_path(path)
+        self.num_columns = num_columns
+        self._data = np.memmap(path, dtype=np.float64, mode='w+',
+                               shape=(capacity, num_columns))
+        self._size = 0
+        self.sync()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        """確保済みの行数"""
+        return self._data.shape[0]
+
+    def clear(self):
+        """データを破棄する (ファイルの大きさはそのまま)"""
+        self._size = 0
+        self.sync()
+
+    def append(self, row):
+        """1行追加する
+
+        Arguments:
+            row -- 長さnum_columnsの配列
+        """
+        self.extend(row)
+
+    def extend(self, rows):
+        """複数行をまとめて追加する
+
+        Arguments:
+            rows -- (N, num_columns)の配列
+        """
+        rows = np.asarray(rows)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        n = rows.shape[0]
+        if n == 0:
+            return
+        self._reserve(self._size + n)
+        self._data[self._size:self._size + n] = rows
+        self._size += n
+        if time.monotonic() - self._synced_at >= \
+                SaveSettings.SPOOL_SYNC_INTERVAL:
+            self.sync()
+
+    def columns(self):
+        """列ごとの配列を返す (コピーしないビュー)
+
+        Returns: (num_columns, N)の配列
+        """
+        return self._data[:self._size].T
+
+    def rows(self, start=0, stop=None):
+        """行ごとの配列を返す (コピーしないビュー)
+
+        Keyword Arguments:
+            start -- 最初の行 (default: {0})
+            stop -- 最後の行の次 (default: {None})
+
+        Returns: (N, num_columns)の配列
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        return self._data[start:stop]
+
+    def sync(self):
+        """書いた行をディスクに反映し、行数を書き残す"""
+        self._data.flush()
+        index = {
+            'rows': self._size,
+            'capacity': self.capacity,
+            'dtype': self._data.dtype.str,
+            'columns': DataProperties.list_properties()[:self.num_columns],
+        }
+        temporary = f"{self.index_path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(temporary, self.index_path)  # 書きかけを残さない
+        self._synced_at = time.monotonic()
+
+    def _reserve(self, size):
+        """必要ならファイルを倍々に伸ばしてマップし直す
+
+        それまでに返したビューは古いマップを指したまま読める。
+        """
+        capacity = self.capacity
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self._data.flush()
+        self._data = np.memmap(self.path, dtype=np.float64, mode='r+',
+                               shape=(capacity, self.num_columns))
+
+
+def index_path(path):
+    """スプールファイルの行数を書き残すJSONファイルのパス"""
+    return f"{path}.json"
+
+
+def load_spool(path):
+    """スプールファイルを読み戻す
+
+    JSONファイルに書き残した行数までを返すので、異常終了した計測でも
+    最後の同期までの行を取り出せる。
+
+    Arguments:
+        path -- スプールファイルのパス
+
+    Returns: (行数, 列数)の読み取り専用の配列
+    """
+    with open(index_path(path), encoding='utf-8') as f:
+        index = json.load(f)
+    shape = (index['rows'], len(index['columns']))
+    if index['rows'] == 0:
+        return np.empty(shape)
+    return np.memmap(path, dtype=np.dtype(index['dtype']), mode='r',
+                     shape=shape)
+
+
+def main():
+    """スプールファイルをCSVに書き出す"""
+    parser = argparse.ArgumentParser(
+        description='スプールファイルをCSVに書き出す')
+    parser.add_argument('spool', help='スプールファイルのパス')
+    parser.add_argument('csv', nargs='?',
+                        help='書き出すCSVのパス (default: スプール名.csv)')
+    args = parser.parse_args()
+
+    data = load_spool(args.spool)
+    csv_path = args.csv or f"{os.path.splitext(args.spool)[0]}.csv"
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        f.write(format_header())
+        for start in range(0, len(data), SaveSettings.CHUNK_ROWS):
+            f.write(format_rows(data[start:start + SaveSettings.CHUNK_ROWS]))
+    print(f"{len(data)}行を{csv_path}に書き出しました")
+
+
+if __name__ == '__main__':
+    main()
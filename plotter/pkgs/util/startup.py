@@ -0,0 +1,80 @@
+import importlib
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfiler:
+    """起動から最初の描画までの時間を段階ごとに測る
+
+    mark()で直前のmark()からの時間を段階として記録する。
+    別スレッドで並行に進む処理はnote()で別に記録する。
+    """
+    def __init__(self):
+        """コンストラクタ"""
+        self.started = self._last = time.perf_counter()
+        self.phases = []  # (段階, 時間 (s))
+        self.background = []  # (処理, 時間 (s))
+
+    def mark(self, phase):
+        """直前の区切りからの時間を段階として記録する
+
+        Arguments:
+            phase -- 段階の名前
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def note(self, name, seconds):
+        """並行に進んだ処理の時間を記録する
+
+        Arguments:
+            name -- 処理の名前
+            seconds -- 時間 (s)
+        """
+        self.background.append((name, seconds))
+
+    @property
+    def elapsed(self):
+        """起動から最後の区切りまでの時間 (s)"""
+        return self._last - self.started
+
+    def format(self):
+        """段階ごとの時間を表にする"""
+        width = max((len(name) for name, _ in
+                     self.phases + self.background), default=0)
+        lines = ['起動時間の内訳:']
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<{width}} {seconds * 1e3:8.1f} ms")
+        lines.append(f"  {'合計':<{width}} {self.elapsed * 1e3:8.1f} ms")
+        for name, seconds in self.background:
+            lines.append(f"  {name:<{width}} {seconds * 1e3:8.1f} ms "
+                         "(別スレッド)")
+        return '\n'.join(lines)
+
+
+def preload(modules):
+    """使うまで読み込まないモジュールを別スレッドで読み込んでおく
+
+    最初の保存などで読み込みを待たないよう、ウィンドウを表示した
+    後に呼ぶ。
+
+    Arguments:
+        modules -- モジュール名のリスト
+
+    Returns: 読み込むスレッド
+    """
+    def load():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                logger.warning(f"{name}を読み込めませんでした: {e}")
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    return thread
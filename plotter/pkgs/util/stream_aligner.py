@@ -0,0 +1,168 @@
+import collections
+
+from pkgs.common.constants import AlignmentSettings
+
+ESP32 = 0
+RP2040 = 1
+
+
+class StreamAligner:
+    """ESP32とRP2040の行を到着時刻で組にする整列段
+
+    RP2040はESP32の送信パルスで割り込み送信するので、本来は1行ずつ
+    対応する。行の欠落や重複で対応がずれても、到着時刻が合わない行を
+    捨てて次の組から同期し直す。デバイス間の到着時刻の差は組にした
+    行から少しずつ追従するので、経路ごとの遅延の違いは吸収される。
+    ESP32の行がmicros()の飛びで欠落と分かったときは、欠落分に当たる
+    RP2040の行を到着時刻が区別できなくても捨てる。
+
+    ESP32の行はmicros()の差から1行ずつの到着時刻を推定する。
+    RP2040の行には時刻が無いので送信周期で割り付ける。そのため
+    RP2040側の欠落は1回の読み取り分の範囲でしか特定できない。
+    """
+    def __init__(self, period=AlignmentSettings.SAMPLE_PERIOD,
+                 tolerance=AlignmentSettings.TOLERANCE,
+                 max_wait=AlignmentSettings.MAX_WAIT,
+                 max_pending=AlignmentSettings.MAX_PENDING,
+                 offset_gain=AlignmentSettings.OFFSET_GAIN):
+        """コンストラクタ
+
+        Keyword Arguments:
+            period -- 送信周期 (s) (default: {AlignmentSettings.SAMPLE_PERIOD})
+            tolerance -- 組にする到着時刻の差の上限 (s)
+                         (default: {AlignmentSettings.TOLERANCE})
+            max_wait -- 相手の行を待つ時間の上限 (s)
+                        (default: {AlignmentSettings.MAX_WAIT})
+            max_pending -- デバイスごとに溜めておく行の上限
+                           (default: {AlignmentSettings.MAX_PENDING})
+            offset_gain -- 到着時刻差の追従の速さ
+                           (default: {AlignmentSettings.OFFSET_GAIN})
+        """
+        self.period = period
+        self.tolerance = tolerance
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.offset_gain = offset_gain
+        self.offset = 0.0  # RP2040の到着時刻 - ESP32の到着時刻 (s)
+        self.pending = (collections.deque(), collections.deque())
+        self.dropped = [0, 0]  # 相手が見つからず捨てた行数 (デバイス別)
+        self.duplicates = 0  # 捨てたESP32の重複行数
+        self.skipped = 0  # micros()の飛びから数えたESP32の欠落行数
+        self._last_stamp = [float('-inf'), float('-inf')]
+        self._last_micros = None
+
+    @property
+    def dropped_count(self):
+        """捨てた行の総数"""
+        return sum(self.dropped) + self.duplicates
+
+    def push(self, index, lines, received_at):
+        """1回の読み取りで届いた行を積む
+
+        Arguments:
+            index -- デバイス番号 (ESP32またはRP2040)
+            lines -- 行のリスト
+            received_at -- 最後の行を受け取った時刻 (time.monotonic())
+        """
+        if not lines:
+            return
+        if index == ESP32:
+            micros = [self._micros(line) for line in lines]
+        else:
+            micros = [None] * len(lines)
+        stamps = self._stamp(received_at, micros)
+
+        queue = self.pending[index]
+        for stamp, line, value in zip(stamps, lines, micros):
+            stamp = max(stamp, self._last_stamp[index])
+            self._last_stamp[index] = stamp
+            gap = self._sequence_gap(value) if index == ESP32 else 0
+            if gap < 0:
+                self.duplicates += 1
+                continue
+            queue.append((stamp, line, gap))
+
+        overflow = len(queue) - self.max_pending
+        for _ in range(overflow):
+            queue.popleft()
+            self.dropped[index] += 1
+
+    def pop_pairs(self, now):
+        """組にできる行をすべて取り出す
+
+        到着時刻が合わない先頭行は古い方を捨てる。相手を待ったまま
+        max_waitを過ぎた行も捨てるので、呼び出しが止まることはない。
+
+        Arguments:
+            now -- 現在時刻 (time.monotonic())
+
+        Returns: (ESP32の行のリスト, RP2040の行のリスト)
+        """
+        esp_queue, rp_queue = self.pending
+        esp_lines, rp_lines = [], []
+        while esp_queue and rp_queue:
+            esp_stamp, esp_line, gap = esp_queue[0]
+            rp_stamp, rp_line, _ = rp_queue[0]
+            lag = rp_stamp - esp_stamp
+            if gap and lag - self.offset <= self.tolerance:
+                # ESP32の欠落分に当たるRP2040の行を捨てる
+                rp_queue.popleft()
+                self.dropped[RP2040] += 1
+                esp_queue[0] = (esp_stamp, esp_line, gap - 1)
+            elif abs(lag - self.offset) <= self.tolerance:
+                esp_queue.popleft()
+                rp_queue.popleft()
+                esp_lines.append(esp_line)
+                rp_lines.append(rp_line)
+                self.offset += self.offset_gain * (lag - self.offset)
+            elif lag > self.offset:
+                esp_queue.popleft()
+                self.dropped[ESP32] += 1
+            else:
+                rp_queue.popleft()
+                self.dropped[RP2040] += 1
+
+        # 相手が来ないまま古くなった行は捨てる
+        for index, queue in enumerate(self.pending):
+            while queue and now - queue[0][0] > self.max_wait:
+                queue.popleft()
+                self.dropped[index] += 1
+        return esp_lines, rp_lines
+
+    def _stamp(self, received_at, micros):
+        """最後の行を基準に各行の到着時刻をさかのぼって推定する"""
+        stamps = [received_at] * len(micros)
+        for i in range(len(micros) - 2, -1, -1):
+            step = self.period
+            if micros[i] is not None and micros[i + 1] is not None:
+                delta = ((micros[i + 1] - micros[i])
+                         % AlignmentSettings.MICROS_WRAP) * 1e-6
+                if delta < self.max_wait:
+                    step = delta
+            stamps[i] = stamps[i + 1] - step
+        return stamps
+
+    def _sequence_gap(self, micros):
+        """ESP32の時刻の並びから直前に欠落した行数を求める
+
+        Returns: 欠落した行数 (直前の行の重複なら-1)
+        """
+        if micros is None:
+            return 0
+        last, self._last_micros = self._last_micros, micros
+        if last is None:
+            return 0
+        delta = (micros - last) % AlignmentSettings.MICROS_WRAP
+        if delta == 0:
+            return -1
+        gap = round(delta * 1e-6 / self.period) - 1
+        if gap <= 0 or delta * 1e-6 >= self.max_wait:
+            return 0
+        self.skipped += gap
+        return gap
+
+    @staticmethod
+    def _micros(line):
+        """ESP32の行 (disp1, disp2, micros) から時刻を取り出す"""
+        value = line.rpartition(',')[2].strip()
+        return int(value) if value.isascii() and value.isdigit() else None
@@ -0,0 +1,291 @@
+import abc
+import queue
+import time
+
+import numpy as np
+
+from pkgs.common.constants import Commands, DataProperties, TriggerSettings
+from pkgs.util.motor_controller import MotorController
+from pkgs.util.motor_writer import QUEUED, MotorWriterError
+from pkgs.util.serial_manager import SerialManagerError
+
+
+STOP_COMMANDS = {1: Commands.MOTOR_STOP1, 2: Commands.MOTOR_STOP2}
+
+
+class Trigger(abc.ABC):
+    """行ごとに評価する停止の条件
+
+    check()は行ブロックを受け取り、条件を満たした最初の行の位置を
+    返す。ブロックをまとめて評価するが、結果は1行ずつ評価したのと
+    同じになる。
+    """
+    def __init__(self, spec, column, motors=TriggerSettings.MOTORS):
+        """コンストラクタ
+
+        Arguments:
+            spec -- 条件を書いた文字列 (表示用)
+            column -- 評価する列の名前 (DataPropertiesの属性名)
+
+        Keyword Arguments:
+            motors -- 条件を満たしたときに止めるモータの番号
+                      (default: {TriggerSettings.MOTORS})
+        """
+        key = DataProperties.get_key(column)
+        if key is None or key == 1:
+            raise TriggerError(f"条件に使えない列です: {column}")
+        self.spec = spec
+        self.column = column
+        self.index = key - 1
+        self.motors = tuple(motors)
+
+    def reset(self):
+        """評価の状態を初めに戻す"""
+
+    @abc.abstractmethod
+    def check(self, rows):
+        """条件を満たした最初の行の位置を返す (満たさなければNone)"""
+
+
+class AboveTrigger(Trigger):
+    """列の値がしきい値を超えたら止める"""
+    def __init__(self, spec, column, threshold,
+                 motors=TriggerSettings.MOTORS):
+        """コンストラクタ
+
+        Arguments:
+            threshold -- しきい値 (計測値の単位)
+        """
+        super().__init__(spec, column, motors)
+        self.threshold = threshold
+
+    def check(self, rows):
+        hits = np.flatnonzero(rows[:, self.index] > self.threshold)
+        return int(hits[0]) if len(hits) else None
+
+
+class DropTrigger(Trigger):
+    """列の値がそれまでのピークから一定の割合だけ下がったら止める
+
+    試料の破断を捉える。ピークがMIN_PEAKに届くまでは評価しない。
+    """
+    def __init__(self, spec, column, percent, motors=TriggerSettings.MOTORS,
+                 min_peak=TriggerSettings.MIN_PEAK):
+        """コンストラクタ
+
+        Arguments:
+            percent -- ピークからの低下の割合 (%)
+
+        Keyword Arguments:
+            min_peak -- 評価を始めるピークの下限
+                        (default: {TriggerSettings.MIN_PEAK})
+        """
+        super().__init__(spec, column, motors)
+        self.ratio = 1 - percent / 100
+        self.min_peak = min_peak
+        self.peak = -np.inf
+
+    def reset(self):
+        self.peak = -np.inf
+
+    def check(self, rows):
+        values = rows[:, self.index]
+        peaks = np.maximum.accumulate(np.maximum(values, self.peak))
+        hits = np.flatnonzero((peaks >= self.min_peak)
+                              & (values <= peaks * self.ratio))
+        if len(hits):
+            self.peak = peaks[hits[0]]
+            return int(hits[0])
+        self.peak = peaks[-1] if len(peaks) else self.peak
+        return None
+
+
+def parse_trigger(spec):
+    """条件の文字列からTriggerを作る
+
+    書式は 種類:列:値[:モータ] で、種類はabove (値を超えたら) か
+    drop (ピークから値%下がったら)。モータは止める番号を並べる
+    (例: 12、省略すると両方)。
+
+        above:Force:2.5      Forceが2.5を超えたら両方止める
+        drop:Force:30        Forceがピークから30%下がったら両方止める
+        above:Disp1:5:1      Disp1が5を超えたらモータ1を止める
+
+    Raises:
+        TriggerError: 書式が正しくない
+    """
+    parts = spec.split(':')
+    if len(parts) not in (3, 4):
+        raise TriggerError(f"条件の書式が正しくありません: {spec}")
+    kind, column, value = parts[:3]
+    try:
+        value = float(value)
+        motors = (tuple(int(m) for m in parts[3]) if len(parts) == 4
+                  else TriggerSettings.MOTORS)
+    except ValueError:
+        raise TriggerError(f"条件の値が正しくありません: {spec}")
+    if not motors or any(m not in STOP_COMMANDS for m in motors):
+        raise TriggerError(f"止めるモータは1か2です: {spec}")
+    if kind == 'above':
+        return AboveTrigger(spec, column, value, motors)
+    if kind == 'drop':
+        if not 0 < value < 100:
+            raise TriggerError(f"低下の割合は0から100の間です: {spec}")
+        return DropTrigger(spec, column, value, motors)
+    raise TriggerError(f"条件の種類はaboveかdropです: {spec}")
+
+
+class TriggerEvent:
+    """条件を満たして止めた記録
+
+    latency -- 行を受信してからコマンドを頼むまでの時間 (s)
+    commands -- 頼んだMotorCommand (その場で書き込んだときはNone)
+    """
+    def __init__(self, trigger: Trigger, row, received_at, fired_at):
+        """コンストラクタ"""
+        self.spec = trigger.spec
+        self.row = row
+        self.value = float(row[trigger.index])
+        self.received_at = received_at
+        self.fired_at = fired_at
+        self.latency = fired_at - received_at
+        self.commands = []
+        self.written_at = None  # その場で書き込み終えた時刻
+        self.error = None
+
+    @property
+    def command_latency(self):
+        """条件を満たしてからモータへ書き込み終えるまでの時間 (s)
+
+        書き込みスレッドがまだ送っていなければNone
+        """
+        sent = [command.sent_at for command in self.commands
+                if command is not None and command.sent_at is not None]
+        if sent:
+            return max(sent) - self.fired_at
+        if self.written_at is not None:
+            return self.written_at - self.fired_at
+        return None
+
+    @property
+    def settled(self):
+        """頼んだコマンドをすべて送り終えたか (失敗や打ち消しを含む)"""
+        return all(command is None or command.status != QUEUED
+                   for command in self.commands)
+
+    def summary(self):
+        """記録を辞書で返す
+
+        device_clockは行のmicros()を秒にしたままの値 (計測開始からの
+        時刻でなく、周回の補正もしていない)。
+        """
+        return {
+            'trigger': self.spec,
+            'value': self.value,
+            'device_clock': float(self.row[0]),
+            'detect_latency': self.latency,
+            'command_latency': self.command_latency,
+            'error': self.error,
+        }
+
+
+class TriggerEngine:
+    """取得の経路で停止の条件を評価する
+
+    取得スレッドが解析した行ブロックをキューに積む前にprocess()を
+    呼ぶので、GUIの取り込みや描画を待たずにモータを止める。
+    各条件は1回だけ働き、reset()で元に戻る。
+    コマンドを送り終えるまでの時間は、drain()で送信を確かめたときに
+    'trigger_command'として記録する。
+    """
+    def __init__(self, triggers, mc: MotorController, stats=None):
+        """コンストラクタ
+
+        Arguments:
+            triggers -- Triggerのリスト
+            mc -- 停止のコマンドを送るMotorControllerオブジェクト
+
+        Keyword Arguments:
+            stats -- 所要時間を記録するLatencyStatsオブジェクト
+                     (default: {None})
+        """
+        self.triggers = list(triggers)
+        self.mc = mc
+        self.stats = stats
+        self.armed = list(self.triggers)
+        self.events = []  # TriggerEvent
+        self.fired = queue.Queue()  # GUIに知らせるTriggerEvent
+        self._unsent = []  # 送信の所要時間をまだ記録していないTriggerEvent
+
+    def reset(self):
+        """すべての条件を元に戻し、前の計測の記録を破棄する"""
+        for trigger in self.triggers:
+            trigger.reset()
+        self.armed = list(self.triggers)
+        self.events = []
+        self.fired = queue.Queue()  # まだ知らせていない前の計測の記録も捨てる
+        self._unsent = []
+
+    def process(self, rows, received_at):
+        """行ブロックで条件を評価し、満たしたらモータを止める
+
+        Arguments:
+            rows -- 解析した行ブロック
+            received_at -- 行を受信した時刻 (time.monotonic())
+        """
+        for trigger in list(self.armed):
+            index = trigger.check(rows)
+            if index is None:
+                continue
+            self.armed.remove(trigger)
+            self._fire(TriggerEvent(trigger, rows[index].copy(),
+                                    received_at, time.monotonic()),
+                       trigger.motors)
+
+    def _fire(self, event: TriggerEvent, motors):
+        """停止のコマンドを送り、記録する"""
+        try:
+            for motor in motors:
+                event.commands.append(self.mc.send(STOP_COMMANDS[motor]))
+            if self.mc.writer is None:
+                event.written_at = time.monotonic()
+        except (MotorWriterError, SerialManagerError) as e:
+            event.error = str(e)
+        if self.stats is not None:
+            self.stats.record('trigger', event.latency)
+        self.events.append(event)
+        self.fired.put(event)
+
+    def drain(self):
+        """条件を満たした記録をすべて取り出す
+
+        取り出す側のスレッドで、送り終えたコマンドの所要時間も記録する。
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.fired.get_nowait())
+            except queue.Empty:
+                break
+        self._unsent.extend(events)
+        self._record_sent()
+        return events
+
+    def _record_sent(self):
+        """送り終えた記録の、条件を満たしてから書き込むまでの時間を記録する"""
+        unsent = []
+        for event in self._unsent:
+            if not event.settled:
+                unsent.append(event)
+            elif (self.stats is not None
+                  and event.command_latency is not None):
+                self.stats.record('trigger_command', event.command_latency)
+        self._unsent = unsent
+
+    def summary(self):
+        """条件ごとの記録をリストで返す"""
+        return [event.summary() for event in self.events]
+
+
+class TriggerError(Exception):
+    pass
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# pkgsをplotter/から読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 画面の無い環境でもQtのテストを動かす
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from pkgs.common.constants import SaveSettings  # noqa: E402
+
+
+@pytest.fixture
+def out_dir(tmp_path, monkeypatch):
+    """一時ディレクトリに移り、保存先のout/を作る"""
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / SaveSettings.OUT_DIR
+    path.mkdir()
+    return path
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    """Qtのテストで使うQApplication"""
+    from PyQt6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from pkgs.util.compact_buffer import CompactBuffer, CompactBufferError
+from pkgs.util.plot_array_handler import PlotArrayHandler
+
+
+def device_lines_pair(n, seed=0):
+    """スケッチと同じ書式のESP32とRP2040の行"""
+    rng = np.random.default_rng(seed)
+    esp = [f"{d1:.2f},{d2:.2f},{t}" for d1, d2, t in zip(
+        rng.uniform(-50, 50, n), rng.uniform(-50, 50, n),
+        np.cumsum(rng.integers(9000, 11000, n)))]
+    rp = [f"{a},{b},{c}" for a, b, c in rng.integers(0, 4096, (n, 3))]
+    return esp, rp
+
+
+def device_rows(n, seed=0):
+    """スケッチと同じ書式の行を解析した行"""
+    esp, rp = device_lines_pair(n, seed)
+    data, _ = PlotArrayHandler.process_batch(esp, rp)
+    return esp, data
+
+
+def test_keeps_parsed_values_exactly():
+    esp, data = device_rows(1000)
+    buffer = CompactBuffer(capacity=16)
+    for start in range(0, len(data), 77):
+        buffer.extend(data[start:start + 77])
+    np.testing.assert_array_equal(buffer.rows(), data)
+    np.testing.assert_array_equal(np.asarray(buffer.columns()[3]), data[:, 3])
+    assert buffer.rows(10, 11)[0, 3] == float(esp[10].split(',')[0])
+
+
+def test_is_smaller_than_float64():
+    _, data = device_rows(1000)
+    buffer = CompactBuffer()
+    buffer.extend(data)
+    assert buffer.nbytes < data.nbytes / 2
+
+
+def test_time_column_searchsorted_matches_decoded():
+    _, data = device_rows(500)
+    buffer = CompactBuffer()
+    buffer.extend(data)
+    t = buffer.columns()[0]
+    for value in (data[0, 0], data[123, 0], data[-1, 0] + 1):
+        assert t.searchsorted(value) == np.searchsorted(data[:, 0], value)
+
+
+@pytest.mark.parametrize('esp_line, rp_line', [
+    ('1.00,2.00,3', '100,70000,-5'),  # ADC値がuint16に収まらない
+    ('nan,2.00,3', '1,2,3'),
+    ('1.00,inf,3', '1,2,3'),
+    ('3e7,2.00,3', '1,2,3'),  # 変位がint32に収まらない
+])
+def test_out_of_range_rows_are_kept_out_of_both_buffers(esp_line, rp_line):
+    """型に収まらない行は不正な行とし、どちらの配列にも入れない"""
+    esp, rp = device_lines_pair(5)
+    esp[2], rp[2] = esp_line, rp_line
+    rows = []
+    for compact in (False, True):
+        handler = PlotArrayHandler(compact=compact)
+        data, mask = handler.process_batch(esp, rp)
+        assert mask.tolist() == [True, True, False, True, True]
+        handler.update_arrays(data[mask])
+        rows.append(handler.data_buffer.rows())
+    np.testing.assert_array_equal(rows[0], rows[1])
+    with pytest.raises(CompactBufferError):
+        CompactBuffer().extend(data[2])  # NaNの行
+    buffer = CompactBuffer()
+    unchecked = data[:2].copy()
+    unchecked[1, 1] = 70000 * 3.3 / 4095
+    with pytest.raises(CompactBufferError):
+        buffer.extend(unchecked)
+    assert len(buffer) == 0  # 一部の行だけを追加しない
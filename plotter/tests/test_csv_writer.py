@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pkgs.common.constants import DataProperties, SaveSettings
+from pkgs.util.csv_writer import StreamingCsvWriter
+from pkgs.util.plot_array_handler import PlotArrayHandler
+
+
+def sample_rows(n, seed=0):
+    """NaNや大小さまざまな値を含む行"""
+    rng = np.random.default_rng(seed)
+    rows = rng.normal(scale=1e3, size=(n, 6))
+    rows[:, 0] = np.arange(n) * 0.01
+    rows[5, 2] = np.nan
+    rows[6, 3] = 1e-300
+    rows[7, 4] = -0.0
+    rows[8, 5] = 1 / 3
+    return rows
+
+
+def to_csv(rows, path):
+    pd.DataFrame(rows, columns=DataProperties.list_properties()).to_csv(
+        path, index=False)
+    return path.read_bytes()
+
+
+def test_streamed_csv_matches_to_csv(tmp_path):
+    rows = sample_rows(1000)
+    writer = StreamingCsvWriter(tmp_path / 'stream.csv')
+    writer.start()
+    for start in range(0, len(rows), 128):
+        writer.write(rows[start:start + 128])
+    writer.close()
+    assert writer.written == len(rows)
+    assert (tmp_path / 'stream.csv').read_bytes() == \
+        to_csv(rows, tmp_path / 'pandas.csv')
+
+
+def test_empty_csv_matches_to_csv(tmp_path):
+    writer = StreamingCsvWriter(tmp_path / 'stream.csv')
+    writer.start()
+    writer.close()
+    assert (tmp_path / 'stream.csv').read_bytes() == \
+        to_csv(np.empty((0, 6)), tmp_path / 'pandas.csv')
+
+
+@pytest.mark.parametrize('running', [True, False])
+def test_autosave_is_saved_like_to_csv(out_dir, running):
+    """計測中でも停止後でも、保存したCSVはto_csvと同じ"""
+    rows = sample_rows(2 * SaveSettings.CHUNK_ROWS + 7)
+    handler = PlotArrayHandler()
+    handler.start_autosave('run.20260101-000000')
+    for start in range(0, len(rows), 100):
+        handler.update_arrays(rows[start:start + 100])
+    if not running:
+        handler.stop_autosave()
+    handler.save_to_csv('run')
+    assert (out_dir / 'run.csv').read_bytes() == \
+        to_csv(rows, out_dir.parent / 'pandas.csv')
+    handler.stop_autosave()
+    partial = out_dir / f"run.20260101-000000{SaveSettings.PARTIAL_SUFFIX}.csv"
+    assert partial.exists() == running
+
+
+def test_saving_under_another_name_copies_the_saved_csv(out_dir):
+    rows = sample_rows(50)
+    handler = PlotArrayHandler()
+    handler.start_autosave('run.20260101-000000')
+    handler.update_arrays(rows)
+    handler.stop_autosave()
+    handler.save_to_csv('run')
+    handler.save_to_csv('copy')
+    assert (out_dir / 'run.csv').read_bytes() == \
+        (out_dir / 'copy.csv').read_bytes()
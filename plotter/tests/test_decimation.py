@@ -0,0 +1,51 @@
+import numpy as np
+
+from pkgs.util.compact_buffer import CompactBuffer
+from pkgs.util.decimation import minmax_decimate, visible_slice
+
+
+def test_keeps_minimum_and_maximum_of_each_bin():
+    rng = np.random.default_rng(0)
+    t = np.arange(1000, dtype=float)
+    y = rng.normal(size=1000)
+    y[517] = 50.0  # 1点だけの細いピーク
+    t_out, (y_out,) = minmax_decimate(t, [y], num_bins=100)
+    assert len(t_out) == len(y_out) == 200
+    bins = y.reshape(100, 10)
+    np.testing.assert_array_equal(y_out[0::2], bins.min(axis=1))
+    np.testing.assert_array_equal(y_out[1::2], bins.max(axis=1))
+    np.testing.assert_array_equal(t_out[0::2], t[::10])
+    assert y_out.max() == 50.0
+
+
+def test_leftover_points_are_appended_unchanged():
+    t = np.arange(105, dtype=float)
+    y = np.sin(t)
+    t_out, (y_out,) = minmax_decimate(t, [y], num_bins=10)
+    np.testing.assert_array_equal(t_out[-5:], t[100:])
+    np.testing.assert_array_equal(y_out[-5:], y[100:])
+    assert y_out.min() == y.min() and y_out.max() == y.max()
+
+
+def test_small_inputs_are_not_decimated():
+    t = np.arange(15, dtype=float)
+    y = t * 2
+    t_out, (y_out,) = minmax_decimate(t, [y], num_bins=10)
+    assert t_out is t and y_out is y
+
+
+def test_visible_slice_includes_one_point_beyond_each_edge():
+    t = np.arange(0, 10, 0.5)
+    window = visible_slice(t, 2.2, 4.1)
+    assert t[window][0] == 2.0 and t[window][-1] == 4.5
+    assert visible_slice(t, -5, 100) == slice(0, len(t))
+
+
+def test_visible_slice_works_on_compact_columns():
+    buffer = CompactBuffer()
+    rows = np.zeros((100, 6))
+    rows[:, 0] = np.arange(100) * 0.01
+    buffer.extend(rows)
+    t = buffer.columns()[0]
+    window = visible_slice(t, 0.25, 0.5)
+    np.testing.assert_allclose(t[window][[0, -1]], [0.24, 0.51])
@@ -0,0 +1,116 @@
+import contextlib
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from pkgs.common.constants import AlignmentSettings, SaveSettings
+from pkgs.common.headless_executor import HeadlessExecutor
+from pkgs.util.device_simulator import DeviceSimulator
+from pkgs.util.serial_manager import SerialManager
+from pkgs.util.trigger import parse_trigger
+
+
+@contextlib.contextmanager
+def running_device(**options):
+    """仮想デバイスを動かし、両方のポートを開く"""
+    sim = DeviceSimulator(seed=0, **options)
+    sim.start()
+    managers = SerialManager(), SerialManager()
+    try:
+        for sm, port in zip(managers, sim.ports):
+            sm.open_port(port)
+        yield sim, managers
+    finally:
+        for sm in managers:
+            sm.close_port()
+        sim.stop()
+
+
+@pytest.fixture
+def device(out_dir):
+    with running_device() as device:
+        yield device
+
+
+def assert_periodic(t):
+    """時刻が送信周期の倍数ずつ増えていく (組にできず捨てた行の分は飛ぶ)"""
+    steps = np.diff(t) / AlignmentSettings.SAMPLE_PERIOD
+    np.testing.assert_allclose(steps, np.rint(steps), atol=0.2)
+    assert np.all(np.rint(steps) >= 1)
+    assert np.mean(np.rint(steps) == 1) > 0.9
+
+
+def measure(managers, file_name, max_rows, triggers=(), on_start=None,
+            use_asyncio=False):
+    """max_rows行を記録して保存したCSVの行を返す"""
+    executor = HeadlessExecutor(*managers, use_asyncio=use_asyncio,
+                                max_rows=max_rows, triggers=triggers,
+                                out=lambda line: None)
+    started = []
+
+    def should_stop():
+        if on_start is not None and not started:
+            started.append(True)
+            on_start(executor)
+        return False
+
+    assert executor.run(file_name, duration=20,
+                        should_stop=should_stop) == max_rows
+    return executor, np.loadtxt(f"{SaveSettings.OUT_DIR}/{file_name}.csv",
+                                delimiter=',', skiprows=1, ndmin=2)
+
+
+def test_rows_arrive_every_period(device):
+    sim, managers = device
+    _, rows = measure(managers, 'sim', 100)
+    assert not sim.streaming
+    assert_periodic(rows[:, 0])
+
+
+def test_asyncio_engine_records_the_same_stream(device):
+    from pkgs.util.async_acquisition import AsyncAcquisitionEngine
+    sim, managers = device
+    workers = []
+    _, rows = measure(
+        managers, 'async', 100, use_asyncio=True,
+        on_start=lambda executor: workers.append(executor.session.worker))
+    assert isinstance(workers[0], AsyncAcquisitionEngine)
+    assert not sim.streaming
+    assert_periodic(rows[:, 0])
+    # 停止後もポートは開いたままで、同期の取得にそのまま使える
+    assert all(sm.ser.is_open for sm in managers)
+    _, rows = measure(managers, 'sync', 50)
+    assert_periodic(rows[:, 0])
+
+
+def test_session_imports_serial_asyncio_only_when_used():
+    code = ('import sys; import pkgs.common.acquisition_session; '
+            'print("serial_asyncio" in sys.modules)')
+    result = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(__file__)))
+    assert result.stdout.strip() == 'False'
+
+
+def test_trigger_stops_the_motor_on_the_device(device):
+    sim, managers = device
+    executor, rows = measure(
+        managers, 'trigger', 150, [parse_trigger('above:Disp1:0.3:1')],
+        on_start=lambda executor: executor.mc.start_motor1())
+    assert not sim.running[0]
+    [event] = executor.session.trigger.summary()
+    assert event['value'] > 0.3 and event['error'] is None
+    # 止めた後も記録は続き、変位は止めたところから動かない
+    disp1 = rows[:, 3]
+    assert 0.3 < disp1[-1] < 0.5
+    assert (disp1 == disp1[-1]).sum() > 50
+
+
+def test_micros_wraparound_keeps_time_increasing(out_dir):
+    offset = AlignmentSettings.MICROS_WRAP - 500_000
+    with running_device(micros_offset=offset) as (_, managers):
+        _, rows = measure(managers, 'wrap', 150)
+    assert_periodic(rows[:, 0])
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from pkgs.common.constants import (ArithmeticConstants, JournalSettings,
+                                   SaveSettings)
+from pkgs.util.journal import (FOOTER_PREFIX, JournalWriter, find_unrecovered,
+                               is_closed, read_journal, recover,
+                               recovered_path)
+from pkgs.util.plot_array_handler import PlotArrayHandler
+from pkgs.util.session_archive import SessionArchiveReader
+from pkgs.util.stream_aligner import ESP32, RP2040
+
+PERIOD = 0.01
+
+
+def device_reads(n, per_read=5):
+    """スケッチの書式の行を、per_read行ずつ2台から読んだ順に並べる"""
+    esp = [f"{i * 0.01:.2f},{-i * 0.01:.2f},{1_000_000 + i * 10_000}"
+           for i in range(n)]
+    rp = [f"{i % 4096},{(2 * i) % 4096},{(3 * i) % 4096}" for i in range(n)]
+    reads = []
+    for start in range(0, n, per_read):
+        now = (start + per_read) * PERIOD
+        reads.append((ESP32, now, esp[start:start + per_read]))
+        reads.append((RP2040, now + 0.001, rp[start:start + per_read]))
+    return esp, rp, reads
+
+
+def write_journal(path, reads, crash=False):
+    """ジャーナルを書く (crashなら閉じた印の行を消して異常終了を装う)"""
+    journal = JournalWriter(str(path), fsync_interval=0.01)
+    journal.start()
+    for index, received_at, lines in reads:
+        journal.record(index, lines, received_at)
+    journal.close()
+    if crash:
+        lines = path.read_text().splitlines(keepends=True)
+        path.write_text(''.join(lines[:-1]))
+
+
+def expected_rows(esp, rp):
+    data, mask = PlotArrayHandler.process_batch(esp, rp)
+    assert mask.all()
+    data[:, 0] -= data[0, 0]
+    return data
+
+
+def test_recover_matches_process_batch(out_dir):
+    esp, rp, reads = device_reads(200)
+    path = out_dir / f"run{JournalSettings.SUFFIX}"
+    write_journal(path, reads)
+    count, dropped = recover(str(path), csv_path=str(out_dir / 'run.csv'))
+    assert (count, dropped) == (200, 0)
+    recovered = SessionArchiveReader(recovered_path(str(path))).read()
+    np.testing.assert_allclose(recovered, expected_rows(esp, rp),
+                               rtol=0, atol=1e-12)
+    assert (out_dir / 'run.csv').read_text().count('\n') == 201
+
+
+def test_read_journal_groups_lines_by_read(out_dir):
+    _, _, reads = device_reads(20)
+    path = out_dir / f"run{JournalSettings.SUFFIX}"
+    write_journal(path, reads)
+    assert list(read_journal(str(path))) == reads
+
+
+def test_crashed_journal_is_recovered_up_to_the_torn_line(out_dir):
+    esp, rp, reads = device_reads(100)
+    path = out_dir / f"run{JournalSettings.SUFFIX}"
+    write_journal(path, reads)
+    lines = path.read_text().splitlines(keepends=True)
+    assert lines[-1].startswith(FOOTER_PREFIX)
+    # RP2040の最後の読み取りの1行目を書きかけで止める
+    path.write_text(''.join(lines[:-6]) + lines[-6][:7])
+    assert not is_closed(str(path))
+    count, _ = recover(str(path))
+    assert count == 95
+    recovered = SessionArchiveReader(recovered_path(str(path))).read()
+    np.testing.assert_allclose(recovered, expected_rows(esp, rp)[:count],
+                               rtol=0, atol=1e-12)
+
+
+def test_micros_wraparound_is_joined(out_dir):
+    wrap = 2**32
+    micros = [wrap - 20_000, wrap - 10_000, 0, 10_000]
+    esp = [f"0.00,0.00,{t}" for t in micros]
+    rp = ['1,2,3'] * 4
+    path = out_dir / f"wrap{JournalSettings.SUFFIX}"
+    write_journal(path, [(ESP32, 0.04, esp), (RP2040, 0.04, rp)])
+    recover(str(path))
+    t = SessionArchiveReader(recovered_path(str(path))).read()[:, 0]
+    np.testing.assert_allclose(t, np.arange(4) * 0.01,
+                               atol=ArithmeticConstants.MICRO)
+
+
+def test_journal_is_never_overwritten(out_dir):
+    path = out_dir / f"run{JournalSettings.SUFFIX}"
+    write_journal(path, device_reads(10)[2])
+    before = path.read_text()
+    with pytest.raises(FileExistsError):
+        JournalWriter(str(path))
+    assert path.read_text() == before
+
+
+def test_find_unrecovered(out_dir):
+    reads = device_reads(10)[2]
+    suffix = JournalSettings.SUFFIX
+    write_journal(out_dir / f"run.20260101-000000{suffix}", reads)
+    write_journal(out_dir / f"run.20260101-000100{suffix}", reads, crash=True)
+    write_journal(out_dir / f"other.20260101-000000{suffix}", reads,
+                  crash=True)
+    path = f"{out_dir.name}/run.20260101-000100{suffix}"
+    assert is_closed(f"{out_dir.name}/run.20260101-000000{suffix}")
+    assert find_unrecovered('run') == [path]
+    recover(path)
+    assert find_unrecovered('run') == []
+
+
+def test_find_unrecovered_uses_the_current_out_dir(out_dir, monkeypatch):
+    """保存先は呼び出したときの設定を使う"""
+    other = out_dir.parent / 'elsewhere'
+    other.mkdir()
+    path = other / f"run.20260101-000000{JournalSettings.SUFFIX}"
+    write_journal(path, device_reads(10)[2], crash=True)
+    assert find_unrecovered('run') == []
+    monkeypatch.setattr(SaveSettings, 'OUT_DIR', str(other))
+    assert find_unrecovered('run') == [str(path)]
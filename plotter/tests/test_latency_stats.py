@@ -0,0 +1,75 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from pkgs.util.latency_stats import LatencyStats, StageTimer
+
+
+def test_percentiles_use_the_recent_window():
+    timer = StageTimer(window=100)
+    for _ in range(1000):
+        timer.record(1.0)
+    for i in range(100):
+        timer.record(i * 1e-3)  # 直近の100個で古い値を押し出す
+    p50, p99 = timer.percentiles()
+    assert p50 == pytest.approx(np.percentile(np.arange(100) * 1e-3, 50))
+    assert p99 < 0.1
+    assert timer.count == 1100
+    assert timer.maximum == 1.0
+
+
+def test_histogram_counts_every_sample_in_power_of_two_bins():
+    timer = StageTimer(bins=8)
+    for seconds in (0, 0.5e-6, 1e-6, 3e-6, 1.0):
+        timer.record(seconds)
+    summary = timer.summary()
+    assert summary['histogram_us'] == {'<1': 2, '<2': 1, '<4': 1, '<128': 1}
+    assert sum(timer.histogram) == timer.count == 5
+    assert summary['mean'] == pytest.approx(sum((0, 0.5e-6, 1e-6, 3e-6, 1))
+                                            / 5)
+
+
+def test_empty_timer():
+    timer = StageTimer()
+    assert timer.percentiles() == [None, None]
+    assert timer.summary()['mean'] is None
+
+
+def test_format_line_skips_missing_stages():
+    stats = LatencyStats()
+    stats.record('parse', 0.002)
+    stats.record('ingest', 0.010)
+    assert stats.format_line(['read', 'parse', 'ingest']) == \
+        'parse 2.00/2.00 | ingest 10.00/10.00'
+
+
+def test_stages_are_added_from_several_threads():
+    """段ごとの記録は1つのスレッドから、段の追加は同時でもよい"""
+    stats = LatencyStats()
+
+    def record(name):
+        for _ in range(1000):
+            stats.record(name, 1e-3)
+
+    threads = [threading.Thread(target=record, args=(name,))
+               for name in ('a', 'b', 'c', 'd')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(stats.stages) == {'a', 'b', 'c', 'd'}
+    assert all(timer.count == 1000 for timer in stats.stages.values())
+
+
+def test_dump_and_reset(tmp_path):
+    stats = LatencyStats()
+    stats.record('parse', 0.001)
+    path = tmp_path / 'run.stats.json'
+    stats.dump(path, {'rows': 10})
+    dumped = json.loads(path.read_text(encoding='utf-8'))
+    assert dumped['rows'] == 10
+    assert dumped['stages']['parse']['count'] == 1
+    stats.reset()
+    assert stats.summary() == {'stages': {}}
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from pkgs.common.constants import Commands
+from pkgs.util.motor_writer import (COALESCED, SENT, MotorCommand,
+                                    MotorCommandWriter, coalesce)
+
+S1, T1, R1 = (Commands.MOTOR_START1, Commands.MOTOR_STOP1,
+              Commands.MOTOR_REVERSE1)
+S2, T2, R2 = (Commands.MOTOR_START2, Commands.MOTOR_STOP2,
+              Commands.MOTOR_REVERSE2)
+
+
+def commands(*names):
+    return [MotorCommand(name, 0.0) for name in names]
+
+
+def sent(*names):
+    return [item.command for item in coalesce(commands(*names))]
+
+
+@pytest.mark.parametrize('names, expected', [
+    ((S1, T1, S1), [S1]),  # 反転を挟まない開始/停止は最後だけ
+    ((S1, R1, R1, T1), [S1, T1]),  # 反転の対は打ち消す
+    ((S1, R1, T1), [S1, R1, T1]),  # 反転をまたいでまとめない
+    ((R1, S1, R1), [R1, S1, R1]),  # 開始を挟んだ反転は打ち消さない
+    ((R1, R1, R1), [R1]),
+    ((S1, S2, T1, T2), [T1, T2]),  # モータごとに独立
+    ((S1, Commands.PLOT_STOP, T1), [Commands.PLOT_STOP, T1]),
+])
+def test_coalesce(names, expected):
+    assert sent(*names) == expected
+
+
+def test_coalesce_keeps_request_order():
+    items = commands(S2, S1, R2, R1, T2)
+    assert coalesce(items) == items
+
+
+class SlowPort:
+    """書き込みに時間のかかるポート"""
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.written = []
+        self.lock = threading.Lock()
+
+    def write(self, command):
+        time.sleep(self.delay)
+        with self.lock:
+            self.written.append(command)
+
+
+def test_writer_coalesces_commands_queued_during_a_write():
+    port = SlowPort()
+    writer = MotorCommandWriter(port)
+    writer.start()
+    try:
+        items = [writer.send(name) for name in (S1, S1, S1, T1)]
+        assert writer.flush()
+    finally:
+        writer.stop()
+    assert port.written[-1] == T1
+    assert len(port.written) < len(items)
+    statuses = [item.status for item in items]
+    assert set(statuses) <= {SENT, COALESCED}
+    assert statuses.count(SENT) == len(port.written)
+    assert all(item.sent_at >= item.queued_at
+               for item in items if item.status == SENT)
+
+
+def test_flush_waits_until_queued_commands_are_written():
+    port = SlowPort(delay=0.05)
+    writer = MotorCommandWriter(port)
+    writer.start()
+    try:
+        writer.send(S1)
+        writer.send(R2)
+        assert writer.flush(timeout=2.0)
+        assert port.written == [S1, R2]
+        writer.send(T1)
+        assert not writer.flush(timeout=0.001)
+    finally:
+        writer.stop()
+    assert port.written == [S1, R2, T1]
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from pkgs.common.constants import AcquisitionSettings, ArithmeticConstants
+from pkgs.util.plot_array_handler import PlotArrayHandler
+
+
+def legacy_parse(input1, input2):
+    """1組ずつ解析していた元のprocess_data"""
+    try:
+        tmp3, tmp4, tmp6 = input1.split(",")
+        tmp5, tmp1, tmp2 = input2.split(",")
+        tmp1 = float(tmp1) * 3.3 / 4095
+        tmp2 = float(tmp2) * 3.3 / 4095
+        tmp3 = float(tmp3)
+        tmp4 = float(tmp4)
+        tmp5 = float(tmp5) * 3.3 / 4095
+        tmp6 = float(tmp6) * ArithmeticConstants.MICRO
+        return np.array([tmp6, tmp1, tmp2, tmp3, tmp4, tmp5])
+    except ValueError:
+        return None
+
+
+def device_lines(n, seed=0):
+    """スケッチと同じ書式の行をn組作る"""
+    rng = np.random.default_rng(seed)
+    esp = [f"{d1:.2f},{d2:.2f},{t}" for d1, d2, t in zip(
+        rng.uniform(-5, 5, n), rng.uniform(-5, 5, n),
+        np.cumsum(rng.integers(9000, 11000, n)))]
+    rp = [f"{a},{b},{c}" for a, b, c in rng.integers(0, 4096, (n, 3))]
+    return esp, rp
+
+
+def test_batch_matches_legacy_parser():
+    esp, rp = device_lines(500)
+    data, mask = PlotArrayHandler.process_batch(esp, rp)
+    assert mask.all()
+    expected = np.array([legacy_parse(a, b) for a, b in zip(esp, rp)])
+    np.testing.assert_array_equal(data, expected)
+
+
+@pytest.mark.parametrize('bad', [
+    '1.00,2.00', '1.00,2.00,3,4', 'abc,2.00,3', '', '1.00,,3'])
+def test_invalid_lines_are_masked_like_legacy(bad):
+    esp, rp = device_lines(5)
+    esp[2] = bad
+    data, mask = PlotArrayHandler.process_batch(esp, rp)
+    assert mask.tolist() == [True, True, False, True, True]
+    assert np.isnan(data[2]).all()
+    for i in (0, 1, 3, 4):
+        np.testing.assert_array_equal(data[i], legacy_parse(esp[i], rp[i]))
+
+
+@pytest.mark.parametrize('line', [
+    '1_0,2.00,3',  # 桁区切り
+    '\u0661,2.00,3',  # アラビア数字
+    '1.00,\uff12,3',  # 全角数字
+    '1.00,2.00,1\u00a0',  # ノーブレークスペース
+])
+def test_validity_does_not_depend_on_the_batch(line):
+    """float()が受け付けてもASCIIの数字でない行は、単独でも混ぜても不正"""
+    esp, rp = device_lines(3)
+    _, alone_mask = PlotArrayHandler.process_batch([line], rp[:1])
+    _, mixed_mask = PlotArrayHandler.process_batch(
+        [esp[0], line, esp[2]], rp)
+    assert not alone_mask[0]
+    assert mixed_mask.tolist() == [True, False, True]
+
+
+def test_short_and_long_batches_agree():
+    """短いバッチを1組ずつ解析しても、まとめた解析と同じ結果になる"""
+    n = AcquisitionSettings.SMALL_BATCH + 1
+    esp, rp = device_lines(n)
+    esp[1:5] = [' 1.5 ,-2e1,30', 'nan,inf,3', '1_0,2.00,3', '1.00,2.00']
+    rp[6] = '4,5,\uff16'
+    rp[7] = '100,70000,-5'
+    data, mask = PlotArrayHandler.process_batch(esp, rp)
+    assert mask.tolist()[1:8] == [True, False, False, False, True, False,
+                                  False]
+    for start in range(n):
+        short, short_mask = PlotArrayHandler.process_batch(
+            esp[start:start + 1], rp[start:start + 1])
+        np.testing.assert_array_equal(short, data[start:start + 1])
+        assert short_mask.tolist() == mask.tolist()[start:start + 1]
+    short, short_mask = PlotArrayHandler.process_batch(esp[:-1], rp[:-1])
+    np.testing.assert_array_equal(short, data[:-1])
+    np.testing.assert_array_equal(short_mask, mask[:-1])
+
+
+def test_process_data_returns_none_for_invalid_pair():
+    handler = PlotArrayHandler()
+    assert handler.process_data('1.00,2.00,3', 'x,1,2') is None
+    np.testing.assert_array_equal(
+        handler.process_data('1.00,2.00,3', '4,5,6'),
+        legacy_parse('1.00,2.00,3', '4,5,6'))
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from pkgs.common.constants import DeviceIds
+from pkgs.util.port_enumeration import (ESP32, RP2040, PortInfo, device_kind,
+                                        diff_ports)
+
+ESP32_ID = DeviceIds.ESP32[0]
+RP2040_ID = DeviceIds.RP2040[0]
+
+
+def ports(*infos):
+    return {info.device: info for info in infos}
+
+
+def test_device_kind():
+    assert device_kind(*ESP32_ID) == ESP32
+    assert device_kind(*RP2040_ID) == RP2040
+    assert device_kind(None, None) is None
+    assert PortInfo('/dev/ttyUSB0', *ESP32_ID).label == \
+        '/dev/ttyUSB0 (ESP32)'
+    assert PortInfo('/dev/ttyS0').label == '/dev/ttyS0'
+
+
+def test_diff_ports():
+    esp = PortInfo('/dev/ttyUSB0', *ESP32_ID)
+    rp = PortInfo('/dev/ttyACM0', *RP2040_ID)
+    assert diff_ports({}, ports(esp)) == ([esp], [])
+    assert diff_ports(ports(esp), ports(esp, rp)) == ([rp], [])
+    assert diff_ports(ports(esp, rp), ports(rp)) == ([], [esp])
+    assert diff_ports(ports(esp), ports(esp)) == ([], [])
+
+
+def test_diff_ports_reports_a_reused_name_as_both():
+    """同じポート名に別のデバイスが挿さったら、抜けたものと加わったもの"""
+    old = PortInfo('/dev/ttyUSB0', *ESP32_ID)
+    new = PortInfo('/dev/ttyUSB0', *RP2040_ID)
+    assert diff_ports(ports(old), ports(new)) == ([new], [old])
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    """列挙の結果を差し替えたPortWatcher"""
+    from pkgs.gui import port_watcher
+    enumerated = []  # 列挙の結果 (例外なら送出する)
+
+    def enumerate_ports():
+        result = enumerated.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(port_watcher, 'enumerate_ports', enumerate_ports)
+    watcher = port_watcher.PortWatcher()
+    watcher._started = time.perf_counter()
+    changes, failures = [], []
+    watcher.changed.connect(lambda added, removed:
+                            changes.append((added, removed)))
+    watcher.failed.connect(failures.append)
+    return watcher, enumerated, changes, failures
+
+
+def test_watcher_emits_only_on_changes(watcher):
+    watcher, enumerated, changes, _ = watcher
+    esp = PortInfo('/dev/ttyUSB0', *ESP32_ID)
+    enumerated.extend([{}, {}, ports(esp), ports(esp), {}])
+    for _ in range(5):
+        watcher._scan()
+    assert changes == [([], []), ([esp], []), ([], [esp])]
+    assert watcher.elapsed is not None
+
+
+def test_watcher_reports_the_same_error_once(watcher):
+    watcher, enumerated, changes, failures = watcher
+    esp = PortInfo('/dev/ttyUSB0', *ESP32_ID)
+    enumerated.extend([OSError('busy'), OSError('busy'), ports(esp),
+                       OSError('busy')])
+    for _ in range(4):
+        watcher._scan()
+    assert failures == ['ポートの一覧を取得できませんでした: busy'] * 2
+    assert changes == [([esp], [])]
+    assert watcher.ports == ports(esp)  # 失敗しても前回の列挙を保つ
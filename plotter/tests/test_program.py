@@ -0,0 +1,148 @@
+import csv
+import json
+import time
+
+import numpy as np
+import pytest
+
+from pkgs.common.constants import Commands
+from pkgs.util.latency_stats import LatencyStats
+from pkgs.util.motor_controller import MotorController
+from pkgs.util.program import (Program, ProgramError, ProgramRunner,
+                               load_program, parse_step)
+
+
+class FakePort:
+    """書き込んだコマンドを時刻とともに覚えるだけのポート"""
+    def __init__(self):
+        self.written = []
+
+    def write(self, command):
+        self.written.append((time.perf_counter(), command))
+
+    @property
+    def commands(self):
+        return [command for _, command in self.written]
+
+
+def program(*steps):
+    return Program([parse_step(step) for step in steps])
+
+
+def run(program, port=None, stats=None):
+    port = port or FakePort()
+    runner = ProgramRunner(program, MotorController(port), stats)
+    runner.start()
+    return runner, port
+
+
+def force_rows(value):
+    rows = np.zeros((1, 6))
+    rows[0, 2] = value
+    return rows
+
+
+def wait_for_condition(runner, timeout=5):
+    """wait_untilのステップで待ち始めるまで待つ"""
+    deadline = time.monotonic() + timeout
+    while runner._condition is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_repeated_waits_do_not_accumulate_delay():
+    stats = LatencyStats()
+    runner, port = run(program(
+        {'action': 'repeat', 'count': 5, 'steps': [
+            {'action': 'start', 'motor': 1},
+            {'action': 'wait', 'seconds': 0.02},
+            {'action': 'stop', 'motor': 1},
+            {'action': 'wait', 'seconds': 0.02}]}), stats=stats)
+    runner.join(5)
+    assert runner.finished
+    assert port.commands == [Commands.MOTOR_START1, Commands.MOTOR_STOP1] * 5
+    started = port.written[0][0]
+    # 予定時刻は前の予定時刻に足して決めるので、最後も0.18 s後になる
+    assert port.written[-1][0] - started == pytest.approx(0.18, abs=0.01)
+    assert [record.cycle for record in runner.records[:4]] == [1] * 4
+    assert stats.stage('program').count == 20
+
+
+def test_wait_until_follows_the_acquired_rows():
+    runner, port = run(program(
+        {'action': 'start', 'motor': 2},
+        {'action': 'wait_until', 'column': 'Force', 'above': 2.5},
+        {'action': 'stop', 'motor': 2}))
+    wait_for_condition(runner)
+    runner.process(force_rows(1.0), time.monotonic())
+    assert port.commands == [Commands.MOTOR_START2]
+    runner.process(force_rows(3.0), time.monotonic())
+    runner.join(5)
+    assert runner.finished
+    assert port.commands == [Commands.MOTOR_START2, Commands.MOTOR_STOP2]
+    assert runner.records[1].value == 3.0
+
+
+def test_stop_interrupts_and_stops_both_motors():
+    runner, port = run(program(
+        {'action': 'start', 'motor': 1},
+        {'action': 'wait', 'seconds': 30}))
+    time.sleep(0.05)
+    runner.stop()
+    assert not runner.finished
+    assert port.commands == [Commands.MOTOR_START1, Commands.MOTOR_STOP1,
+                             Commands.MOTOR_STOP2]
+
+
+def test_wait_until_timeout_is_an_error():
+    runner, port = run(program(
+        {'action': 'wait_until', 'column': 'Force', 'below': 0,
+         'timeout': 0.05}))
+    runner.join(5)
+    assert not runner.finished
+    [message] = runner.drain_errors()
+    assert '0.05' in message
+    assert port.commands == [Commands.MOTOR_STOP1, Commands.MOTOR_STOP2]
+
+
+def test_save_csv(tmp_path):
+    runner, _ = run(program({'action': 'start', 'motor': 1},
+                            {'action': 'wait', 'seconds': 0.01}))
+    runner.join(5)
+    path = tmp_path / 'run.program.csv'
+    runner.save_csv(path, lambda monotonic, near=None: monotonic)
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['Action'] for row in rows] == ['start 1', 'wait 0.01']
+    assert len(runner.drain()) == 2
+
+
+@pytest.mark.parametrize('step', [
+    [], {'action': 'jump'}, {'action': 'start', 'motor': 3},
+    {'action': 'start'}, {'action': 'wait', 'seconds': -1},
+    {'action': 'wait', 'seconds': 'x'},
+    {'action': 'wait_until', 'column': 'Time', 'above': 1},
+    {'action': 'wait_until', 'column': 'Force'},
+    {'action': 'wait_until', 'column': 'Force', 'above': 1, 'below': 0},
+    {'action': 'repeat', 'count': 0, 'steps': []},
+])
+def test_parse_step_rejects(step):
+    with pytest.raises(ProgramError):
+        parse_step(step)
+
+
+def test_load_program(tmp_path):
+    path = tmp_path / 'cycle.json'
+    path.write_text(json.dumps({'name': 'cycle', 'steps': [
+        {'action': 'repeat', 'count': 2, 'steps': [
+            {'action': 'start', 'motor': 1},
+            {'action': 'wait_until', 'column': 'Disp1', 'below': 0,
+             'timeout': 5}]}]}), encoding='utf-8')
+    loaded = load_program(path)
+    assert loaded.name == 'cycle'
+    [repeat] = loaded.steps
+    assert [step.describe() for step in repeat.steps] == \
+        ['start 1', 'wait_until Disp1 < 0.0']
+    path.write_text('{"name": "broken"}', encoding='utf-8')
+    with pytest.raises(ProgramError):
+        load_program(path)
@@ -0,0 +1,78 @@
+import time
+import types
+
+import pytest
+
+from pkgs.common.constants import RenderSettings
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """描画時間を決められる時計"""
+    from pkgs.gui import render_loop
+    clock = types.SimpleNamespace(now=0.0)
+    clock.perf_counter = lambda: clock.now
+    monkeypatch.setattr(render_loop, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def loop(qapp, clock):
+    from pkgs.gui.render_loop import RenderLoop
+    frames = []
+
+    def render():
+        frames.append(clock.now)
+        clock.now += loop.cost
+
+    loop = RenderLoop(render)
+    loop.cost = 0.001
+    loop.frames = frames
+    return loop
+
+
+def test_renders_only_when_dirty(loop):
+    loop.on_frame()
+    assert loop.frames == []
+    loop.mark_dirty()
+    loop.mark_dirty()
+    loop.on_frame()
+    loop.on_frame()
+    assert len(loop.frames) == 1
+
+
+def test_stop_renders_the_last_update(loop):
+    loop.start()
+    assert loop.timer.isActive()
+    loop.mark_dirty()
+    loop.stop()
+    assert not loop.timer.isActive()
+    assert len(loop.frames) == 1
+
+
+def test_slow_frames_lower_the_rate_down_to_min_fps(loop):
+    loop.start()
+    loop.cost = 1.0
+    for _ in range(20):
+        loop.mark_dirty()
+        loop.on_frame()
+    assert loop.fps == RenderSettings.MIN_FPS
+    assert loop.timer.interval() == loop.interval()
+    loop.cost = 0.0
+    for _ in range(50):
+        loop.mark_dirty()
+        loop.on_frame()
+    assert loop.fps == RenderSettings.TARGET_FPS
+    assert loop.timer.interval() == round(1000 / RenderSettings.TARGET_FPS)
+    loop.stop()
+
+
+def test_timer_drives_frames(qapp, loop):
+    loop.start()
+    loop.mark_dirty()
+    deadline = time.monotonic() + 2
+    while not loop.frames and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.001)
+    loop.stop()
+    assert len(loop.frames) == 1
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from pkgs.common.constants import AlignmentSettings, RangeValues
+from pkgs.util.plot_array_handler import PlotArrayHandler
+from pkgs.util.sample_buffer import RingBuffer
+
+
+def numbered_rows(start, stop, period=AlignmentSettings.SAMPLE_PERIOD):
+    """時刻がperiodごとに進み、他の列に行番号を入れた行"""
+    index = np.arange(start, stop, dtype=float)
+    rows = np.repeat(index[:, None], 6, axis=1)
+    rows[:, 0] = index * period
+    return rows
+
+
+@pytest.mark.parametrize('sizes', [
+    [3, 4, 5], [1] * 12, [7, 7], [25], [10, 0, 2]])
+def test_ring_buffer_keeps_the_latest_rows_in_order(sizes):
+    buffer = RingBuffer(capacity=10)
+    start = 0
+    for size in sizes:
+        buffer.extend(numbered_rows(start, start + size))
+        start += size
+    expected = numbered_rows(max(start - 10, 0), start)
+    assert len(buffer) == len(expected)
+    np.testing.assert_array_equal(buffer.rows(), expected)
+    np.testing.assert_array_equal(buffer.columns(), expected.T)
+
+
+def test_ring_buffer_clear():
+    buffer = RingBuffer(capacity=4)
+    buffer.extend(numbered_rows(0, 6))
+    buffer.clear()
+    assert len(buffer) == 0
+    buffer.extend(numbered_rows(6, 7))
+    np.testing.assert_array_equal(buffer.rows(), numbered_rows(6, 7))
+
+
+def test_scroll_capacity_holds_the_window_at_the_maximum_rate():
+    rows = RangeValues.SCROLL_WINDOW * RangeValues.SCROLL_MAX_RATE
+    assert RangeValues.SCROLL_CAPACITY >= rows
+
+
+def test_scroll_mode_shows_a_copy_of_the_latest_window():
+    handler = PlotArrayHandler()
+    window_rows = round(RangeValues.SCROLL_WINDOW
+                        / AlignmentSettings.SAMPLE_PERIOD)
+    handler.update_arrays(numbered_rows(0, 2 * window_rows))
+    handler.set_scroll_mode(True)  # 保存用配列の行から始める
+    columns = handler.plot_columns()
+    t = columns[0]
+    assert t[-1] - t[1] <= RangeValues.SCROLL_WINDOW < t[-1] - t[0]
+    before = columns.copy()
+    more = numbered_rows(2 * window_rows, 3 * window_rows)
+    handler.update_arrays(more)
+    latest = handler.update_plts(more)
+    np.testing.assert_array_equal(columns, before)  # 次の追加で変わらない
+    assert latest[0, -1] == more[-1, 0]
+    handler.set_scroll_mode(False)
+    assert len(handler.plot_columns()[0]) == 3 * window_rows
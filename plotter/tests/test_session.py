@@ -0,0 +1,150 @@
+import glob
+import json
+import types
+
+import numpy as np
+import pytest
+
+from pkgs.common.constants import (JournalSettings, MotorSettings,
+                                   ProgramSettings, SaveSettings,
+                                   StatsSettings)
+from pkgs.common.acquisition_session import AcquisitionSession
+from pkgs.common.headless_executor import HeadlessExecutor
+from pkgs.util.csv_writer import format_header, format_rows
+from pkgs.util.journal import find_unrecovered, is_closed
+from pkgs.util.motor_writer import MotorCommandWriter
+from pkgs.util.plot_array_handler import PlotArrayHandler
+from pkgs.util.program import Program, parse_step
+from pkgs.util.replay import ReplaySource
+from pkgs.util.session_archive import SessionArchiveReader
+
+
+def recorded_rows(n, seed=0):
+    """デバイスの行を解析した、保存済みのCSVと同じ値の行"""
+    rng = np.random.default_rng(seed)
+    esp = [f"{d1:.2f},{d2:.2f},{t}" for d1, d2, t in zip(
+        rng.uniform(-5, 5, n), rng.uniform(-5, 5, n),
+        np.arange(n) * 10_000)]
+    rp = [f"{a},{b},{c}" for a, b, c in rng.integers(0, 4096, (n, 3))]
+    data, _ = PlotArrayHandler.process_batch(esp, rp)
+    return data  # micros()が0から始まるので時刻はそのまま計測開始から
+
+
+@pytest.fixture
+def source_csv(out_dir):
+    rows = recorded_rows(2000)
+    path = out_dir.parent / 'source.csv'
+    path.write_text(format_header() + format_rows(rows))
+    return str(path), rows
+
+
+def replay(path, file_name, writer=False, **kwargs):
+    """記録を最高速で再生して計測し、記録した行数を返す
+
+    writerが真なら、モータのコマンドを書き込みスレッドで送る。
+    """
+    source = ReplaySource.from_file(path, speed=None)
+    sm1, sm2 = source.managers()
+    executor = HeadlessExecutor(sm1, sm2, out=lambda line: None, **kwargs)
+    if writer:
+        executor.mc.writer = MotorCommandWriter(sm1)
+        executor.mc.writer.start()
+    try:
+        return executor.run(file_name, duration=30,
+                            should_stop=lambda: source.finished)
+    finally:
+        if writer:
+            executor.mc.writer.stop()
+
+
+def saved_rows(path):
+    return np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+
+
+def test_replay_is_recorded_exactly(source_csv):
+    path, rows = source_csv
+    assert replay(path, 'run') == len(rows)
+    out = SaveSettings.OUT_DIR
+    np.testing.assert_array_equal(saved_rows(f"{out}/run.csv"), rows)
+    archive = SessionArchiveReader(f"{out}/run{SaveSettings.ARCHIVE_SUFFIX}")
+    np.testing.assert_array_equal(archive.read(), rows)
+    assert archive.metadata['headless']
+    [journal] = glob.glob(f"{out}/run.*{JournalSettings.SUFFIX}")
+    assert is_closed(journal)
+
+
+def test_restarting_keeps_the_previous_run(source_csv):
+    """同じファイル名でやり直しても前の計測のファイルは消えない"""
+    path, rows = source_csv
+    replay(path, 'run')
+    out = SaveSettings.OUT_DIR
+    first = saved_rows(f"{out}/run.csv")
+    replay(path, 'run', max_rows=100)
+    journals = glob.glob(f"{out}/run.*{JournalSettings.SUFFIX}")
+    assert len(set(journals)) == 2
+    assert all(is_closed(journal) for journal in journals)
+    assert find_unrecovered('run') == []
+    np.testing.assert_array_equal(first, rows)
+    assert len(saved_rows(f"{out}/run.csv")) == 100
+    assert not glob.glob(f"{out}/*{SaveSettings.PARTIAL_SUFFIX}.*")
+
+
+def test_each_run_keeps_its_command_log(source_csv):
+    """コマンドの記録は計測ごとの名前で書き、保存先の名前にコピーする"""
+    path, _ = source_csv
+    out = SaveSettings.OUT_DIR
+    suffix = MotorSettings.EVENT_SUFFIX
+    replay(path, 'run', writer=True)
+    replay(path, 'run', writer=True, max_rows=100)
+    assert len(glob.glob(f"{out}/run.*{suffix}")) == 2
+    assert glob.glob(f"{out}/run{suffix}")
+
+
+def test_each_run_keeps_its_stats(source_csv):
+    path, rows = source_csv
+    replay(path, 'run')
+    replay(path, 'run', max_rows=100)
+    dumped = [json.loads(open(name, encoding='utf-8').read())['rows']
+              for name in glob.glob(f"{SaveSettings.OUT_DIR}/run.*"
+                                    f"{StatsSettings.SUFFIX}")]
+    assert sorted(dumped) == [100, len(rows)]
+
+
+def test_each_run_keeps_its_program_log(source_csv):
+    path, _ = source_csv
+    program = Program([parse_step({'action': 'start', 'motor': 1}),
+                       parse_step({'action': 'wait', 'seconds': 0.01})])
+    replay(path, 'run', program=program)
+    replay(path, 'run', program=program)
+    logs = glob.glob(f"{SaveSettings.OUT_DIR}/run.*{ProgramSettings.SUFFIX}")
+    assert len(logs) == 2
+
+
+def test_capped_ingest_pairs_the_reference_with_the_kept_row():
+    """上限で切り詰めた行ブロックの受信時刻を、残した最後の行の基準にする"""
+    rows = recorded_rows(10)
+    batches = [(100.0, rows[:4]), (200.0, rows[4:])]
+    worker = types.SimpleNamespace(
+        drain_errors=lambda: [], drain=lambda: batches,
+        aligner=types.SimpleNamespace(dropped_count=0))
+    session = AcquisitionSession(None, None, None, PlotArrayHandler(),
+                                 max_rows=3)
+    session.ingest(worker)
+    assert session.events.received == [100.0]
+    assert session.events.samples == [rows[2, 0] - rows[0, 0]]
+
+
+def test_stops_at_max_rows(source_csv):
+    path, rows = source_csv
+    assert replay(path, 'capped', max_rows=500) == 500
+    np.testing.assert_array_equal(
+        saved_rows(f"{SaveSettings.OUT_DIR}/capped.csv"), rows[:500])
+
+
+def test_spool_and_compact_record_the_same_rows(source_csv):
+    path, rows = source_csv
+    replay(path, 'spool', use_spool=True)
+    replay(path, 'compact', use_compact=True)
+    out = SaveSettings.OUT_DIR
+    np.testing.assert_array_equal(saved_rows(f"{out}/spool.csv"), rows)
+    np.testing.assert_array_equal(saved_rows(f"{out}/compact.csv"), rows)
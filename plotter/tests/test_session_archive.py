@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from pkgs.common.constants import DataProperties
+from pkgs.util.csv_writer import format_header, format_rows
+from pkgs.util.session_archive import (SessionArchiveError,
+                                       SessionArchiveReader,
+                                       SessionArchiveWriter, convert_csv,
+                                       saved_csvs)
+
+
+def session_rows(n, seed=0):
+    """0.01 sごとの計測値らしい行"""
+    rng = np.random.default_rng(seed)
+    rows = np.empty((n, len(DataProperties.list_properties())))
+    rows[:, 0] = np.arange(n) * 0.01
+    rows[:, 1:] = rng.normal(size=(n, rows.shape[1] - 1))
+    return rows
+
+
+@pytest.fixture
+def archive(tmp_path):
+    rows = session_rows(1000)
+    path = tmp_path / 'run.kes'
+    with SessionArchiveWriter(path, {'project': 'run'}) as writer:
+        writer.write(rows, chunk_rows=100)
+    return path, rows
+
+
+def test_round_trip_is_exact(archive):
+    path, rows = archive
+    reader = SessionArchiveReader(path)
+    assert len(reader) == len(rows)
+    assert reader.columns == DataProperties.list_properties()
+    assert reader.metadata['project'] == 'run'
+    np.testing.assert_array_equal(reader.read(), rows)
+
+
+def test_time_window_reads_only_overlapping_chunks(archive, monkeypatch):
+    path, rows = archive
+    reader = SessionArchiveReader(path)
+    assert reader.time_range == (0.0, rows[-1, 0])
+    read = []
+    original = SessionArchiveReader._read_chunk
+    monkeypatch.setattr(
+        SessionArchiveReader, '_read_chunk',
+        lambda self, f, chunk: read.append(chunk) or original(self, f, chunk))
+    window = reader.read(2.5, 3.5)
+    t = rows[:, 0]
+    np.testing.assert_array_equal(window, rows[(t >= 2.5) & (t <= 3.5)])
+    assert len(read) == 2  # 2.00-2.99と3.00-3.99のチャンクだけ
+
+
+def test_open_ended_windows(archive):
+    path, rows = archive
+    reader = SessionArchiveReader(path)
+    np.testing.assert_array_equal(reader.read(t_end=0.5), rows[:51])
+    np.testing.assert_array_equal(reader.read(t_start=9.9), rows[990:])
+    assert reader.read(20, 30).shape == (0, rows.shape[1])
+
+
+def test_archive_without_index_is_rescanned(tmp_path):
+    """書き込み中に止まったアーカイブも読める"""
+    rows = session_rows(500)
+    path = tmp_path / 'crashed.kes'
+    writer = SessionArchiveWriter(path)
+    writer.write(rows, chunk_rows=100)
+    writer._file.flush()
+    reader = SessionArchiveReader(path)
+    writer.close()
+    assert len(reader.chunks) == 5
+    np.testing.assert_array_equal(reader.read(1.0, 1.99), rows[100:200])
+
+
+def test_snapshot_while_writing(tmp_path):
+    rows = session_rows(300)
+    path, copy = tmp_path / 'live.kes', tmp_path / 'copy.kes'
+    with SessionArchiveWriter(path) as writer:
+        writer.write(rows[:200], chunk_rows=100)
+        writer.snapshot(copy)
+        writer.write(rows[200:], chunk_rows=100)
+    np.testing.assert_array_equal(SessionArchiveReader(copy).read(),
+                                  rows[:200])
+    np.testing.assert_array_equal(SessionArchiveReader(path).read(), rows)
+
+
+def test_nan_rows_are_kept(tmp_path):
+    rows = session_rows(10)
+    rows[3] = np.nan
+    path = tmp_path / 'nan.kes'
+    with SessionArchiveWriter(path) as writer:
+        writer.write(rows)
+    np.testing.assert_array_equal(SessionArchiveReader(path).read(), rows)
+
+
+def test_convert_csv_matches_rows(tmp_path):
+    rows = session_rows(250)
+    csv_path = tmp_path / 'old.csv'
+    csv_path.write_text(format_header() + format_rows(rows))
+    archive_path = convert_csv(str(csv_path), chunk_rows=100)
+    reader = SessionArchiveReader(archive_path)
+    assert len(reader.chunks) == 3
+    np.testing.assert_array_equal(reader.read(), rows)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.kes'
+    path.write_bytes(b'not an archive')
+    with pytest.raises(SessionArchiveError):
+        SessionArchiveReader(path)
+
+
+def test_saved_csvs_skip_partial_and_log_files(tmp_path):
+    for name in ('run.csv', 'run.20260101-000000.partial.csv',
+                 'run.events.csv', 'run.20260101-000000.events.csv',
+                 'run.20260101-000000.program.csv', 'old.csv'):
+        (tmp_path / name).write_text('')
+    assert saved_csvs(str(tmp_path)) == [str(tmp_path / 'old.csv'),
+                                         str(tmp_path / 'run.csv')]
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from pkgs.common.constants import ArithmeticConstants
+from pkgs.util.plot_array_handler import PlotArrayHandler
+from pkgs.util.sample_buffer import SampleBuffer
+from pkgs.util.spool_buffer import SpoolBuffer, load_spool
+
+
+def test_spool_grows_and_matches_sample_buffer(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = rng.normal(size=(5000, 6))
+    spool = SpoolBuffer(str(tmp_path / 'run.spool'), capacity=16)
+    memory = SampleBuffer(capacity=16)
+    for start in range(0, len(rows), 333):
+        spool.extend(rows[start:start + 333])
+        memory.extend(rows[start:start + 333])
+    assert len(spool) == len(memory) == len(rows)
+    assert spool.capacity >= len(rows)
+    np.testing.assert_array_equal(spool.rows(), rows)
+    np.testing.assert_array_equal(spool.columns(), memory.columns())
+    np.testing.assert_array_equal(spool.rows(100, 200), rows[100:200])
+
+
+def test_load_spool_reads_up_to_the_last_sync(tmp_path):
+    path = str(tmp_path / 'run.spool')
+    rows = np.arange(60, dtype=float).reshape(10, 6)
+    spool = SpoolBuffer(path, capacity=4)
+    spool.extend(rows[:6])
+    spool.sync()
+    spool.extend(rows[6:])  # 同期する前に異常終了したとする
+    np.testing.assert_array_equal(load_spool(path), rows[:6])
+    spool.sync()
+    np.testing.assert_array_equal(load_spool(path), rows)
+
+
+def test_views_survive_growing(tmp_path):
+    spool = SpoolBuffer(str(tmp_path / 'run.spool'), capacity=4)
+    spool.extend(np.ones((4, 6)))
+    view = spool.rows()
+    spool.extend(np.zeros((100, 6)))
+    np.testing.assert_array_equal(view, np.ones((4, 6)))
+
+
+def test_unwrap_time_joins_micros_wraparound():
+    handler = PlotArrayHandler()
+    wrap = 2**32 * ArithmeticConstants.MICRO
+    data = np.zeros((4, 6))
+    data[:, 0] = [wrap - 0.02, wrap - 0.01, 0.0, 0.01]
+    handler.unwrap_time(data[:2])
+    handler.unwrap_time(data[2:])
+    assert np.all(np.diff(data[:, 0]) > 0)
+    assert data[3, 0] == pytest.approx(wrap + 0.01)
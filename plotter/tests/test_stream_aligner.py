@@ -0,0 +1,71 @@
+from pkgs.util.stream_aligner import ESP32, RP2040, StreamAligner
+
+PERIOD = 0.01
+
+
+def esp_line(i):
+    return f"{i * 0.01:.2f},0.00,{i * 10_000}"
+
+
+def rp_line(i):
+    return f"{i},{i},{i}"
+
+
+def test_pairs_rows_read_together():
+    aligner = StreamAligner()
+    for i in range(20):
+        now = i * PERIOD
+        aligner.push(ESP32, [esp_line(i)], now)
+        aligner.push(RP2040, [rp_line(i)], now + 0.001)
+    esp, rp = aligner.pop_pairs(20 * PERIOD)
+    assert esp == [esp_line(i) for i in range(20)]
+    assert rp == [rp_line(i) for i in range(20)]
+    assert aligner.dropped_count == 0
+
+
+def test_resynchronises_after_a_lost_esp32_row():
+    """micros()の飛びから欠落を見つけ、対応するRP2040の行を捨てる"""
+    aligner = StreamAligner()
+    for i in range(10):
+        now = i * PERIOD
+        if i != 4:
+            aligner.push(ESP32, [esp_line(i)], now)
+        aligner.push(RP2040, [rp_line(i)], now)
+    esp, rp = aligner.pop_pairs(10 * PERIOD)
+    assert esp == [esp_line(i) for i in range(10) if i != 4]
+    assert rp == [rp_line(i) for i in range(10) if i != 4]
+    assert aligner.skipped == 1
+    assert aligner.dropped == [0, 1]
+
+
+def test_drops_duplicate_esp32_rows():
+    aligner = StreamAligner()
+    aligner.push(ESP32, [esp_line(0), esp_line(1), esp_line(1)], 0.02)
+    aligner.push(RP2040, [rp_line(0), rp_line(1)], 0.02)
+    esp, rp = aligner.pop_pairs(0.02)
+    assert esp == [esp_line(0), esp_line(1)]
+    assert rp == [rp_line(0), rp_line(1)]
+    assert aligner.duplicates == 1
+
+
+def test_gives_up_on_rows_without_a_partner():
+    aligner = StreamAligner(max_wait=0.1)
+    aligner.push(ESP32, [esp_line(0)], 0.0)
+    assert aligner.pop_pairs(0.05) == ([], [])
+    assert aligner.pop_pairs(0.2) == ([], [])
+    assert aligner.dropped == [1, 0]
+
+
+def test_batched_reads_pair_like_single_reads():
+    """複数行をまとめて読んでも1行ずつ読んだときと同じ組になる"""
+    aligner = StreamAligner()
+    lines = list(range(30))
+    for start in range(0, 30, 10):
+        now = (start + 9) * PERIOD
+        aligner.push(ESP32, [esp_line(i) for i in lines[start:start + 10]],
+                     now)
+        aligner.push(RP2040, [rp_line(i) for i in lines[start:start + 10]],
+                     now + 0.002)
+    esp, rp = aligner.pop_pairs(30 * PERIOD)
+    assert esp == [esp_line(i) for i in lines]
+    assert rp == [rp_line(i) for i in lines]
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+from pkgs.common.constants import Commands
+from pkgs.util.latency_stats import LatencyStats
+from pkgs.util.motor_controller import MotorController
+from pkgs.util.motor_writer import MotorCommandWriter
+from pkgs.util.trigger import (AboveTrigger, DropTrigger, Trigger,
+                               TriggerEngine, TriggerError, parse_trigger)
+
+FORCE = 2  # Forceの列
+
+
+class FakePort:
+    """書き込んだコマンドを覚えるだけのポート"""
+    def __init__(self):
+        self.written = []
+
+    def write(self, command):
+        self.written.append(command)
+
+
+def force_rows(values):
+    rows = np.zeros((len(values), 6))
+    rows[:, 0] = np.arange(len(values)) * 0.01
+    rows[:, FORCE] = values
+    return rows
+
+
+def first_hit_row_by_row(trigger, values):
+    trigger.reset()
+    for i, row in enumerate(force_rows(values)):
+        if trigger.check(row[np.newaxis]) is not None:
+            return i
+    return None
+
+
+def first_hit_in_blocks(trigger, values, size):
+    trigger.reset()
+    rows = force_rows(values)
+    for start in range(0, len(rows), size):
+        index = trigger.check(rows[start:start + size])
+        if index is not None:
+            return start + index
+    return None
+
+
+# 上がってから30%以上下がる (破断) 荷重
+BREAK = np.concatenate([np.linspace(0, 3, 200), np.linspace(3, 1, 100)])
+
+
+@pytest.mark.parametrize('spec', ['above:Force:2.5', 'drop:Force:30',
+                                  'drop:Force:99'])
+@pytest.mark.parametrize('size', [1, 7, 64, 1000])
+def test_blocks_fire_on_the_same_row_as_row_by_row(spec, size):
+    trigger = parse_trigger(spec)
+    assert first_hit_in_blocks(trigger, BREAK, size) == \
+        first_hit_row_by_row(trigger, BREAK)
+
+
+def test_drop_fires_at_the_expected_row():
+    trigger = parse_trigger('drop:Force:30')
+    hit = first_hit_row_by_row(trigger, BREAK)
+    assert BREAK[hit] <= 0.7 * 3 < BREAK[hit - 1]
+    assert parse_trigger('drop:Force:99').check(force_rows(BREAK)) is None
+
+
+def test_drop_ignores_noise_below_min_peak():
+    trigger = DropTrigger('drop', 'Force', 50, min_peak=1.0)
+    noise = np.tile([0.5, 0.1], 50)
+    assert trigger.check(force_rows(noise)) is None
+
+
+def test_engine_fires_once_and_stops_the_motors():
+    port = FakePort()
+    stats = LatencyStats()
+    engine = TriggerEngine([parse_trigger('above:Force:1:2')],
+                           MotorController(port), stats)
+    rows = force_rows([0.5, 1.5, 2.0])
+    engine.process(rows, received_at=0.0)
+    engine.process(rows, received_at=0.0)
+    assert port.written == [Commands.MOTOR_STOP2]
+    [event] = engine.drain()
+    assert event.value == 1.5
+    assert event.summary()['device_clock'] == 0.01
+    assert event.command_latency is not None
+    assert set(stats.stages) == {'trigger', 'trigger_command'}
+    assert engine.drain() == []
+
+
+def test_engine_records_command_latency_once_written():
+    port = FakePort()
+    writer = MotorCommandWriter(port)
+    stats = LatencyStats()
+    engine = TriggerEngine([parse_trigger('above:Force:1')],
+                           MotorController(port, writer), stats)
+    engine.process(force_rows([2.0]), received_at=0.0)
+    [event] = engine.drain()  # 書き込みスレッドはまだ動いていない
+    assert not event.settled
+    assert 'trigger_command' not in stats.stages
+    writer.start()
+    try:
+        assert writer.flush()
+    finally:
+        writer.stop()
+    assert engine.drain() == []
+    assert event.settled
+    assert port.written == [Commands.MOTOR_STOP1, Commands.MOTOR_STOP2]
+    assert 'trigger_command' in stats.stages
+
+
+def test_reset_rearms_and_discards_the_previous_run():
+    port = FakePort()
+    stats = LatencyStats()
+    engine = TriggerEngine([parse_trigger('above:Force:1')],
+                           MotorController(port), stats)
+    engine.process(force_rows([2.0]), received_at=0.0)
+    engine.reset()
+    assert engine.drain() == [] and engine.events == []
+    assert 'trigger_command' not in stats.stages
+    engine.process(force_rows([2.0]), received_at=0.0)
+    assert len(engine.drain()) == 1
+    assert len(port.written) == 4
+
+
+@pytest.mark.parametrize('spec', [
+    'above:Force', 'above:Force:x', 'above:Time:1', 'above:Nothing:1',
+    'above:Force:1:3', 'above:Force:1:', 'drop:Force:100', 'below:Force:1'])
+def test_parse_trigger_rejects(spec):
+    with pytest.raises(TriggerError):
+        parse_trigger(spec)
+
+
+def test_parse_trigger():
+    trigger = parse_trigger('above:Disp1:5:1')
+    assert isinstance(trigger, AboveTrigger)
+    assert (trigger.column, trigger.threshold, trigger.motors) == \
+        ('Disp1', 5.0, (1,))
+
+
+def test_trigger_without_check_cannot_be_created():
+    class NoCheck(Trigger):
+        pass
+
+    with pytest.raises(TypeError):
+        NoCheck('none', 'Force')